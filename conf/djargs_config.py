@@ -14,7 +14,7 @@
 #   depends : list, parameters which must *all* also be specified with this one, optional
 #   exclusive_of : lits, parameters *any* of which must not also be specified, optional
 #   help : string, text used in extended help REQUIRED
-#   rules : list of strings, each of which will be evaluated as ("parameter value" rule), optional. See below.
+#   rules : list of strings, each a comparison of the parameter value with a number or another parameter, optional. See below.
 
 
 #   the simplest parameter takes this form:
@@ -30,13 +30,14 @@
 # default regex for date type parameters. setting "regex" field overrides for an individual date/time parameter
 # combinations of "yyyy-mm-dd", "dd/mm/yyy" hh:mm", "9am", "9pm" (space between date and time)
 # "last friday 12am", "11am tomorrow", "10:30 next weds" etc
+# matching values are converted by djdate, which reads "nn/nn/yyyy" as dd/mm/yyyy
 regex_date = "(((20[1-9][0-9](-|/)[01][0-9](-|/)[0-3][0-9]|[0-3][0-9]/[01][0-9]/20[1-9][0-9]) ([0-2]?[0-9]:[0-5][0-9]|[0-2]?[0-9]:[0-5][0-9]|[01]?[1-2][ap]m|[1-9][ap]m|1[0-2][ap]m|[0-2]?[0-9]:[0-5][0-9]))|(([0-2]?[0-9]:[0-5][0-9]|[0-2]?[0-9]:[0-5][0-9]|[01]?[1-2][ap]m|[1-9][ap]m|1[0-2][ap]m|[0-2]?[0-9]:[0-5][0-9]) (20[1-9][0-9](-|/)[01][0-9](-|/)[0-3][0-9]|[0-3][0-9]/[01][0-9]/20[1-9][0-9]))|(20[1-9][0-9](-|/)[01][0-9](-|/)[0-3][0-9]|[0-3][0-9]/[01][0-9]/20[1-9][0-9])|[0-2]?[0-9]:[0-5][0-9]|[01]?[1-2][ap]m|[1-9][ap]m|1[0-2][ap]m|[0-2]?[0-9]:[0-5][0-9])|(([0-2]?[0-9]:[0-5][0-9]|[01]?[1-2][ap]m|[1-9][ap]m|1[0-2][ap]m|[0-2]?[0-9]:[0-5][0-9])?(( )?next |( )?last |( )?Next |( )?Last )?(monday( )?|Monday( )?|mon( )?|Mon( )?|tuesday( )?|Tuesday( )?|tue( )?|tues( )?|Tue( )?|Tues( )?|wednesday( )?|Wednesday( )?|wed( )?|Wed( )?|thursday( )?|Thursday( )?|thu( )?|thur( )?|Thu( )?|Thur( )?|friday( )?|Friday( )?|fri( )?|Fri( )?|saturday( )?|Saturday( )?|sat( )?|Sat( )?|sunday( )?|Sunday( )?|sun( )?|Sun( )?|week( )?)|([0-2]?[0-9]:[0-5][0-9]|[01]?[1-2][ap]m|[1-9][ap]m|1[0-2][ap]m|[0-2]?[0-9]:[0-5][0-9])?( ?tomorrow| ?Tomorrow| ?today| ?Today)( )?)([0-2]?[0-9]:[0-5][0-9]|[01]?[1-2][ap]m|[1-9][ap]m|1[0-2][ap]m|[0-2]?[0-9]:[0-5][0-9])?"
 
-# IMPORTANT:    enabling parameter rules is a potential security issue
-#               rules make us of eval(), use only if you can trust this config file
-#               "rules": ['rm -rf ~']" or similar is not desirable!
+# rules:        an operator, one of < <= > >= == !=, and a number or another parameter
+#               compiled once into comparisons when djargs loads this file, no eval() is used
 #               use: "< -a" would indicate the value of parameter should be less than the value of -a
-#               rules can only be applied to parameters of type int, float or date (which is confirmed before rules use eval() )
+#               use: "> 5" would indicate the value of parameter should be more than 5
+#               rules can only be applied to parameters of type int, float or date, any other rule can't be processed
 #               for date/time rules to work you must enable date_convert as below
 enable_rules = True
 
@@ -50,7 +51,7 @@ parameters={
         "description": "hostname",
         "regex": "^(dc1|dc2)[a-zA-Z0-9\-]*", #\d{2,}$
         "type": "string",
-        "required_unless": ['-H'],
+        "required_unless": ['-H', 'verify', '--select', '-G'],
         "delimiter": [',', ' '],
         "help": "a valid hostname which exists in the Nagios instance"
     },
@@ -59,9 +60,23 @@ parameters={
         "regex": "[a-zA-Z\-_]+$",
         "type": "string",
         "delimiter": [',', ' '],
-        "required_unless": ['-h'],
+        "required_unless": ['-h', 'verify', '--select', '-G'],
         "help": "a valid hostgroup which exists in the Nagios instance"
     },
+    "--select": {
+        "description": "host selection",
+        "type": "string",
+        "unique": True,
+        "help": "hosts selected by an expression of @hostgroups, globs with numeric [ranges] and /regexes/, combined with | or , (union), & (intersection) and - (exclusion), :odd and :even, eg '@web - dc2*:odd'"
+    },
+    "-G": {
+        "description": "servicegroup",
+        "regex": "[a-zA-Z0-9\-_]+$",
+        "type": "string",
+        "delimiter": [',', ' '],
+        "exclusive_of": ['-h', '-H', '-s', '--select', '--failing', '--dry-run', 'undown'],
+        "help": "a servicegroup whose services, exactly, are the targets"
+    },
     "-s": {
         "description": "service description",
         "regex": "[a-zA-Z0-9\-_]+$",
@@ -75,15 +90,15 @@ parameters={
         "default": ['Now'],
         "unique": True,
         "rules": ['< -e'],
-        "exclusive_of": ["ack", "dn", "en", "dc", "ec"],
+        "exclusive_of": ["ack", "dn", "en", "dc", "ec", "undown"],
         "help": "for adding a downtime, the start date/time of the entry"
     },
     "-e": {
         "description": "end date/time",
         "type": "date",
         "unique": True,
-        "exclusive_of": ['-d', '-D', "ack", "dn", "en", "dc", "ec"],
-        "required_unless": ['-D', '-d', "ack", "dn", "en", "dc", "ec"],
+        "exclusive_of": ['-d', '-D', "ack", "dn", "en", "dc", "ec", "undown"],
+        "required_unless": ['-D', '-d', "ack", "dn", "en", "dc", "ec", "verify", "undown"],
         "rules": ['> -b'],
         "help": "for adding a downtime, the end date/time of the entry"
     },
@@ -91,8 +106,8 @@ parameters={
         "description": "duration minutes",
         "type": "float",
         "unique": True,
-        "exclusive_of": ['-e', "ack", "dn", "en", "dc", "ec"],
-        "required_unless": ['-e', '-D', "ack", "dn", "en", "dc", "ec"],
+        "exclusive_of": ['-e', "ack", "dn", "en", "dc", "ec", "undown"],
+        "required_unless": ['-e', '-D', "ack", "dn", "en", "dc", "ec", "verify", "undown"],
         "rules": ['> 5'],
         "help": "for adding a downtime, the duration of the entry in minutes"
     },
@@ -100,8 +115,8 @@ parameters={
         "description": "duration hours",
         "type": "float",
         "unique": True,
-        "exclusive_of": ['-e', 'ack', 'dn', 'en', 'dc', 'ec'],
-        "required_unless": ['-e', '-d', "ack", "dn", "en", "dc", "ec"],
+        "exclusive_of": ['-e', 'ack', 'dn', 'en', 'dc', 'ec', 'undown'],
+        "required_unless": ['-e', '-d', "ack", "dn", "en", "dc", "ec", "verify", "undown"],
         "rules": ['> 0', '< 99'],
         "help": "for adding a downtime, the duration of the entry in hours"
     },
@@ -109,51 +124,107 @@ parameters={
         "description": "comment",
         "type": "string",
         "unique": True,
-        "required_unless": ["dn", "en", "dc", "ec"],
+        "required_unless": ["dn", "en", "dc", "ec", "verify", "undown"],
         "exclusive_of": ["dn", "en", "dc", "ec"],
-        "help": "a comment is required when adding downtime entries or acknowledgements"
+        "help": "a comment is required when adding downtime entries or acknowledgements, when removing downtime only entries whose comment contains it are removed"
     },
     "-q": {
         "description": "quiet",
         "unique": True,
         "help": "set output to minimum"
     },
+    "-w": {
+        "description": "concurrency",
+        "type": "int",
+        "unique": True,
+        "rules": ['> 0'],
+        "help": "maximum number of livestatus queries to run at once"
+    },
+    "--stats": {
+        "description": "statistics",
+        "unique": True,
+        "help": "print livestatus query, command and confirmation counts and latencies when done"
+    },
+    "--failing": {
+        "description": "failing",
+        "unique": True,
+        "depends": ["ack", "-H"],
+        "exclusive_of": ["-h", "--dry-run", "--select"],
+        "help": "acknowledge every unacknowledged problem in the hostgroups given by -H, for the services given by -s or for the hosts"
+    },
+    "--dry-run": {
+        "description": "dry run",
+        "unique": True,
+        "exclusive_of": ["--defer", "undown"],
+        "help": "print how many targets exist, are already in the requested state or have problems, then exit without changing anything"
+    },
+    "--defer": {
+        "description": "defer confirmation",
+        "unique": True,
+        "exclusive_of": ["undown"],
+        "help": "submit the commands and record them in the journal without waiting for them to take effect, check them later with verify"
+    },
+    "verify": {
+        "description": "verify mode",
+        "unique": True,
+        "exclusive_of": ["down", "ack", "dn", "en", "dc", "ec", "-h", "-H", "-s", "-c", "--defer", "--dry-run", "undown", "--select", "-G"],
+        "help": "check every command recorded in the journal by --defer and report those which haven't taken effect"
+    },
     "down": {
         "description": "down mode",
         "unique": True,
-        "exclusive_of": ["ack", "dn", "en", "dc", "ec"],
+        "exclusive_of": ["ack", "dn", "en", "dc", "ec", "verify", "undown"],
         "help": "set mode to downtime"
     },
+    "undown": {
+        "description": "remove downtime mode",
+        "unique": True,
+        "exclusive_of": ["down", "ack", "dn", "en", "dc", "ec", "verify"],
+        "help": "set mode to remove downtime, every downtime of the hosts or services, or those matching -a and -c"
+    },
     "ack": {
         "description": "ack mode",
         "unique": True,
-        "exclusive_of": ["down", "dn", "en", "dc", "ec"],
+        "exclusive_of": ["down", "dn", "en", "dc", "ec", "verify", "undown"],
         "help": "set mode to acknowledge"
     },
     "dn": {
         "description": "disable notifications mode",
         "unique": True,
-        "exclusive_of": ["down", "ack", "en", "dc", "ec"],
+        "exclusive_of": ["down", "ack", "en", "dc", "ec", "verify", "undown"],
         "help": "set mode to acknowledge"
     },
     "en": {
         "description": "enable notifications mode",
         "unique": True,
-        "exclusive_of": ["down", "dn", "ack", "dc", "ec"],
+        "exclusive_of": ["down", "dn", "ack", "dc", "ec", "verify", "undown"],
         "help": "set mode to acknowledge"
     },
     "dc": {
         "description": "disable checks mode",
         "unique": True,
-        "exclusive_of": ["down", "dn", "en", "ack", "ec"],
+        "exclusive_of": ["down", "dn", "en", "ack", "ec", "verify", "undown"],
         "help": "set mode to acknowledge"
     },
     "ec": {
         "description": "enable checks mode",
         "unique": True,
-        "exclusive_of": ["down", "dn", "en", "dc", "ack"],
+        "exclusive_of": ["down", "dn", "en", "dc", "ack", "verify", "undown"],
         "help": "set mode to acknowledge"
     },
+    "-a": {
+        "description": "author",
+        "type": "string",
+        "unique": True,
+        "depends": ["undown"],
+        "help": "for removing downtime, only remove entries added by this user"
+    },
+    "--comment-regex": {
+        "description": "comment regex",
+        "unique": True,
+        "depends": ["undown", "-c"],
+        "help": "for removing downtime, match -c as a regex rather than as text the comment contains"
+    },
     "-k": {
         "description": "sticky",
         "unique": True,
@@ -0,0 +1,4 @@
+"""config required by djinventory"""
+
+inventory_path='/var/tmp/pyngctl_inventory.sqlite'  # local inventory cache, set to '' to disable
+inventory_ttl=300                                   # seconds the cache is trusted before checking program_start
@@ -5,3 +5,17 @@ current_user = getlogin()
 
 env_livestatus='/var/spool/nagios/cmd/live'         # live status socket for LQL queries
 env_cmdpipe='/var/log/nagios/rw/nagios.cmd'         # nagios command pipe
+command_transport='pipe'                            # 'pipe' writes env_cmdpipe, 'livestatus' sends COMMANDs to env_livestatus
+async_concurrency=8                                 # max livestatus queries in flight from the asyncio client
+concurrency=4                                       # max livestatus queries in flight from blocking mode functions
+pool_size=4                                         # idle KeepAlive livestatus connections kept for reuse
+preflight_chunk_size=100                            # max hosts or services per Or: filter in bulk queries
+confirm_backoff=[0.1, 0.25, 0.5, 1, 2]              # seconds to wait before each confirmation poll, last repeats
+confirm_wait_timeout=10                             # seconds Livestatus may block waiting for a command to take effect, 0 to poll only
+aggregate_confirm=True                              # confirm hosts and services by Stats: count first, rows only where counts differ
+journal_path='/var/tmp/pyngctl_journal'             # commands submitted with defer, waiting for verify_journal
+journal_max_age=86400                               # seconds an unconfirmed journal entry is kept for verifying again
+sites={}                                            # site name: {"livestatus": socket path or 'tcp:host:port', "cmdpipe": path, "transport": 'pipe' or 'livestatus'}, missing keys use the settings above; a site reached over tcp needs transport 'livestatus'
+site_hosts={}                                       # hostname: site, routes a host explicitly
+site_prefixes={}                                    # hostname prefix: site, the longest matching prefix wins
+site_hostgroups={}                                  # hostgroup: site, routes the hostgroup and hosts which are members of it; hosts routed by none of these use the settings above, hostgroups not listed go to every site
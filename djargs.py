@@ -1,6 +1,6 @@
 
-import sys, re, subprocess, conf.djargs_config as djargs_config
-from collections import defaultdict
+import sys, re, time, types, operator, djdate, conf.djargs_config as djargs_config
+from collections import defaultdict, namedtuple
 
 def validate_type(pvalue: str, ptype: str) -> bool:
     if ptype == 'string' and isinstance(pvalue, str):
@@ -18,7 +18,7 @@ def validate_type(pvalue: str, ptype: str) -> bool:
 
     if ptype == 'date':
         try:
-            test = subprocess.check_output(['date', '-d ' + pvalue, '+%s'], stderr=subprocess.STDOUT)[0:-1]
+            djdate.timestamp(pvalue)
             return True
         except:
             return False
@@ -39,9 +39,54 @@ def custom_join(inlist: list, join_string: str) -> str:
     return out_string
 
 
-def parse(parameters: dict) -> [dict, bool, list]:
+def compile_schema(parameters: dict) -> dict:
+    """
+    Compiles the parameters from the configuration file once: regex patterns, a splitter
+    for the delimiters, relationships as sets and rules as comparisons.  The result is cached and reused by
+    every parse() of the same parameters dictionary, which shouldn't change afterwards
+    """
+    cached = _schemas.get(id(parameters))
+    if cached is not None and cached[0] is parameters:
+        return cached[1]
+    schema = {}
+    parameter_types = {switch: options["type"] for switch, options in parameters.items()}
+    for switch, options in parameters.items():
+        delimiters = options["delimiter"]
+        if delimiters:
+            splitter = re.compile("|".join(re.escape(delim) for delim in delimiters + ["¬"])).split
+        else:
+            splitter = None
+        schema[switch] = {
+            "pattern": re.compile(options["regex"]),
+            "splitter": splitter,
+            "type": options["type"],
+            "unique": options["unique"],
+            "exclusive_of": tuple(options["exclusive_of"]),
+            "depends": tuple(options["depends"]),
+            "depends_set": frozenset(options["depends"]),
+            "required": options["required"],
+            "required_unless": frozenset(options["required_unless"]),
+            "required_unless_list": list(options["required_unless"]),
+            "rules": tuple(_compile_rule(switch, rule, parameter_types) for rule in options["rules"]),
+            "default": options["default"],
+            "default_applies": options["default"] != [] and switch not in options["exclusive_of"],
+            "description": options["description"],
+        }
+    _schemas[id(parameters)] = (parameters, schema)
+    return schema
+
+
+_schemas = {}
+
+
+def parse(parameters: dict, arguments: list = None) -> [dict, bool, list]:
+    return _parse(compile_schema(parameters), sys.argv if arguments is None else arguments)
+
+
+def _parse(schema: dict, arguments: list) -> [dict, bool, list]:
     accepted_parameters = defaultdict(list)
-    arguments = sys.argv
+    # the values of each switch as a dict, to dedupe in order without scanning the list
+    seen_values = defaultdict(dict)
     valid_parameters = True
     error_list = []
 
@@ -49,182 +94,210 @@ def parse(parameters: dict) -> [dict, bool, list]:
         if index == 0:
             continue
 
-        try:
-            current_switch = arg[0:arg.index("=")]
-            current_value = arg[arg.index("=")+1:]
-        except:
-            current_switch = arg
+        current_switch, equals, current_value = arg.partition("=")
+        if not equals:
             current_value = 'none'  # this is bad
 
-        if current_switch not in parameters:
+        if current_switch not in schema:
             error = current_switch + " is not valid"
             error_list.append(error)
             valid_parameters = False
             continue
 
-        for delim in parameters[current_switch]["delimiter"]:
-            current_value = current_value.replace(delim, "¬")
-
-        pattern = re.compile(parameters[current_switch]["regex"])
-        for value in current_value.split("¬"):
-            pattern_match = pattern.match(str(value))
-            try:
-                if pattern_match.group() != value:
-                    error = current_switch + " '" + value + "' : Pattern does not match"
-                    error_list.append(error)
-                    valid_parameters = False
-            except:
+        compiled = schema[current_switch]
+        if compiled["splitter"] is None:
+            values = current_value.split("¬")
+        else:
+            values = compiled["splitter"](current_value)
+
+        match = compiled["pattern"].match
+        for value in values:
+            pattern_match = match(value)
+            if pattern_match is None or pattern_match.group() != value:
                 error = current_switch + " '" + value + "' : Pattern does not match"
                 error_list.append(error)
                 valid_parameters = False
 
-            if not validate_type(value, parameters[current_switch]["type"]):
+            if not validate_type(value, compiled["type"]):
                 error = current_switch + ' with value ' + value + ' is invalid'
                 error_list.append(error)
                 valid_parameters = False
 
-        if accepted_parameters[current_switch] != [] and parameters[current_switch]["unique"]:
+        if current_switch in seen_values and compiled["unique"]:
             error = current_switch + " can only be specified once"
             error_list.append(error)
             valid_parameters = False
 
+        seen = seen_values[current_switch]
+        for value in values:
+            if value not in seen:
+                seen[value] = None
+        accepted_parameters[current_switch] = list(seen)
 
-        for value in current_value.split("¬"):
-            if value not in accepted_parameters[current_switch]:
-                accepted_parameters[current_switch].append(value)
-
-    # Checking if a key exists in a defaultdict does weird things
-    check_parameters = dict(accepted_parameters)
-
-    for switch in check_parameters:
-        for exclusive in parameters[switch]["exclusive_of"]:
-            try:
-                if check_parameters[exclusive]:
-                    error = switch + " should not be specified along with " + exclusive
-                    error_list.append(error)
-                    valid_parameters = False
-            except:
-                pass
-
-
-    for switch in parameters:
-        if parameters[switch]["required"]:
-            if switch not in accepted_parameters:
-                unless_found = False
-                if parameters[switch]["required_unless"]:
-                    for unless in parameters[switch]["required_unless"]:
-                        if unless in accepted_parameters:
-                            unless_found = True
-                    found_requirements = unless_found
-                else:
-                    found_requirements = False
-            else:
-                found_requirements = True
-        else:
-            continue
+    for switch in accepted_parameters:
+        for exclusive in schema[switch]["exclusive_of"]:
+            if accepted_parameters.get(exclusive):
+                error = switch + " should not be specified along with " + exclusive
+                error_list.append(error)
+                valid_parameters = False
 
-        if not found_requirements:
+    for switch, compiled in schema.items():
+        if not compiled["required"] or switch in accepted_parameters:
+            continue
+        if compiled["required_unless"].isdisjoint(accepted_parameters):
             valid_parameters = False
-            if parameters[switch]["required_unless"]:
-                error = switch + " (" + parameters[switch]["description"] + ") is required unless one of \"" + custom_join(parameters[switch]["required_unless"], ', ') + "\" is specified"
+            if compiled["required_unless"]:
+                error = switch + " (" + compiled["description"] + ") is required unless one of \"" + custom_join(compiled["required_unless_list"], ', ') + "\" is specified"
             else:
-                error = switch + " (" + parameters[switch]["description"] + ") is required"
+                error = switch + " (" + compiled["description"] + ") is required"
             error_list.append(error)
 
+    for switch in accepted_parameters:
+        compiled = schema[switch]
+        if not compiled["depends_set"].issubset(accepted_parameters):
+            valid_parameters = False
+            error = switch + " (" + compiled["description"] + ") depends on " + custom_join(list(compiled["depends"]), 'and') + " also being specified"
+            error_list.append(error)
 
-    for switch in check_parameters:
-        found_dependencies = True
-        if parameters[switch]["depends"]:
-            dependency_found = True
-            for dependency in parameters[switch]["depends"]:
-                if dependency not in check_parameters:
-                    dependency_found = False
-                found_dependencies = dependency_found
-
-        if not found_dependencies:
-                valid_parameters = False
-                error = switch + " (" + parameters[switch]["description"] + ") depends on " + custom_join(parameters[switch]["depends"], 'and') + " also being specified"
-                error_list.append(error)
-
-
-    for switch in parameters:
-        if switch not in accepted_parameters:
-            if parameters[switch]["default"] != []:
-                conflict = False
-                for exclusive in parameters[switch]["exclusive_of"]:
-                    if switch == exclusive:
-                        conflict = True
-                if not conflict:
-                    accepted_parameters[switch] = parameters[switch]["default"]
-
+    # defaults are copied as date_convert replaces values in place
+    for switch, compiled in schema.items():
+        if switch not in accepted_parameters and compiled["default_applies"]:
+            default = compiled["default"]
+            accepted_parameters[switch] = list(default) if isinstance(default, list) else default
 
     return accepted_parameters, valid_parameters, error_list
 
 
 def str_to_timestamp(datestring: str) -> int:
-    timestamp = subprocess.check_output(['date', '-d ' + datestring, '+%s'], stderr=subprocess.STDOUT)[0:-1]
-    return timestamp
-
-
-def check_rules(switch, rules):
-    new_rules = []
-    original_rules = []
+    return djdate.timestamp(datestring)
+
+
+# a rule is a comparison with a number or the value of another parameter, eg "> 5" or "< -e"
+_rule = re.compile(r"\s*(?P<operator>[<>]=?|[=!]=)\s*(?:(?P<switch>-{0,2}[a-zA-Z]+)|(?P<number>-?\d+(?:\.\d+)?))\s*")
+
+_comparisons = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+                "==": operator.eq, "!=": operator.ne}
+
+
+def _typed(value, ptype: str):
+    """A parameter value as a number to compare, dates must already be unix timestamps"""
+    if ptype == "int":
+        return int(value)
+    if ptype == "float":
+        return float(value)
+    if ptype == "date" and isinstance(value, int):
+        return value
+    raise ValueError(str(value) + " can't be compared")
+
+
+def _compile_rule(switch: str, rule: str, parameter_types: dict):
+    """
+    Parses a rule of switch into a function of the parsed values, which returns whether
+    the rule passed, or None if it couldn't be checked, and an error or None
+    """
+    unable = "Unable to process rule '" + switch + " " + rule + "'"
+    match = _rule.fullmatch(rule)
+    if match is None:
+        return lambda validargs: (False, unable)
+    compare = _comparisons[match.group("operator")]
+    other = match.group("switch")
+    number = match.group("number")
+    constant = None if number is None else (float(number) if "." in number else int(number))
+    failed = "Rule for '" + switch + "' (" + switch + " " + rule + ") failed"
+
+    def check(validargs: dict) -> [bool, str]:
+        if other is not None and not validargs.get(other):
+            return None, "Can't find rule parameter " + other + " for rule '" + switch + " " + rule + "'"
+        try:
+            value = _typed(validargs[switch][0], parameter_types[switch])
+            operand = constant if other is None else _typed(validargs[other][0], parameter_types.get(other))
+        except (ValueError, TypeError):
+            return False, unable
+        if compare(value, operand):
+            return True, None
+        return False, failed
+
+    return check
+
+
+def check_rules(switch, rules, validargs):
+    """
+    Checks the compiled rules of switch against the parsed values, returns the result of
+    the last rule checked and the errors of all of them
+    """
+    test = True
     errors = []
     for rule in rules:
-        regex = "-{0,2}[a-zA-Z]{1,}"
-        pattern = re.compile(regex)
-        matches = re.findall(pattern, rule)
-        if matches == []:
-            newrule = str(validargs[switch][0]) + " " + rule
-            new_rules.append(newrule)
-            original_rules.append(rule)
-        for match in matches:
-            try:
-                test = validargs[match][0]
-                newrule = rule.replace(match, str(test))
-                newrule = str(validargs[switch][0]) + " " + newrule
-                new_rules.append(newrule)
-                original_rules.append(rule)
-            except:
-                errors.append("Can't find rule parameter " + match + " for rule '" + switch + " " + rule + "'")
-
-    if new_rules == []:
-        return True, errors
-    for index, rule in enumerate(new_rules):
-        try:
-            test = eval(rule)
-            if not test:
-                errors.append("Rule for '" + switch + "' (" + switch + " " + original_rules[index] + ") failed")
-        except:
-            errors.append("Unable to process rule '" + rule + "'")
-            test = False
+        passed, error = rule(validargs)
+        if error is not None:
+            errors.append(error)
+        if passed is not None:
+            test = passed
     return test, errors
 
 
-__dj_args__ = parse(djargs_config.parameters)
-
-validargs = dict(__dj_args__[0])
-valid = bool(__dj_args__[1])
-errors = list(__dj_args__[2])
-
-if djargs_config.date_convert and valid:
-    for switch in __dj_args__[0]:
-        if djargs_config.parameters[switch]["type"] == "date":
-            utime = int(str_to_timestamp(__dj_args__[0][switch][0]))
-            __dj_args__[0][switch][0] = utime
-
-rules_passed = True
-rule_errors = []
-if djargs_config.enable_rules and valid:
-    for switch in validargs:
-        switch_rules = djargs_config.parameters[switch]["rules"]
-        switch_type = djargs_config.parameters[switch]["type"]
-        if switch_rules != [] and switch_type != "string":
-            rulecheck = check_rules(switch, switch_rules)
-            if not rulecheck[0]:
-                rules_passed = False
-                rule_errors.append(rulecheck[1])
-
-rules_partial = False
-if rules_passed and (rule_errors != []):
-    rules_partial = True
+class Arguments(namedtuple("Arguments", "validargs valid errors rules_passed rule_errors rules_partial")):
+    """
+    The result of Parser.parse, read only: validargs maps each switch to a tuple of its
+    values, errors and rule_errors are tuples of strings and of tuples of strings
+    """
+    __slots__ = ()
+
+
+class Parser:
+    """
+    Parses argument lists against parameters compiled once, by default those of the
+    configuration file, converting dates and checking rules as configured there.  It
+    keeps no state between calls, so one Parser can parse any number of argument lists
+    """
+
+    def __init__(self, parameters: dict = None, date_convert: bool = None, enable_rules: bool = None):
+        self.schema = compile_schema(djargs_config.parameters if parameters is None else parameters)
+        self.date_convert = djargs_config.date_convert if date_convert is None else date_convert
+        self.enable_rules = djargs_config.enable_rules if enable_rules is None else enable_rules
+
+    def parse(self, argv: list) -> Arguments:
+        """Parses argv, whose first item is the program name as in sys.argv"""
+        accepted, valid, errors = _parse(self.schema, argv)
+
+        if self.date_convert and valid:
+            # relative dates are all taken from the same moment
+            now = time.time()
+            for switch in accepted:
+                if self.schema[switch]["type"] == "date":
+                    accepted[switch][0] = djdate.timestamp(accepted[switch][0], now)
+
+        rules_passed = True
+        rule_errors = []
+        if self.enable_rules and valid:
+            for switch in accepted:
+                switch_rules = self.schema[switch]["rules"]
+                if switch_rules and self.schema[switch]["type"] != "string":
+                    rulecheck = check_rules(switch, switch_rules, accepted)
+                    if not rulecheck[0]:
+                        rules_passed = False
+                        rule_errors.append(tuple(rulecheck[1]))
+
+        validargs = types.MappingProxyType({switch: tuple(values) for switch, values in accepted.items()})
+        return Arguments(validargs, valid, tuple(errors), rules_passed, tuple(rule_errors),
+                         rules_passed and rule_errors != [])
+
+
+# the module globals scripts read before Parser, now parsed from sys.argv on first use
+_globals = None
+
+
+def __getattr__(name: str):
+    global _globals
+    if name not in ("validargs", "valid", "errors", "rules_passed", "rule_errors", "rules_partial", "__dj_args__"):
+        raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+    if _globals is None:
+        arguments = Parser().parse(sys.argv)
+        validargs = {switch: list(values) for switch, values in arguments.validargs.items()}
+        errors = list(arguments.errors)
+        _globals = {"validargs": validargs, "valid": arguments.valid, "errors": errors,
+                    "rules_passed": arguments.rules_passed,
+                    "rule_errors": [list(rule_errors) for rule_errors in arguments.rule_errors],
+                    "rules_partial": arguments.rules_partial,
+                    "__dj_args__": (validargs, arguments.valid, errors)}
+    return _globals[name]
@@ -1,12 +1,14 @@
 #!/usr/bin/python
 
-import djargs as args, djlivestatus as ls, subprocess
+import djargs, djlivestatus as ls, sys
 
 debug = False
 ls.debug = debug
 ls.debug_force_fail = False
 ls.test_mode = True
 
+args = djargs.Parser().parse(sys.argv)
+
 if not args.valid:
     print("Invalid parameters specified:")
     for error in sorted(args.errors):
@@ -17,9 +19,9 @@ print("Everything is working!")
 for k,v in enumerate(args.validargs.items()):
     print(k,v)
 
-if args.rules_passed and args.djargs_config.enable_rules:
+if args.rules_passed and djargs.djargs_config.enable_rules:
     print("\nRules passed")
-if not args.rules_passed and args.djargs_config.enable_rules:
+if not args.rules_passed and djargs.djargs_config.enable_rules:
     print("\nRules failed")
     for errors in args.rule_errors:
         for error in errors:
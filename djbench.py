@@ -0,0 +1,182 @@
+#!/usr/bin/python
+"""
+Benchmarks every pyngctl mode against the djlivesim stand-in
+
+    djbench.py [sizes=10,100,1000,10000] [modes=down,ack-s,...] [output=bench_output.txt]
+    djbench.py parse=1000,5000,20000 [output=bench_output.txt]
+    djbench.py compare=<file>,<file>
+
+Each mode runs against a fresh simulator for each target count; service modes use
+half as many hosts with two services each.  One JSON line is appended to output per
+run, holding wall time, Livestatus round trips and connections, commands and pipe
+reads seen by the simulator, pipe writes and reply bytes counted by djlivestatus.stats
+and the client's peak Python memory.  compare= prints the ratio between two such
+files, matched on mode and targets, using the latest run of each.  parse= times
+djargs parsing -h with that many host names instead, as mode "args", the first
+parse compiling the argument schema and the rest reusing it
+"""
+
+import djlivesim, djlivestatus as ls, json, multiprocessing, os, subprocess, sys, tempfile, time, tracemalloc
+
+services = ["uptime_status", "ntp_time"]
+
+# mode name: (host function, service function), as in pyngctl's find_mode()
+modes = {
+    "down": (lambda hosts: ls.downtime_hosts(hosts, *_window(), "djbench"),
+             lambda hosts: ls.downtime_hostsservices(hosts, services, *_window(), "djbench")),
+    "ack": (lambda hosts: ls.ack_hostsproblem(hosts, "djbench"),
+            lambda hosts: ls.ack_hostsservicesproblem(hosts, services, "djbench")),
+    "dn": (ls.dis_hostsnotifications, lambda hosts: ls.dis_hostsservicesnotifications(hosts, services)),
+    "en": (ls.en_hostsnotifications, lambda hosts: ls.en_hostsservicesnotifications(hosts, services)),
+    "dc": (ls.dis_hostscheck, lambda hosts: ls.dis_hostsservicescheck(hosts, services)),
+    "ec": (ls.en_hostscheck, lambda hosts: ls.en_hostsservicescheck(hosts, services)),
+}
+
+
+def _window() -> [int, int]:
+    now = int(time.time())
+    return now, now + 3600
+
+
+def _revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _serve(livestatus: str, cmdpipe: str, host_count: int, mode: str, control):
+    """Runs a populated simulator in its own process until told to stop, then reports its stats"""
+    simulator = djlivesim.Simulator(livestatus, cmdpipe)
+    is_service = mode.endswith("-s")
+    simulator.populate(host_count, services if is_service else [],
+                       problem_every=1 if mode.startswith("ack") else 0)
+    if mode.startswith("en") or mode.startswith("ec"):
+        column = "notifications_enabled" if mode.startswith("en") else "checks_enabled"
+        for item in list(simulator.hosts.values()) + list(simulator.services.values()):
+            item[column] = 0
+    simulator.start()
+    control.send("ready")
+    control.recv()
+    simulator.settle()
+    control.send(dict(simulator.stats))
+    simulator.stop()
+
+
+def run(mode: str, targets: int) -> dict:
+    """Runs one mode against targets hosts or host;service pairs and returns its measurements"""
+    is_service = mode.endswith("-s")
+    host_count = max(1, targets // len(services)) if is_service else targets
+    width = max(2, len(str(host_count)))
+    hostnames = ["dc1web" + str(number).zfill(width) for number in range(1, host_count + 1)]
+    function = modes[mode.split("-")[0]][is_service]
+
+    directory = tempfile.mkdtemp(prefix="djbench")
+    livestatus = os.path.join(directory, "live")
+    cmdpipe = os.path.join(directory, "nagios.cmd")
+    ls.config.env_livestatus = livestatus
+    ls.config.env_cmdpipe = cmdpipe
+    control, child_control = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve, args=(livestatus, cmdpipe, host_count, mode, child_control))
+    server.start()
+    control.recv()
+    try:
+        ls.stats.reset()
+        tracemalloc.start()
+        started = time.perf_counter()
+        all_good, results = function(hostnames)
+        wall = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        pipe_writes = ls.stats.latencies.get("pipe_write", {"count": 0})["count"]
+        control.send("stop")
+        stats = control.recv()
+    finally:
+        server.join()
+        ls._close_pools()
+        with ls._pools_lock:
+            ls._pools.clear()
+        os.rmdir(directory)
+
+    return {"revision": _revision(), "mode": mode, "targets": host_count * (len(services) if is_service else 1),
+            "all_good": all_good, "wall_seconds": round(wall, 4), "round_trips": stats["queries"],
+            "connections": stats["connections"], "commands": stats["commands"],
+            "pipe_reads": stats["pipe_reads"], "pipe_writes": pipe_writes,
+            "reply_bytes": ls.stats.counters.get("reply_bytes", 0), "peak_bytes": peak}
+
+
+def run_parse(targets: int, repeat: int = 5) -> dict:
+    """Times compiling the djargs schema, then the best of repeat parses of targets host names reusing it"""
+    import djargs, re
+    argv = ["pyngctl.py", "dc", "-h=" + ",".join("dc1web" + str(number).zfill(len(str(targets)))
+                                                  for number in range(1, targets + 1))]
+    djargs._schemas.clear()
+    re.purge()
+    started = time.perf_counter()
+    djargs.compile_schema(djargs.djargs_config.parameters)
+    compile_time = time.perf_counter() - started
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        accepted, valid, errors = djargs.parse(djargs.djargs_config.parameters, argv)
+        timings.append(time.perf_counter() - started)
+    return {"revision": _revision(), "mode": "args", "targets": len(accepted["-h"]), "all_good": valid,
+            "wall_seconds": round(min(timings), 4), "compile_seconds": round(compile_time, 4),
+            "round_trips": 0, "connections": 0}
+
+
+def _load(path: str) -> dict:
+    """Reads a results file, later runs of the same mode and targets replace earlier ones"""
+    records = {}
+    with open(path) as results:
+        for line in results:
+            if line.strip():
+                record = json.loads(line)
+                records[(record["mode"], record["targets"])] = record
+    return records
+
+
+def compare(before_path: str, after_path: str):
+    before = _load(before_path)
+    after = _load(after_path)
+    print("%-8s %8s %10s %10s %8s %12s" % ("mode", "targets", "before", "after", "ratio", "round trips"))
+    for key in sorted(set(before) & set(after)):
+        old, new = before[key], after[key]
+        ratio = new["wall_seconds"] / old["wall_seconds"] if old["wall_seconds"] else 0
+        print("%-8s %8d %9.3fs %9.3fs %7.2fx %5d -> %-5d" % (key[0], key[1], old["wall_seconds"],
+              new["wall_seconds"], ratio, old["round_trips"], new["round_trips"]))
+
+
+def main(argv: list):
+    options = dict(argument.split("=", 1) for argument in argv)
+    if "compare" in options:
+        compare(*options["compare"].split(",", 1))
+        return
+    sizes = [int(size) for size in options.get("sizes", "10,100,1000,10000").split(",")]
+    selected = options.get("modes", ",".join(mode + suffix for mode in modes for suffix in ("", "-s")))
+    output = options.get("output", "bench_output.txt")
+    if "parse" in options:
+        with open(output, "a") as results:
+            for size in options["parse"].split(","):
+                record = run_parse(int(size))
+                results.write(json.dumps(record) + "\n")
+                print("%-8s %8d %9.4fs parse %9.4fs compile %s" % (record["mode"], record["targets"],
+                      record["wall_seconds"], record["compile_seconds"], "" if record["all_good"] else "FAILED"))
+        return
+    ls.config.command_transport = "pipe"
+    ls.inventory = None
+    ls.instrument = True
+    with open(output, "a") as results:
+        for mode in selected.split(","):
+            for size in sizes:
+                record = run(mode, size)
+                results.write(json.dumps(record) + "\n")
+                results.flush()
+                print("%-8s %8d %9.3fs %6d round trips %6d connections %8d bytes peak %s" % (
+                    record["mode"], record["targets"], record["wall_seconds"], record["round_trips"],
+                    record["connections"], record["peak_bytes"], "" if record["all_good"] else "FAILED"))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,126 @@
+"""in-process parsing of the date/time strings accepted by djargs' regex_date, into unix timestamps"""
+
+import datetime, re, time
+
+# the grammar of regex_date, as GNU date -d reads it, with one difference: nn/nn/yyyy is
+# read as dd/mm/yyyy, as the regex intends, where date -d reads it as mm/dd/yyyy
+#
+#   2024-06-30, 2024/06/30, 30/06/2024      a date, at 00:00 unless a time is given
+#   10:30, 9am, 12pm                        a time, today unless a date or day is given
+#   today, tomorrow                         now, or this time tomorrow, unless a time is given
+#   friday, fri, next friday, last fri      the day, at 00:00 unless a time is given; a bare
+#                                           day may be today, next is after today, last before
+#   week, next week, last week              a week from or before now
+#   now
+#
+# eg "2024-06-30 21:00", "9am tomorrow", "last friday 12am", "10:30 next wed"
+
+_tokens = re.compile(r"""\s*(?:
+    (?P<iso>(\d{4})[-/](\d{1,2})[-/](\d{1,2})) |
+    (?P<dmy>(\d{1,2})/(\d{1,2})/(\d{4})) |
+    (?P<clock>(\d{1,2}):(\d{2})) |
+    (?P<ampm>(\d{1,2})([ap])m) |
+    (?P<word>[a-z]+)
+)""", re.VERBOSE | re.IGNORECASE)
+
+_weekdays = {
+    "monday": 0, "mon": 0,
+    "tuesday": 1, "tue": 1, "tues": 1,
+    "wednesday": 2, "wed": 2, "weds": 2,
+    "thursday": 3, "thu": 3, "thur": 3, "thurs": 3,
+    "friday": 4, "fri": 4,
+    "saturday": 5, "sat": 5,
+    "sunday": 6, "sun": 6,
+}
+
+_ordinals = {"next": 1, "last": -1}
+
+_days = {"today": 0, "tomorrow": 1, "now": 0}
+
+# the parts of each string parsed, each call resolves them against the time
+_parsed = {}
+
+
+def _set_once(parts: dict, key: str, value, text: str):
+    if key in parts:
+        raise ValueError("'" + text + "' has more than one " + key)
+    parts[key] = value
+
+
+def _parts(text: str) -> dict:
+    """Splits a date/time string into its date, time, day and ordinal, raises ValueError"""
+    parts = {}
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _tokens.match(text, position)
+        if match is None:
+            raise ValueError("'" + text + "' is not a date/time")
+        position = match.end()
+        groups = match.groups()
+        kind = match.lastgroup
+        if kind == "iso":
+            _set_once(parts, "date", (int(groups[1]), int(groups[2]), int(groups[3])), text)
+        elif kind == "dmy":
+            _set_once(parts, "date", (int(groups[7]), int(groups[6]), int(groups[5])), text)
+        elif kind == "clock":
+            _set_once(parts, "time", (int(groups[9]), int(groups[10])), text)
+        elif kind == "ampm":
+            hour = int(groups[12])
+            if not 1 <= hour <= 12:
+                raise ValueError("'" + text + "' has an invalid hour")
+            _set_once(parts, "time", (hour % 12 + (12 if groups[13].lower() == "p" else 0), 0), text)
+        else:
+            word = groups[14].lower()
+            if word in _ordinals:
+                _set_once(parts, "ordinal", _ordinals[word], text)
+            elif word in _weekdays or word == "week" or word in _days:
+                _set_once(parts, "day", word, text)
+            else:
+                raise ValueError("'" + text + "' has an unknown word '" + word + "'")
+    if "ordinal" in parts and not (parts.get("day") in _weekdays or parts.get("day") == "week"):
+        raise ValueError("'" + text + "' has next or last without a day or week")
+    if "date" in parts and "day" in parts:
+        raise ValueError("'" + text + "' has both a date and a day")
+    if parts == {}:
+        raise ValueError("empty date/time")
+    return parts
+
+
+def _resolve(parts: dict, now: datetime.datetime) -> datetime.datetime:
+    """Applies the parts of a date/time string to now, like GNU date -d"""
+    midnight = False
+    day = parts.get("day")
+    if "date" in parts:
+        moment = datetime.datetime(*parts["date"])
+        midnight = True
+    elif day in _weekdays:
+        # parse-datetime's rule: a bare day may be today, next skips today, last goes back a week
+        ordinal = parts.get("ordinal", 0)
+        days = (_weekdays[day] - now.weekday()) % 7
+        days += 7 * (ordinal - (ordinal > 0 and now.weekday() != _weekdays[day]))
+        moment = now + datetime.timedelta(days=days)
+        midnight = True
+    elif day == "week":
+        moment = now + datetime.timedelta(days=7 * parts.get("ordinal", 1))
+    else:
+        moment = now + datetime.timedelta(days=_days.get(day, 0))
+    if "time" in parts:
+        hour, minute = parts["time"]
+        return moment.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if midnight:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(microsecond=0)
+
+
+def timestamp(text: str, now: float = None) -> int:
+    """
+    Returns the unix timestamp of a date/time string in local time, relative to now or
+    the current time, raises ValueError if it isn't one.  Each string is parsed once per
+    run, later calls only resolve it, so relative strings stay relative in long runs
+    """
+    parts = _parsed.get(text)
+    if parts is None:
+        parts = _parsed[text] = _parts(text)
+    moment = _resolve(parts, datetime.datetime.fromtimestamp(time.time() if now is None else now))
+    return int(time.mktime(moment.timetuple()))
@@ -0,0 +1,131 @@
+"""local on-disk cache of the Nagios inventory: hosts, their services and hostgroup members"""
+
+import conf.djinventory_config as config, djlivestatus as ls, sqlite3, time, threading
+
+schema = [
+    "CREATE TABLE IF NOT EXISTS hosts (name TEXT PRIMARY KEY) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS services (host_name TEXT, description TEXT, "
+    "PRIMARY KEY (host_name, description)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS hostgroup_members (hostgroup TEXT, host_name TEXT, "
+    "PRIMARY KEY (hostgroup, host_name)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID",
+]
+
+# sqlite's default limit on bound parameters is 999
+lookup_chunk_size = 500
+
+
+class Inventory:
+    """
+    Host names, host -> services and hostgroup -> members, cached in sqlite
+
+    The cache is trusted for ttl seconds after it was last checked.  After that one
+    'GET status' query compares Nagios' program_start, which changes whenever its
+    configuration is reloaded; only then are the tables fetched again, and only the
+    rows which changed are written
+    """
+
+    def __init__(self, path: str = config.inventory_path, ttl: int = config.inventory_ttl):
+        self.path = path
+        self.ttl = ttl
+        # used from the asyncio executor as well as the main thread, one at a time
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA mmap_size = 268435456")
+        for statement in schema:
+            self._db.execute(statement)
+        self.lock = threading.RLock()
+
+    def _meta(self, key: str) -> int:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: int):
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _sync(self, table: str, columns: list, rows: set):
+        """Writes the difference between the cached rows of a table and rows"""
+        cached = set(self._db.execute("SELECT " + ", ".join(columns) + " FROM " + table))
+        where = " AND ".join(column + " = ?" for column in columns)
+        placeholders = ", ".join("?" for column in columns)
+        self._db.executemany("DELETE FROM " + table + " WHERE " + where, cached - rows)
+        self._db.executemany("INSERT INTO " + table + " VALUES (" + placeholders + ")", rows - cached)
+
+    def _program_start(self) -> int:
+        for row in ls.livestatus_rows(["GET status", "Columns: program_start"]):
+            return int(row.program_start)
+        return None
+
+    def refresh(self, force: bool = False) -> bool:
+        """Brings the cache up to date if it is stale, returns whether it is usable"""
+        now = int(time.time())
+        checked = self._meta("checked")
+        if not force and checked is not None and now - checked < self.ttl:
+            return True
+        program_start = self._program_start()
+        if program_start is None:
+            # livestatus is unreachable, an old cache is better than none
+            return checked is not None
+        try:
+            # a failed or partial fetch raises before anything is written, and rolls back
+            # anything that was, so program_start and checked only move on a full refresh
+            with self._db:
+                if force or program_start != self._meta("program_start"):
+                    hosts = set()
+                    members = set()
+                    for row in ls.livestatus_rows_checked(["GET hosts", "Columns: name groups"]):
+                        hosts.add((row.name,))
+                        for hostgroup in row.groups:
+                            members.add((hostgroup, row.name))
+                    services = set()
+                    for row in ls.livestatus_rows_checked(["GET services", "Columns: host_name description"]):
+                        services.add((row.host_name, row.description))
+                    self._sync("hosts", ["name"], hosts)
+                    self._sync("services", ["host_name", "description"], services)
+                    self._sync("hostgroup_members", ["hostgroup", "host_name"], members)
+                    self._set_meta("program_start", program_start)
+                self._set_meta("checked", now)
+        except (OSError, ValueError) as error:
+            if ls.debug:
+                print("DEBUG(Inventory.refresh):", error)
+            return checked is not None
+        return True
+
+    def _lookup(self, statement: str, values: list) -> list:
+        found = []
+        for index in range(0, len(values), lookup_chunk_size):
+            chunk = values[index:index + lookup_chunk_size]
+            placeholders = ", ".join("?" for value in chunk)
+            found += self._db.execute(statement.replace("?", placeholders), chunk).fetchall()
+        return found
+
+    def existing_hosts(self, hostnames: list) -> set:
+        """Returns the subset of hostnames which exist"""
+        rows = self._lookup("SELECT name FROM hosts WHERE name IN (?)", list(hostnames))
+        return set(row[0] for row in rows)
+
+    def existing_services(self, hostnames: list, services: list) -> set:
+        """Returns the (hostname, service) pairs of the given hosts and services which exist"""
+        services = set(services)
+        rows = self._lookup("SELECT host_name, description FROM services WHERE host_name IN (?)",
+                            list(hostnames))
+        return set(row for row in rows if row[1] in services)
+
+    def hostgroup_members(self, hostgroups: list) -> list:
+        """Returns the hosts in any of the given hostgroups"""
+        rows = self._lookup("SELECT host_name FROM hostgroup_members WHERE hostgroup IN (?)",
+                            list(hostgroups))
+        # a host in several of the hostgroups has a row for each
+        hosts = {}
+        for row in rows:
+            hosts[row[0]] = True
+        return list(hosts)
+
+    def host_groups(self) -> dict:
+        """Returns every host and the hostgroups it's in"""
+        groups_of = {row[0]: [] for row in self._db.execute("SELECT name FROM hosts")}
+        for hostgroup, host_name in self._db.execute("SELECT hostgroup, host_name FROM hostgroup_members"):
+            groups_of.setdefault(host_name, []).append(hostgroup)
+        return groups_of
+
+    def close(self):
+        self._db.close()
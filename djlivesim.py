@@ -0,0 +1,724 @@
+"""local stand-in for a Nagios core with MK Livestatus, for testing and load work"""
+
+import os, socket, socketserver, threading, time, json, re
+
+
+host_columns = {
+    "name": "", "alias": "", "address": "", "state": 0, "acknowledged": 0, "checks_enabled": 1,
+    "notifications_enabled": 1, "scheduled_downtime_depth": 0, "groups": [], "downtimes": []
+}
+
+service_columns = {
+    "host_name": "", "description": "", "state": 0, "acknowledged": 0, "checks_enabled": 1,
+    "notifications_enabled": 1, "scheduled_downtime_depth": 0, "groups": [], "host_groups": [],
+    "downtimes": []
+}
+
+downtime_columns = {
+    "id": 0, "host_name": "", "service_description": "", "author": "", "comment": "",
+    "start_time": 0, "end_time": 0, "fixed": 1, "duration": 0, "is_service": 0
+}
+
+group_columns = {"name": "", "alias": "", "members": [], "num_hosts": 0, "num_services": 0}
+
+status_columns = {"program_start": 0, "program_version": "djlivesim", "nagios_pid": 0}
+
+
+class LQLError(Exception):
+    """Raised for a query the simulator can't answer, reported as a 400 reply"""
+
+
+def _typed(example, value: str):
+    """Converts a filter value to the type of a column"""
+    if isinstance(example, int):
+        return int(value)
+    return value
+
+
+def _compare(operator: str, example, reference):
+    """Returns a predicate for a column value of the given example's type"""
+    if isinstance(example, list):
+        if operator == "=":
+            return lambda value: value == [] if reference == "" else False
+        if operator == ">=":
+            return lambda value: reference in value
+        if operator == "<":
+            return lambda value: reference not in value
+        if operator == "!=":
+            return lambda value: value != [] if reference == "" else True
+        raise LQLError("operator " + operator + " is not supported for lists")
+    reference = _typed(example, reference)
+    operators = {
+        "=": lambda value: value == reference,
+        "!=": lambda value: value != reference,
+        "<": lambda value: value < reference,
+        ">": lambda value: value > reference,
+        "<=": lambda value: value <= reference,
+        ">=": lambda value: value >= reference,
+        "~": lambda value: re.search(reference, value) is not None,
+        "!~": lambda value: re.search(reference, value) is None,
+        "=~": lambda value: value.lower() == reference.lower(),
+        "~~": lambda value: re.search(reference, value, re.I) is not None,
+    }
+    if operator not in operators:
+        raise LQLError("unknown operator " + operator)
+    return operators[operator]
+
+
+class _Predicate:
+    """
+    A compiled filter.  Equality filters, and Ands of them over different columns,
+    remember their columns and value tuples so an Or: of them becomes one set lookup
+    """
+
+    def __init__(self, test, columns: tuple = None, values: set = None):
+        self.test = test
+        self.columns = columns
+        self.values = values
+
+
+def _lookup(columns: tuple, values: set) -> _Predicate:
+    if len(columns) == 1:
+        column = columns[0]
+        singles = set(value[0] for value in values)
+        return _Predicate(lambda row: row[column] in singles, columns, values)
+    return _Predicate(lambda row: tuple(row[column] for column in columns) in values, columns, values)
+
+
+def _filter(columns: dict, statement: str) -> _Predicate:
+    parts = statement.split(" ", 2)
+    if len(parts) == 2:
+        parts.append("")
+    column, operator, reference = parts
+    if column not in columns:
+        raise LQLError("unknown column " + column)
+    example = columns[column]
+    compare = _compare(operator, example, reference)
+    if operator == "=" and not isinstance(example, list):
+        return _lookup((column,), {(_typed(example, reference),)})
+    return _Predicate(lambda row: compare(row[column]))
+
+
+def _combine(predicates: list, any_of: bool) -> _Predicate:
+    keyed = all(predicate.columns is not None for predicate in predicates)
+    if keyed and any_of and len(set(predicate.columns for predicate in predicates)) == 1:
+        values = set()
+        for predicate in predicates:
+            values |= predicate.values
+        return _lookup(predicates[0].columns, values)
+    if keyed and not any_of and all(len(predicate.values) == 1 for predicate in predicates):
+        columns = sum((predicate.columns for predicate in predicates), ())
+        if len(set(columns)) == len(columns):
+            value = sum((next(iter(predicate.values)) for predicate in predicates), ())
+            return _lookup(columns, {value})
+    tests = [predicate.test for predicate in predicates]
+    if any_of:
+        return _Predicate(lambda row: any(test(row) for test in tests))
+    return _Predicate(lambda row: all(test(row) for test in tests))
+
+
+class Query:
+    """A parsed LQL GET request"""
+
+    def __init__(self, lines: list, tables: dict):
+        self.table = lines[0][4:].strip()
+        if self.table not in tables:
+            raise LQLError("unknown table " + self.table)
+        self.table_columns = tables[self.table]
+        self.columns = []
+        self.column_headers = None
+        self.output_format = "csv"
+        self.keepalive = False
+        self.response_header = "off"
+        self.limit = None
+        self.stats = []
+        self.wait_object = None
+        self.wait_conditions = []
+        self.wait_trigger = None
+        self.wait_timeout = 0
+        stack = []
+        for line in lines[1:]:
+            header, _sep, argument = line.partition(":")
+            argument = argument.strip()
+            if header == "Columns":
+                self.columns = argument.split()
+                for column in self.columns:
+                    if column not in self.table_columns:
+                        raise LQLError("unknown column " + column)
+            elif header == "Filter":
+                stack.append(_filter(self.table_columns, argument))
+            elif header in ("And", "Or"):
+                count = int(argument)
+                if count > len(stack):
+                    raise LQLError(header + ": " + argument + " exceeds the number of filters")
+                if count == 0:
+                    stack.append(_Predicate(lambda row: header == "And"))
+                    continue
+                combined = _combine(stack[-count:], header == "Or")
+                del stack[-count:]
+                stack.append(combined)
+            elif header == "Negate":
+                test = stack.pop().test
+                stack.append(_Predicate(lambda row: not test(row)))
+            elif header == "Stats":
+                self.stats.append(_filter(self.table_columns, argument))
+            elif header in ("StatsAnd", "StatsOr"):
+                count = int(argument)
+                if count == 0 or count > len(self.stats):
+                    raise LQLError(header + ": " + argument + " doesn't match the number of stats")
+                combined = _combine(self.stats[-count:], header == "StatsOr")
+                del self.stats[-count:]
+                self.stats.append(combined)
+            elif header == "StatsNegate":
+                test = self.stats.pop().test
+                self.stats.append(_Predicate(lambda row: not test(row)))
+            elif header == "WaitObject":
+                self.wait_object = argument
+            elif header == "WaitCondition":
+                self.wait_conditions.append(_filter(self.table_columns, argument))
+            elif header in ("WaitConditionAnd", "WaitConditionOr"):
+                count = int(argument)
+                if count == 0 or count > len(self.wait_conditions):
+                    raise LQLError(header + ": " + argument + " doesn't match the number of conditions")
+                combined = _combine(self.wait_conditions[-count:], header == "WaitConditionOr")
+                del self.wait_conditions[-count:]
+                self.wait_conditions.append(combined)
+            elif header == "WaitConditionNegate":
+                test = self.wait_conditions.pop().test
+                self.wait_conditions.append(_Predicate(lambda row: not test(row)))
+            elif header == "WaitTrigger":
+                self.wait_trigger = argument
+            elif header == "WaitTimeout":
+                self.wait_timeout = int(argument)
+            elif header == "ColumnHeaders":
+                self.column_headers = argument == "on"
+            elif header == "OutputFormat":
+                self.output_format = argument
+            elif header == "KeepAlive":
+                self.keepalive = argument == "on"
+            elif header == "ResponseHeader":
+                self.response_header = argument
+            elif header == "Limit":
+                self.limit = int(argument)
+            else:
+                raise LQLError("unsupported header " + header)
+        if self.output_format not in ("csv", "json"):
+            raise LQLError("unsupported output format " + self.output_format)
+        self.filter = _combine(stack, False).test if stack else None
+        self.wait_condition = _combine(self.wait_conditions, False).test if self.wait_conditions else None
+        if self.stats and self.columns:
+            raise LQLError("grouping Stats: by Columns: is not supported")
+        if self.stats:
+            self.columns = ["stats_" + str(number) for number in range(1, len(self.stats) + 1)]
+        elif self.columns == []:
+            self.columns = list(self.table_columns)
+            if self.column_headers is None:
+                self.column_headers = True
+
+    def answer(self, rows: list) -> list:
+        if self.stats:
+            return self._count(rows)
+        matched = []
+        for row in rows:
+            if self.limit is not None and len(matched) >= self.limit:
+                break
+            if self.filter is None or self.filter(row):
+                matched.append([row[column] for column in self.columns])
+        if self.column_headers:
+            matched.insert(0, list(self.columns))
+        return matched
+
+    def _count(self, rows: list) -> list:
+        """Answers a Stats: query, one row holding a count per Stats: line"""
+        counts = [0] * len(self.stats)
+        tests = [stat.test for stat in self.stats]
+        for row in rows:
+            if self.filter is None or self.filter(row):
+                for index, test in enumerate(tests):
+                    if test(row):
+                        counts[index] += 1
+        return [list(self.columns), counts] if self.column_headers else [counts]
+
+    def render(self, rows: list) -> bytes:
+        if self.output_format == "json":
+            lines = [json.dumps(row) for row in rows]
+            return ("[" + ",\n".join(lines) + "]\n").encode()
+        out = []
+        for row in rows:
+            fields = []
+            for value in row:
+                if isinstance(value, list):
+                    value = ",".join("|".join(item) if isinstance(item, list) else str(item) for item in value)
+                fields.append(str(value))
+            out.append(";".join(fields) + "\n")
+        return "".join(out).encode()
+
+
+class Simulator:
+    """
+    Serves LQL on a UNIX socket and applies external commands read from a FIFO
+
+    Hosts, services and downtimes are held in memory.  latency delays every query reply,
+    command_delay delays applying each external command, like a busy Nagios core.
+    fail_queries, if set, is called with the lines of each query and fails it with a 400
+    when it returns True, to test how clients handle a query going wrong
+    """
+
+    def __init__(self, livestatus: str, cmdpipe: str, latency: float = 0.0, command_delay: float = 0.0):
+        self.livestatus = livestatus
+        self.cmdpipe = cmdpipe
+        self.latency = latency
+        self.command_delay = command_delay
+        self.fail_queries = None
+        self.hosts = {}
+        self.services = {}
+        self.hostgroups = {}
+        self.servicegroups = {}
+        self.downtimes = {}
+        self.next_downtime_id = 1
+        self.program_start = int(time.time())
+        self.changed = threading.Condition()
+        self.stats = {"connections": 0, "queries": 0, "commands": 0, "rejected_commands": 0,
+                      "pipe_reads": 0, "bytes_sent": 0}
+        self._stats_lock = threading.Lock()
+        self._pending = []
+        self._pending_ready = threading.Condition()
+        self._running = False
+        self._server = None
+        self._threads = []
+        self._connections = set()
+
+    def count(self, stat: str, amount: int = 1):
+        """Adds to one of the counters in stats, which are shared by all connections"""
+        with self._stats_lock:
+            self.stats[stat] += amount
+
+    def add_host(self, name: str, groups: list = [], state: int = 0):
+        """Adds a host, creating any hostgroups it belongs to"""
+        host = dict(host_columns)
+        host.update({"name": name, "alias": name, "address": name, "state": state,
+                     "groups": list(groups), "downtimes": []})
+        self.hosts[name] = host
+        for group in groups:
+            self.hostgroups.setdefault(group, []).append(name)
+
+    def add_service(self, hostname: str, description: str, groups: list = [], state: int = 0):
+        """Adds a service to an existing host, creating any servicegroups it belongs to"""
+        service = dict(service_columns)
+        service.update({"host_name": hostname, "description": description, "state": state,
+                        "groups": list(groups), "host_groups": self.hosts[hostname]["groups"],
+                        "downtimes": []})
+        self.services[(hostname, description)] = service
+        for group in groups:
+            self.servicegroups.setdefault(group, []).append([hostname, description])
+
+    def populate(self, host_count: int, services: list = [], prefix: str = "dc1web",
+                 problem_every: int = 0):
+        """Adds numbered hosts in hostgroup 'web', each with the given services"""
+        width = max(2, len(str(host_count)))
+        for number in range(1, host_count + 1):
+            hostname = prefix + str(number).zfill(width)
+            state = 1 if problem_every and number % problem_every == 0 else 0
+            self.add_host(hostname, ["web", "odd" if number % 2 else "even"], state)
+            for service in services:
+                self.add_service(hostname, service, [service + "_group"], 2 if state else 0)
+
+    # tables
+
+    def _group_rows(self, groups: dict, is_service: bool) -> list:
+        rows = []
+        for name, members in groups.items():
+            row = dict(group_columns)
+            row.update({"name": name, "alias": name, "members": list(members)})
+            row["num_services" if is_service else "num_hosts"] = len(members)
+            rows.append(row)
+        return rows
+
+    def _hostsbygroup_rows(self) -> list:
+        rows = []
+        for host in self.hosts.values():
+            for group in host["groups"]:
+                row = dict(host)
+                row["hostgroup_name"] = group
+                rows.append(row)
+        return rows
+
+    def _status_rows(self) -> list:
+        return [{"program_start": self.program_start, "program_version": "djlivesim",
+                 "nagios_pid": os.getpid()}]
+
+    def tables(self) -> dict:
+        """Column definitions of every table, as {table: {column: example value}}"""
+        return {
+            "hosts": host_columns,
+            "services": service_columns,
+            "downtimes": downtime_columns,
+            "hostgroups": group_columns,
+            "servicegroups": group_columns,
+            "hostsbygroup": dict(host_columns, hostgroup_name=""),
+            "status": status_columns,
+        }
+
+    def rows(self, table: str) -> list:
+        if table == "hosts":
+            return list(self.hosts.values())
+        if table == "services":
+            return list(self.services.values())
+        if table == "downtimes":
+            return list(self.downtimes.values())
+        if table == "hostgroups":
+            return self._group_rows(self.hostgroups, False)
+        if table == "servicegroups":
+            return self._group_rows(self.servicegroups, True)
+        if table == "hostsbygroup":
+            return self._hostsbygroup_rows()
+        return self._status_rows()
+
+    # external commands
+
+    def command(self, line: str) -> bool:
+        """Queues an external command line "[timestamp] NAME;args" for processing"""
+        match = re.match(r"^\[(\d+)\] ([A-Z_]+)(;.*)?$", line.strip())
+        if not match:
+            self.count("rejected_commands")
+            return False
+        self.count("commands")
+        with self._pending_ready:
+            self._pending.append((time.time() + self.command_delay, match.group(2),
+                                  (match.group(3) or "")[1:]))
+            self._pending_ready.notify()
+        return True
+
+    def _schedule_downtime(self, hostname: str, description: str, args: list):
+        start, end, fixed, _trigger, duration, author, comment = args
+        downtime = dict(downtime_columns)
+        downtime.update({"id": self.next_downtime_id, "host_name": hostname,
+                         "service_description": description, "author": author,
+                         "comment": comment, "start_time": int(start), "end_time": int(end),
+                         "fixed": int(fixed), "duration": int(duration),
+                         "is_service": int(description != "")})
+        self.next_downtime_id += 1
+        self.downtimes[downtime["id"]] = downtime
+        target = self.services[(hostname, description)] if description else self.hosts[hostname]
+        target["downtimes"].append(downtime["id"])
+        if downtime["start_time"] <= time.time() < downtime["end_time"]:
+            target["scheduled_downtime_depth"] += 1
+
+    def _delete_downtime(self, downtime_id: int, is_service: bool):
+        downtime = self.downtimes.get(downtime_id)
+        if downtime is None or downtime["is_service"] != int(is_service):
+            return
+        del self.downtimes[downtime_id]
+        if is_service:
+            target = self.services[(downtime["host_name"], downtime["service_description"])]
+        else:
+            target = self.hosts[downtime["host_name"]]
+        target["downtimes"].remove(downtime_id)
+        if downtime["start_time"] <= time.time() < downtime["end_time"]:
+            target["scheduled_downtime_depth"] = max(0, target["scheduled_downtime_depth"] - 1)
+
+    def apply(self, name: str, arguments: str):
+        """Applies one external command to the in-memory state"""
+        host_fields = {"SCHEDULE_HOST_DOWNTIME": 8, "ACKNOWLEDGE_HOST_PROBLEM": 6}
+        service_fields = {"SCHEDULE_SVC_DOWNTIME": 9, "ACKNOWLEDGE_SVC_PROBLEM": 7}
+        toggles = {"CHECK": "checks_enabled", "NOTIFICATIONS": "notifications_enabled"}
+        if name in host_fields:
+            args = arguments.split(";", host_fields[name] - 1)
+        elif name in service_fields:
+            args = arguments.split(";", service_fields[name] - 1)
+        else:
+            args = arguments.split(";")
+        try:
+            if name == "SCHEDULE_HOST_DOWNTIME" and args[0] in self.hosts:
+                self._schedule_downtime(args[0], "", args[1:])
+            elif name == "SCHEDULE_SVC_DOWNTIME" and (args[0], args[1]) in self.services:
+                self._schedule_downtime(args[0], args[1], args[2:])
+            elif name == "DEL_HOST_DOWNTIME":
+                self._delete_downtime(int(args[0]), False)
+            elif name == "DEL_SVC_DOWNTIME":
+                self._delete_downtime(int(args[0]), True)
+            elif name == "ACKNOWLEDGE_HOST_PROBLEM" and args[0] in self.hosts:
+                if self.hosts[args[0]]["state"] != 0:
+                    self.hosts[args[0]]["acknowledged"] = 1
+            elif name == "ACKNOWLEDGE_SVC_PROBLEM" and (args[0], args[1]) in self.services:
+                if self.services[(args[0], args[1])]["state"] != 0:
+                    self.services[(args[0], args[1])]["acknowledged"] = 1
+            else:
+                action, _sep, rest = name.partition("_")
+                kind, _sep, toggle = rest.partition("_")
+                if action not in ("ENABLE", "DISABLE") or toggle not in toggles:
+                    self.count("rejected_commands")
+                    return
+                if kind == "HOST" and args[0] in self.hosts:
+                    target = self.hosts[args[0]]
+                elif kind == "SVC" and (args[0], args[1]) in self.services:
+                    target = self.services[(args[0], args[1])]
+                else:
+                    return
+                target[toggles[toggle]] = int(action == "ENABLE")
+        except (IndexError, ValueError):
+            self.count("rejected_commands")
+
+    def _process_commands(self):
+        while self._running:
+            with self._pending_ready:
+                while self._running and self._pending == []:
+                    self._pending_ready.wait(0.1)
+                if not self._running:
+                    return
+                due, name, arguments = self._pending[0]
+                wait = due - time.time()
+                if wait > 0:
+                    self._pending_ready.wait(wait)
+                    continue
+                self._pending.pop(0)
+            with self.changed:
+                self.apply(name, arguments)
+                self.changed.notify_all()
+
+    def _read_pipe(self):
+        # O_RDWR keeps a writer open ourselves, so the FIFO never reports EOF between
+        # pyngctl runs
+        fd = os.open(self.cmdpipe, os.O_RDWR)
+        buffered = b""
+        try:
+            while self._running:
+                data = os.read(fd, 65536)
+                self.count("pipe_reads")
+                buffered += data
+                *lines, buffered = buffered.split(b"\n")
+                for line in lines:
+                    if line.strip() and line.strip() != b"STOP":
+                        self.command(line.decode())
+        finally:
+            os.close(fd)
+
+    # queries
+
+    def request(self, lines: list) -> [bytes, bool]:
+        """Answers one LQL request, returning the reply and whether to keep the connection"""
+        if lines[0].startswith("COMMAND "):
+            # like Livestatus, only the first line of a command request counts and the
+            # connection stays open for the next request
+            self.command(lines[0][8:])
+            return b"", True
+        self.count("queries")
+        keepalive = False
+        response_header = "off"
+        try:
+            if not lines[0].startswith("GET "):
+                raise LQLError("invalid request method")
+            if self.fail_queries is not None and self.fail_queries(lines):
+                raise LQLError("query failed by fail_queries")
+            query = Query(lines, self.tables())
+            keepalive = query.keepalive
+            response_header = query.response_header
+            with self.changed:
+                if query.wait_trigger is not None or query.wait_condition is not None:
+                    self._wait(query)
+                body = query.render(query.answer(self.rows(query.table)))
+            code = 200
+        except (LQLError, ValueError, re.error) as error:
+            for line in lines:
+                if line.startswith("KeepAlive:"):
+                    keepalive = line.endswith("on")
+                if line.startswith("ResponseHeader:"):
+                    response_header = line.partition(":")[2].strip()
+            body = (str(error) + "\n").encode()
+            code = 400
+        if self.latency:
+            time.sleep(self.latency)
+        if response_header == "fixed16":
+            body = ("%3d %11d\n" % (code, len(body))).encode() + body
+        self.count("bytes_sent", len(body))
+        return body, keepalive
+
+    def _wait_rows(self, query) -> list:
+        if query.wait_object is None:
+            return self.rows(query.table)
+        if query.table == "hosts":
+            return [self.hosts[query.wait_object]] if query.wait_object in self.hosts else []
+        if query.table == "services":
+            hostname, _sep, description = query.wait_object.replace(";", " ", 1).partition(" ")
+            service = self.services.get((hostname, description))
+            return [service] if service is not None else []
+        raise LQLError("WaitObject is not supported for table " + query.table)
+
+    def _wait(self, query):
+        """
+        Blocks, holding self.changed, until the wait condition holds for the wait object,
+        or any row without one, or until WaitTimeout milliseconds pass.  Every applied
+        command fires every trigger.  Without a condition it waits for one command
+        """
+        deadline = time.time() + query.wait_timeout / 1000.0 if query.wait_timeout else None
+        while self._running:
+            if query.wait_condition is not None:
+                if any(query.wait_condition(row) for row in self._wait_rows(query)):
+                    return
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return
+            fired = self.changed.wait(remaining)
+            if query.wait_condition is None and fired:
+                return
+
+    def start(self):
+        """Starts serving on the livestatus socket and reading the command pipe"""
+        simulator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                simulator._connections.add(self.connection)
+
+            def finish(self):
+                simulator._connections.discard(self.connection)
+                super().finish()
+
+            def handle(self):
+                simulator.count("connections")
+                while True:
+                    lines = []
+                    while True:
+                        line = self.rfile.readline()
+                        if line in (b"", b"\n"):
+                            break
+                        lines.append(line.decode().rstrip("\n"))
+                    if lines == []:
+                        if line == b"":
+                            return
+                        continue
+                    reply, keepalive = simulator.request(lines)
+                    if reply:
+                        self.wfile.write(reply)
+                        self.wfile.flush()
+                    if not keepalive or line == b"":
+                        return
+
+        for path in (self.livestatus,):
+            if os.path.exists(path):
+                os.unlink(path)
+        if not os.path.exists(self.cmdpipe):
+            os.mkfifo(self.cmdpipe)
+        self._running = True
+        self._server = socketserver.ThreadingUnixStreamServer(self.livestatus, Handler)
+        self._server.daemon_threads = True
+        for target in (self._server.serve_forever, self._process_commands, self._read_pipe):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stops serving and removes the socket and FIFO"""
+        self._running = False
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        for connection in list(self._connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        with self._pending_ready:
+            self._pending_ready.notify_all()
+        with self.changed:
+            self.changed.notify_all()
+        # wake the pipe reader so it notices we've stopped
+        try:
+            fd = os.open(self.cmdpipe, os.O_WRONLY | os.O_NONBLOCK)
+            os.write(fd, b"STOP\n")
+            os.close(fd)
+        except OSError:
+            pass
+        for path in (self.livestatus, self.cmdpipe):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def settle(self, timeout: float = 10.0) -> bool:
+        """Waits until every queued command has been applied"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._pending_ready:
+                if self._pending == []:
+                    return True
+            time.sleep(0.01)
+        return False
+
+
+def _check():
+    """Regression checks of djlivestatus against a simulator, run as python djlivesim.py check"""
+    import tempfile, asyncio, djlivestatus
+    directory = tempfile.mkdtemp()
+    djlivestatus.config.env_livestatus = directory + "/live"
+    djlivestatus.config.env_cmdpipe = directory + "/cmd"
+    simulator = Simulator(djlivestatus.config.env_livestatus, djlivestatus.config.env_cmdpipe)
+    simulator.populate(2, ["ntp_time"])
+    simulator.start()
+    try:
+        now = int(time.time())
+        djlivestatus.downtime_hosts(["dc1web01", "dc1web02"], now, now + 600, "check")
+        simulator.settle()
+        # the removal commands are sent but confirming them fails, so the downtimes must
+        # stay pending and be reported as failed, not as removed
+        simulator.fail_queries = lambda lines: "Columns: id" in lines
+        for result in [djlivestatus.remove_downtimes(["dc1web01"], retry_confirm=1),
+                       asyncio.run(djlivestatus.remove_downtimes_async(["dc1web02"], retry_confirm=1))]:
+            assert result[0] is False and set(result[1].values()) == {"command_failed"}, result
+        simulator.fail_queries = None
+        # comments are matched as text, escaping only what ERE treats as special
+        comment = "CHG-42 patch+reboot (db)"
+        assert djlivestatus._ere_escape(comment) == "CHG-42 patch\\+reboot \\(db\\)"
+        djlivestatus.downtime_hosts(["dc1web01"], now, now + 600, comment)
+        simulator.settle()
+        result = djlivestatus.remove_downtimes(["dc1web01"], comment=comment)
+        assert result[0] is True, result
+        # with queries in flight at once, every handler still gets its whole reply in
+        # order, and one stopping early doesn't hold up the others
+        djlivestatus.concurrency = 3
+        counts = []
+        polls = [(["GET services", "Columns: host_name description"], lambda rows: counts.append(len(list(rows)))),
+                 (["GET hosts", "Columns: name"], lambda rows: next(iter(rows), None)),
+                 (["GET hosts", "Columns: name"], lambda rows: counts.append(len(list(rows))))]
+        djlivestatus._run_polls(polls)
+        asyncio.run(djlivestatus._run_polls_async(polls))
+        assert counts == [2, 2, 2, 2], counts
+        # journal entries for a site that's since been removed from config.sites fail,
+        # and are kept until config.journal_max_age rather than breaking verification
+        djlivestatus.config.journal_path = directory + "/journal"
+        djlivestatus.defer = True
+        djlivestatus.dis_hostsnotifications(["dc1web01"])
+        djlivestatus.defer = False
+        with open(djlivestatus.config.journal_path) as journal:
+            record = json.loads(journal.read())
+        with open(djlivestatus.config.journal_path, "w") as journal:
+            journal.write(json.dumps(dict(record, site="removed")) + "\n")
+        for verify in [djlivestatus.verify_journal, lambda: asyncio.run(djlivestatus.verify_journal_async())]:
+            assert verify() == (False, {"dis_hostsnotifications;dc1web01": "command_failed"})
+        with open(djlivestatus.config.journal_path, "w") as journal:
+            journal.write(json.dumps(dict(record, site="removed", submitted=0)) + "\n")
+        djlivestatus.verify_journal()
+        assert os.path.getsize(djlivestatus.config.journal_path) == 0
+    finally:
+        simulator.stop()
+        djlivestatus._close_pools()
+    print("removals by comment, failed removal confirmations, concurrent polls and journal sites checked")
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:2] == ["check"]:
+        _check()
+        sys.exit()
+    import conf.djlivestatus_config as config
+    # usage: djlivesim.py [hosts] [comma separated services] [latency] [command delay]
+    arguments = sys.argv[1:] + [None] * 4
+    simulator = Simulator(config.env_livestatus, config.env_cmdpipe,
+                          float(arguments[2] or 0), float(arguments[3] or 0))
+    simulator.populate(int(arguments[0] or 10), (arguments[1] or "uptime_status,ntp_time").split(","))
+    simulator.start()
+    print("Serving", len(simulator.hosts), "hosts on", config.env_livestatus, "and", config.env_cmdpipe)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
@@ -1,9 +1,14 @@
 """library for interacting with Nagios / MK Livestatus"""
 
-import conf.djlivestatus_config as config, socket, re, time
+import conf.djlivestatus_config as config, socket, re, time, threading, atexit, os, select
+import asyncio, weakref, concurrent.futures, collections, codecs, json, bisect, string, fcntl, contextvars, queue
 debug=False  # set djlivestatus.debug = True in importing script to use
 debug_force_fail = False # set djlivestatus.debug_force_fail = True in importing script to use
 test_mode = False # set djlivestatus.test_mode = True in importing script to use
+concurrency = config.concurrency # set djlivestatus.concurrency = n in importing script to change
+inventory = None # set djlivestatus.inventory = djinventory.Inventory() in importing script to use
+instrument = False # set djlivestatus.instrument = True in importing script to collect djlivestatus.stats
+defer = False # set djlivestatus.defer = True in importing script to journal commands for verify_journal instead of confirming them
 
 def dec_debug_true_false(func):
     def wrapper(*args, **kwargs):
@@ -15,534 +20,2756 @@ def dec_debug_true_false(func):
     return wrapper
 
 
+class Stats:
+    """
+    Counters and latency histograms collected while djlivestatus.instrument is True
+
+    Latencies are recorded under 'livestatus_query' (send to last reply byte),
+    'command_send' (COMMANDs over livestatus), 'pipe_write' (each write to the command
+    pipe), 'confirm_wait' (a blocking WaitTrigger query) and 'confirm_poll' (one round
+    of confirmation queries).  Counters include
+    reply_bytes, pipe_bytes, commands, command_retries, confirm_wait_seconds and
+    reconnects.  When instrumentation is off nothing is recorded, callers only test
+    the flag
+    """
+
+    # upper bounds in seconds, a final bucket holds everything slower
+    buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.latencies = {}
+
+    def count(self, name: str, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float):
+        """Records one latency sample"""
+        with self._lock:
+            if name not in self.latencies:
+                self.latencies[name] = {"count": 0, "total": 0.0, "max": 0.0,
+                                        "histogram": [0] * (len(self.buckets) + 1)}
+            latency = self.latencies[name]
+            latency["count"] += 1
+            latency["total"] += seconds
+            latency["max"] = max(latency["max"], seconds)
+            latency["histogram"][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def snapshot(self) -> dict:
+        """Returns a copy of the counters and latencies, safe to keep while collection goes on"""
+        with self._lock:
+            return {"counters": dict(self.counters),
+                    "latencies": {name: dict(latency, histogram=list(latency["histogram"]))
+                                  for name, latency in self.latencies.items()}}
+
+    def report(self) -> str:
+        """Returns the counters and latencies as text, one line each"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append("%-22s %s" % (name, round(value, 3)))
+        for name, latency in sorted(snapshot["latencies"].items()):
+            lines.append("%-22s count=%d total=%.3fs mean=%.4fs max=%.4fs" % (
+                name, latency["count"], latency["total"], latency["total"] / latency["count"],
+                latency["max"]))
+            labels = ["<=" + str(bound) + "s" for bound in self.buckets] + [">" + str(self.buckets[-1]) + "s"]
+            lines.append("%-22s %s" % ("", " ".join(label + ":" + str(samples) for label, samples
+                                                      in zip(labels, latency["histogram"]) if samples)))
+        if lines == []:
+            return "no livestatus activity recorded"
+        return "\n".join(lines)
+
+
+stats = Stats()
+
+
+def _open_socket(address: str) -> socket.socket:
+    """Connects to a Livestatus UNIX socket path, or to 'tcp:host:port'"""
+    if address.startswith("tcp:"):
+        host, port = address[len("tcp:"):].rsplit(":", 1)
+        return socket.create_connection((host, int(port)))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class LivestatusPool:
+    """
+    Keeps idle KeepAlive connections to a Livestatus socket for reuse, path is a UNIX
+    socket path or 'tcp:host:port'
+
+    Every query is sent with 'KeepAlive: on' and 'ResponseHeader: fixed16' so the reply
+    length is known and the connection can carry the next query.  A reused connection
+    which turns out to be dead is discarded and the query retried on a fresh one
+    """
+
+    def __init__(self, path: str, size: int = 4):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        return _open_socket(self.path)
+
+    def acquire(self) -> [socket.socket, bool]:
+        """Returns an idle connection, or a new one, and whether it was reused"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def release(self, sock: socket.socket):
+        """Returns a healthy connection to the pool, closing it if the pool is full"""
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(sock)
+                return
+        sock.close()
+
+    def close(self):
+        """Closes all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sock in idle:
+            sock.close()
+
+    def send(self, request: bytes):
+        """Sends requests which get no reply, such as COMMANDs, on a fresh connection"""
+        # an idle connection the server has dropped can swallow a write without error,
+        # so commands never go over a reused one
+        started = time.perf_counter() if instrument else 0
+        sock = self._connect()
+        try:
+            sock.sendall(request)
+            sock.shutdown(socket.SHUT_WR)
+        finally:
+            sock.close()
+        if instrument:
+            stats.observe("command_send", time.perf_counter() - started)
+
+    def _exchange(self, request: bytes) -> [socket.socket, int, int]:
+        """Sends a request and reads the fixed16 header, returns socket, code and length"""
+        while True:
+            sock, reused = self.acquire()
+            try:
+                sock.sendall(request)
+                header = bytes(_recv_exact(sock, 16))
+                return sock, int(header[0:3]), int(header[4:15])
+            except (OSError, ValueError):
+                sock.close()
+                if reused:
+                    if instrument:
+                        stats.count("reconnects")
+                    continue
+                raise
+
+    def query(self, request: bytes) -> [int, memoryview]:
+        """
+        Sends a complete LQL request, returns the status code and reply body
+
+        The body is read straight into one buffer sized from the fixed16 header and
+        returned as a view of it, without further copies
+        """
+        started = time.perf_counter() if instrument else 0
+        sock, code, length = self._exchange(request)
+        try:
+            body = _recv_exact(sock, length)
+        except OSError:
+            sock.close()
+            raise
+        self.release(sock)
+        if instrument:
+            _record_query(started, length)
+        return code, body
+
+    def stream(self, request: bytes, chunk_size: int = 65536):
+        """
+        Sends a complete LQL request, yields the status code and then the reply body in
+        chunks as they arrive.  A connection left with unread reply is closed, not reused
+
+        Chunks are views of one buffer of at most chunk_size bytes which is filled again
+        for the next chunk, so each must be consumed, or copied, before asking for more
+        """
+        started = time.perf_counter() if instrument else 0
+        sock, code, remaining = self._exchange(request)
+        length = remaining
+        buffer = memoryview(bytearray(min(remaining, chunk_size)))
+        try:
+            yield code
+            while remaining > 0:
+                received = sock.recv_into(buffer, min(remaining, len(buffer)))
+                if received == 0:
+                    raise ConnectionError("livestatus connection closed mid-reply")
+                remaining -= received
+                yield buffer[:received]
+        finally:
+            if remaining > 0:
+                sock.close()
+            else:
+                self.release(sock)
+            if instrument:
+                _record_query(started, length - remaining)
+
+
+def _record_query(started: float, reply_bytes: int):
+    stats.observe("livestatus_query", time.perf_counter() - started)
+    stats.count("reply_bytes", reply_bytes)
+
+
+def _recv_exact(sock: socket.socket, length: int) -> memoryview:
+    """
+    Reads exactly length bytes into a buffer allocated once, returns a view of it.
+    Raises ConnectionError if the peer hangs up
+    """
+    view = memoryview(bytearray(length))
+    filled = 0
+    while filled < length:
+        received = sock.recv_into(view[filled:])
+        if received == 0:
+            raise ConnectionError("livestatus connection closed mid-reply")
+        filled += received
+    return view
+
+
+# the site whose endpoints queries and commands go to, set by _on_sites while an
+# operation runs for one site's share of the targets: None outside of that, '' for
+# the default endpoints above config.sites
+_site = contextvars.ContextVar("site", default=None)
+
+
+def _site_setting(key: str, default):
+    """Returns a setting of the current site, default when it has none"""
+    site = _site.get()
+    return config.sites[site].get(key, default) if site else default
+
+
+def _livestatus_path() -> str:
+    return _site_setting("livestatus", config.env_livestatus)
+
+
+def _cmdpipe_path() -> str:
+    return _site_setting("cmdpipe", config.env_cmdpipe)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def livestatus_pool(path: str = None) -> LivestatusPool:
+    """Returns the shared connection pool for a socket path, default the current site's"""
+    path = path or _livestatus_path()
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = LivestatusPool(path, max(config.pool_size, concurrency))
+        return _pools[path]
+
+
+@atexit.register
+def _close_pools():
+    for pool in list(_pools.values()):
+        pool.close()
+
+
+def _lql_request(query: list) -> bytes:
+    """Combines LQL statements into a KeepAlive request with a fixed16 response header"""
+    statements = list(query)
+    statements.append("KeepAlive: on")
+    statements.append("ResponseHeader: fixed16")
+    ls_query = "\n".join(statements) + "\n\n"
+    if debug:
+        print("DEBUG(livestatus_query):", ls_query)
+    return ls_query.encode()
+
+
+def _test_reply() -> str:
+    if debug_force_fail:
+            return "not_expected"
+    return "expected_result"
+
+
+def _reply_text(code: int, reply) -> str:
+    """Decodes a reply body, bytes or a view of one, or returns 'query_failed'"""
+    if code != 200:
+        if debug:
+            print("DEBUG(livestatus_query):", code, str(reply, "utf-8", "replace"))
+        return 'query_failed'
+    return str(reply, "utf-8")
+
+
 def livestatus_query(query: list = ["GET status"]) -> str:
     """
     Executes a Livestatus query and returns the result
 
-    The query should be provided as a list of Livestatus Query Language statements
-    which will be combined in the order they are supplied
+    The query should be provided as a list of Livestatus Query Language statements
+    which will be combined in the order they are supplied
+    """
+    # This was roughly lifted from mathias-kettner.com - live_example.py
+    # original version allowed tcp or unix socket, for the latter automatic
+    # detection by OMD config.  I assume a configured path for a unix socket,
+    # or tcp:host:port, for each site.  Connections come from a KeepAlive pool,
+    # see LivestatusPool
+    request = _lql_request(query)
+    if test_mode:
+        return _test_reply()
+    try:
+        code, reply = livestatus_pool().query(request)
+    except (OSError, ValueError):
+        return 'socket_not_found'
+    return _reply_text(code, reply)
+
+
+class _JSONRows:
+    """
+    Incrementally decodes a Livestatus json reply, a list of lists, fed in byte chunks
+
+    feed() returns the rows completed by each chunk, so only a partial row is ever held
+    """
+
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._started = False
+        # whether the closing ] of the list has been seen
+        self.complete = False
+
+    def feed(self, chunk: bytes) -> list:
+        buffer = self._buffer + self._text.decode(chunk)
+        rows = []
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if buffer[position] == "]":
+                self.complete = self._started
+                break
+            if not self._started:
+                if buffer[position] != "[":
+                    raise ValueError("livestatus json reply is not a list")
+                self._started = True
+                position += 1
+                continue
+            try:
+                row, position = self._decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            rows.append(row)
+        self._buffer = buffer[position:]
+        return rows
+
+
+def _row_type(header: list):
+    return collections.namedtuple("Row", header, rename=True)
+
+
+def livestatus_rows(query: list):
+    """
+    Executes a Livestatus query and yields the result rows as they arrive
+
+    The query is sent with 'OutputFormat: json' and 'ColumnHeaders: on'; each row is a
+    named tuple with a field per column, eg row.host_name.  The reply is parsed
+    incrementally, so large replies are consumed in constant memory.  Nothing is
+    yielded if the socket can't be reached or the query fails
+    """
+    try:
+        yield from livestatus_rows_checked(query)
+    except (OSError, ValueError) as error:
+        if debug:
+            print("DEBUG(livestatus_rows):", error)
+
+
+def livestatus_rows_checked(query: list):
+    """
+    livestatus_rows for callers which must tell a failed query from an empty one:
+    raises OSError if the socket can't be reached or the reply is cut short and
+    ValueError if the query fails or the reply isn't a complete json list
+    """
+    request = _lql_request(list(query) + ["OutputFormat: json", "ColumnHeaders: on"])
+    if test_mode:
+        return
+    decoder = _JSONRows()
+    row_type = None
+    reply = livestatus_pool().stream(request)
+    try:
+        code = next(reply)
+        if code != 200:
+            # chunks share one buffer, so each is copied before the next is read
+            body = b"".join(bytes(chunk) for chunk in reply)
+            _reply_text(code, body)
+            raise ValueError("livestatus query failed: " + str(code) + " " + str(body, "utf-8", "replace").strip())
+        for chunk in reply:
+            for row in decoder.feed(chunk):
+                if row_type is None:
+                    row_type = _row_type(row)
+                    continue
+                yield row_type(*row)
+    finally:
+        reply.close()
+    if not decoder.complete:
+        raise ValueError("livestatus json reply is incomplete")
+
+
+def _rows_text(rows) -> str:
+    """Renders rows like the default csv output format, for matching raw queries"""
+    lines = []
+    for row in rows:
+        lines.append(";".join(str(value) for value in row) + "\n")
+    return "".join(lines)
+
+
+def _run_polls(polls: list):
+    """
+    Runs (query, handler) pairs with up to djlivestatus.concurrency queries in flight
+
+    Handlers are called with an iterable of the rows of their query's reply, see
+    livestatus_rows.  Queries are spread over a bounded thread pool, handlers are called
+    in order on the calling thread so they never race each other.  Rows reach them in
+    batches through a bounded queue per query, so replies are streamed, not held whole
+    """
+    if concurrency <= 1 or len(polls) <= 1:
+        for query, handle in polls:
+            handle(livestatus_rows(query))
+        return
+    workers = min(concurrency, len(polls))
+    queues = [queue.Queue(maxsize=_poll_batches) for _poll in polls]
+    stop = threading.Event()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            # each query runs in a copy of the caller's context, so on the caller's site
+            for (query, _handle), batches in zip(polls, queues):
+                executor.submit(contextvars.copy_context().run, _feed_rows, query, batches, stop)
+            for (_query, handle), batches in zip(polls, queues):
+                _handle_batches(handle, batches.get)
+        finally:
+            # a failed handler stops the workers rather than waiting for queues to drain
+            stop.set()
+
+
+# rows per batch handed from a query to its handler, and batches queued per query
+_poll_batch = 1000
+_poll_batches = 2
+
+
+def _feed_rows(query: list, batches: queue.Queue, stop: threading.Event):
+    """Puts the rows of a query's reply on batches, then None or the error, until stop"""
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    if stop.is_set():
+        return
+    try:
+        batch = []
+        for row in livestatus_rows(query):
+            batch.append(row)
+            if len(batch) == _poll_batch:
+                if not put(batch):
+                    return
+                batch = []
+        if batch and not put(batch):
+            return
+    except Exception as error:
+        put(error)
+        return
+    put(None)
+
+
+def _handle_batches(handle, get):
+    """Calls a handler with the rows of the batches get returns, up to None, raising errors"""
+    def rows():
+        while True:
+            batch = get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+
+    remaining = rows()
+    handle(remaining)
+    # a handler may stop early, the rest of its reply is read so its query finishes
+    for _row in remaining:
+        pass
+
+
+def _pack_lines(lines: list, limit: int) -> list:
+    """Packs whole lines into as few buffers as possible, each at most limit bytes"""
+    buffers = []
+    current = b""
+    for line in lines:
+        if current and len(current) + len(line) > limit:
+            buffers.append(current)
+            current = b""
+        current += line
+    if current:
+        buffers.append(current)
+    return buffers
+
+
+def _command_payload(commands: list, transport: str) -> list:
+    """Returns the buffers to write for a batch of commands on the given transport"""
+    utimestamp = str(int(time.time()))
+    if debug:
+        for command in commands:
+            print("DEBUG(submit_commands):", transport, command)
+    if transport == "livestatus":
+        # each COMMAND is a request of its own, so they are separated by a blank line
+        request = ""
+        for command in commands:
+            request += "COMMAND [" + utimestamp + "] " + command + "\n\n"
+        return [request.encode()]
+    lines = []
+    for command in commands:
+        lines.append(("[" + utimestamp + "] " + command + "\n").encode())
+    return _pack_lines(lines, select.PIPE_BUF)
+
+
+def _write_pipe(buffers: list, path: str):
+    cmd_pipe = os.open(path, os.O_WRONLY | os.O_APPEND)
+    try:
+        for buffer in buffers:
+            view = memoryview(buffer)
+            while view:
+                started = time.perf_counter() if instrument else 0
+                written = os.write(cmd_pipe, view)
+                if instrument:
+                    stats.observe("pipe_write", time.perf_counter() - started)
+                    stats.count("pipe_bytes", written)
+                view = view[written:]
+    finally:
+        os.close(cmd_pipe)
+
+
+def submit_commands(commands: list, transport: str = None) -> bool:
+    """
+    Submits Nagios external commands in as few writes as possible
+
+    transport is 'pipe' to write the command pipe or 'livestatus' to send COMMAND
+    requests over one Livestatus connection, default the current site's, see
+    config.sites.  Pipe writes are kept within PIPE_BUF so lines from concurrent
+    writers can't interleave
+    """
+    # provide commands as "NAGIOS_EXTERNAL_COMMAND;param1;param2;etc"
+    transport = transport or _site_setting("transport", config.command_transport)
+    buffers = _command_payload(commands, transport)
+    if test_mode or commands == []:
+        return True
+    if instrument:
+        stats.count("commands", len(commands))
+    try:
+        if transport == "livestatus":
+            livestatus_pool().send(buffers[0])
+        else:
+            _write_pipe(buffers, _cmdpipe_path())
+    except OSError:
+        return False
+    return True
+
+
+def _confirmed(pattern, reply: str) -> bool:
+    pattern_match = pattern.match(reply)
+    return pattern_match is not None and pattern_match.group() != ""
+
+
+_expectations = {}
+
+
+def _expectation(expect):
+    """
+    Returns a predicate for a confirmation reply: expect itself if it's callable,
+    otherwise a regex which must match a non-empty start of the reply, compiled once
+    """
+    if callable(expect):
+        return expect
+    if expect not in _expectations:
+        pattern = re.compile(expect)
+        _expectations[expect] = lambda reply: _confirmed(pattern, reply)
+    return _expectations[expect]
+
+
+confirm_key_columns = {
+    "hosts": ["name"],
+    "services": ["host_name", "description"],
+    "downtimes": ["host_name", "service_description"],
+}
+
+
+def _target_filters(table: str, targets: list) -> list:
+    """Returns LQL statements matching any of the given confirmation targets"""
+    key_columns = confirm_key_columns[table]
+    if len(key_columns) == 1:
+        return _or_filters(key_columns[0], [target[0] for target in targets])
+    query = []
+    for target in targets:
+        for column, value in zip(key_columns, target):
+            query.append("Filter: " + column + " = " + value)
+        query.append("And: " + str(len(key_columns)))
+    query.append("Or: " + str(len(targets)))
+    return query
+
+
+def _batch_polls(table: str, filters: tuple, column: str, keys: list, pending: dict,
+                 results: dict, fallback: list) -> list:
+    """
+    Returns (query, handler) pairs confirming one group, a query per chunk of targets
+
+    Hosts and services are one row per target, so when every key in the group has a
+    confirmation 'value' and config.aggregate_confirm is on, a chunk is first counted
+    with Stats:.  If every target matches they're confirmed with their value, otherwise
+    the chunk's row query is added to fallback to find which did
+    """
+    key_columns = confirm_key_columns[table]
+    columns = key_columns + ([column] if column not in key_columns else [])
+    by_target = {}
+    for key in keys:
+        by_target.setdefault(pending[key][1]["target"], []).append(key)
+
+    def handler(chunk):
+        def handle(rows):
+            values = {}
+            for row in rows:
+                target = tuple(getattr(row, key_column) for key_column in key_columns)
+                values.setdefault(target, []).append(str(getattr(row, column)))
+            for target in chunk:
+                for key in by_target[target]:
+                    expect = _expectation(pending[key][2])
+                    matched = [value for value in values.get(target, []) if expect(value)]
+                    if matched:
+                        results[key] = ",".join(matched)
+                        del pending[key]
+        return handle
+
+    def counter(chunk, rows_query):
+        def handle(rows):
+            counts = list(rows)
+            if counts == [] or int(counts[0][0]) != len(chunk):
+                fallback.append((rows_query, handler(chunk)))
+                return
+            for target in chunk:
+                for key in by_target[target]:
+                    results[key] = pending[key][1]["value"]
+                    del pending[key]
+        return handle
+
+    aggregate = config.aggregate_confirm and table in ("hosts", "services")
+    aggregate = aggregate and all("value" in pending[key][1] for key in keys)
+    polls = []
+    for chunk in _chunks(list(by_target), config.preflight_chunk_size):
+        query = ["GET " + table] + list(filters) + _target_filters(table, chunk)
+        rows_query = query + ["Columns: " + " ".join(columns)]
+        if aggregate:
+            polls.append((query + ["Stats: state >= 0"], counter(chunk, rows_query)))
+        else:
+            polls.append((rows_query, handler(chunk)))
+    return polls
+
+
+def _confirm_polls(pending: dict, results: dict, fallback: list) -> list:
+    """
+    Returns the (query, handler) pairs for one confirmation poll of all pending keys,
+    handlers may add row queries to fallback, see _batch_polls
+    """
+    polls = []
+    groups = {}
+    for key, (_command, confirm, expect) in pending.items():
+        if isinstance(confirm, dict):
+            group = confirm["table"], tuple(confirm["filters"]), confirm["column"]
+            groups.setdefault(group, []).append(key)
+            continue
+
+        def handle(rows, key=key, expect=_expectation(expect)):
+            reply = _rows_text(rows)
+            if expect(reply):
+                results[key] = reply
+                del pending[key]
+        polls.append((confirm, handle))
+    for (table, filters, column), keys in groups.items():
+        polls += _batch_polls(table, filters, column, keys, pending, results, fallback)
+    return polls
+
+
+def _confirm_poll(pending: dict, results: dict):
+    """Checks every pending key once, in bulk"""
+    fallback = []
+    _run_polls(_confirm_polls(pending, results, fallback))
+    _run_polls(fallback)
+
+
+def _backoff(confirm_count: int) -> float:
+    return config.confirm_backoff[min(confirm_count, len(config.confirm_backoff) - 1)]
+
+
+def _wait_query(pending: dict) -> list:
+    """
+    Returns a query which blocks until Livestatus sees the last pending command's effect
+    on its host or service, or config.confirm_wait_timeout passes, or None if it has no
+    wait spec.  Commands are processed in the order they were written, so the others
+    are usually done by then
+    """
+    if config.confirm_wait_timeout <= 0 or pending == {}:
+        return None
+    confirm = pending[next(reversed(pending))][1]
+    if not isinstance(confirm, dict) or "wait" not in confirm:
+        return None
+    table, trigger, conditions = confirm["wait"]
+    target = [part for part in confirm["target"] if part != ""]
+    query = ["GET " + table, "WaitObject: " + ";".join(target)] + list(conditions)
+    query.append("WaitTrigger: " + trigger)
+    query.append("WaitTimeout: " + str(int(config.confirm_wait_timeout * 1000)))
+    if table == "hosts":
+        query.append("Filter: name = " + target[0])
+        query.append("Columns: name")
+    else:
+        query.append("Filter: host_name = " + target[0])
+        query.append("Filter: description = " + target[1])
+        query.append("Columns: host_name")
+    return query
+
+
+def confirm_commands(pending: dict, results: dict, retry_confirm: int = 3):
+    """
+    Polls until every pending command is confirmed or retry_confirm + 1 polls have passed
+
+    pending maps a result key to (command, confirm, expect), where confirm is either
+    a raw LQL query list, or a dict with 'table' (hosts, services or downtimes), 'target'
+    (key column values), 'filters' and 'column', and expect is a regex or a predicate
+    on the reply.  Dict confirmations sharing a table,
+    filters and column are checked together with one query per poll.  The first poll
+    follows a Livestatus WaitTrigger query which blocks until the last command has taken
+    effect, see _wait_query, later ones are spaced by config.confirm_backoff; confirmed
+    keys get their reply in results and are removed from pending
+    """
+    confirm_count = 0
+    wait = _wait_query(pending)
+    if wait is not None:
+        started = time.perf_counter() if instrument else 0
+        for _row in livestatus_rows(wait):
+            pass
+        if instrument:
+            stats.observe("confirm_wait", time.perf_counter() - started)
+    while pending and confirm_count <= retry_confirm:
+        # the first poll after a wait query doesn't sleep
+        slept = 0
+        if wait is None or confirm_count > 0:
+            slept = _backoff(confirm_count)
+            time.sleep(slept)
+        started = time.perf_counter() if instrument else 0
+        _confirm_poll(pending, results)
+        if instrument:
+            _record_poll(started, slept)
+        confirm_count += 1
+
+
+def _record_poll(started: float, slept: float):
+    stats.observe("confirm_poll", time.perf_counter() - started)
+    stats.count("confirm_wait_seconds", slept)
+
+
+def _test_results(pending: dict, results: dict) -> bool:
+    for key in pending:
+        results[key] = "expected_result"
+    return True
+
+
+def _unconfirmable(pending: dict, results: dict):
+    for key in list(pending):
+        if pending[key][1] == []:
+            results[key] = "command_unconfirmed"
+            del pending[key]
+
+
+def _failed(pending: dict, results: dict) -> bool:
+    for key in pending:
+        if debug:
+            print("DEBUG(execute_commands):", pending[key][0])
+            print("DEBUG(execute_commands):", pending[key][1])
+        results[key] = "command_failed"
+    return pending == {}
+
+
+def execute_commands(pending: dict, results: dict, retry_command: int = 3,
+                     retry_confirm: int = 3) -> bool:
+    """
+    Submits the commands for all pending targets together, then confirms them in bulk
+
+    pending maps a result key to (command, confirm, expect_regex), see confirm_commands.
+    Each key's reply or status message is stored in results; commands which aren't
+    confirmed are resubmitted as a batch, up to retry_command times.  Returns whether
+    all succeeded
+    """
+    if test_mode:
+        return _test_results(pending, results)
+    pending = dict(pending)
+    command_count = 0
+    while pending and command_count <= retry_command:
+        if instrument and command_count > 0:
+            stats.count("command_retries", len(pending))
+        commands = [command for command, _confirm, _expect in pending.values()]
+        if not submit_commands(commands):
+            break
+        _unconfirmable(pending, results)
+        confirm_commands(pending, results, retry_confirm)
+        command_count += 1
+    return _failed(pending, results)
+
+
+def _execute_plan(all_good: bool, results: dict, pending: dict, name: str) -> [bool, dict]:
+    succeeded = submit_deferred(name, pending, results) if defer else execute_commands(pending, results)
+    if not succeeded:
+        all_good = False
+    return all_good, results
+
+
+# the journal holds commands submitted with defer, one JSON line per batch: the
+# operation, the site and time it was submitted, its confirmation filters and an entry
+# per target of [key, command, confirmation target, confirmation value].  The rest
+# of the confirmation, and the expectation, come from the operation table
+def _journal_line(name: str, pending: dict) -> str:
+    filters = next(iter(pending.values()))[1]["filters"]
+    entries = [[key, command, list(confirm["target"]), confirm.get("value")]
+               for key, (command, confirm, _expect) in pending.items()]
+    record = {"operation": name, "site": _site.get() or "", "submitted": int(time.time()), "filters": filters,
+              "entries": entries}
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def _journal_append(line: str, path: str = None):
+    with open(path or config.journal_path, "a") as journal:
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        journal.write(line)
+
+
+def submit_deferred(name: str, pending: dict, results: dict) -> bool:
+    """
+    Submits the pending commands of an operation together and records them in the
+    journal instead of confirming them, see verify_journal.  Each key's result is
+    'command_submitted', or 'command_failed' if they couldn't be submitted
+    """
+    if test_mode:
+        return _test_results(pending, results)
+    if pending == {}:
+        return True
+    if not submit_commands([command for command, _confirm, _expect in pending.values()]):
+        return _failed(pending, results)
+    _journal_append(_journal_line(name, pending))
+    for key in pending:
+        results[key] = "command_submitted"
+    return True
+
+
+def _journal_pending(records: list) -> dict:
+    """Rebuilds pending confirmations from journal records, keyed by (record index, key)"""
+    pending = {}
+    for index, record in enumerate(records):
+        operation = operations[record["operation"]]
+        confirm = operation["confirm"]
+        for key, command, target, value in record["entries"]:
+            spec = {"table": confirm["table"], "column": confirm["column"], "filters": record["filters"],
+                    "target": tuple(target)}
+            if value is not None:
+                spec["value"] = value
+            pending[index, key] = command, spec, operation["expect"]
+    return pending
+
+
+def _journal_results(records: list, confirmed: dict, pending: dict) -> [bool, dict, list]:
+    """
+    Returns whether every entry was confirmed, the result of each as 'operation;key', and
+    the records still to verify: those with unconfirmed entries, less entries older than
+    config.journal_max_age
+    """
+    results = {}
+    for index, key in confirmed:
+        results[records[index]["operation"] + ";" + key] = confirmed[index, key]
+    # a target journaled more than once reports its failure over its success
+    for index, key in pending:
+        results[records[index]["operation"] + ";" + key] = "command_failed"
+    oldest = int(time.time()) - config.journal_max_age
+    remaining = []
+    for index, record in enumerate(records):
+        entries = [entry for entry in record["entries"] if (index, entry[0]) in pending]
+        if entries and record["submitted"] >= oldest:
+            remaining.append(dict(record, entries=entries))
+    return pending == {}, results, remaining
+
+
+def _journal_by_site(records: list, pending: dict) -> dict:
+    """
+    Splits pending journal entries by the site they were submitted to.  Entries for a
+    site no longer in config.sites can't be checked, so they're left out and stay
+    pending, reported as 'command_failed' until config.journal_max_age expires them
+    """
+    by_site = {}
+    for index, key in pending:
+        site = records[index].get("site", "")
+        if site and site not in config.sites:
+            if debug:
+                print("DEBUG(_journal_by_site): unknown site", site, "for", key)
+            continue
+        by_site.setdefault(site, {})[index, key] = pending[index, key]
+    return by_site
+
+
+def _poll_confirmed(pending: dict) -> dict:
+    confirmed = {}
+    _confirm_poll(pending, confirmed)
+    return confirmed
+
+
+def _read_journal(journal) -> list:
+    journal.seek(0)
+    return [json.loads(line) for line in journal if line.strip()]
+
+
+def _rewrite_journal(journal, records: list):
+    journal.seek(0)
+    journal.truncate()
+    journal.writelines(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+
+
+def verify_journal(path: str = None) -> [bool, dict]:
+    """
+    Checks every command in the journal once, in bulk queries, returns bool indicating
+    if all have taken effect and a dict of 'operation;key' and their reply or
+    'command_failed'.  Confirmed entries are removed from the journal, failed ones are
+    kept to be verified again until they're config.journal_max_age seconds old
+    """
+    path = path or config.journal_path
+    if not os.path.exists(path):
+        return True, {}
+    with open(path, "r+") as journal:
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        records = _read_journal(journal)
+        pending = _journal_pending(records)
+        if test_mode:
+            return True, {records[index]["operation"] + ";" + key: "expected_result" for index, key in pending}
+        confirmed = {}
+        for site_confirmed in _on_sites(_poll_confirmed, _journal_by_site(records, pending)):
+            confirmed.update(site_confirmed)
+        for key in confirmed:
+            del pending[key]
+        all_good, results, remaining = _journal_results(records, confirmed, pending)
+        _rewrite_journal(journal, remaining)
+    return all_good, results
+
+
+def nagios_command(command: str, confirm_query: list = [], expect_regex: str = ".*",
+                    retry_command: int = 3, retry_confirm: int = 3) -> [bool, str]:
+    """Wraps and executes a raw Nagios external command, optionally confirming the result"""
+    # provide command as "NAGIOS_EXTERNAL_COMMAND;param1;param2;etc"
+    results = {}
+    success = execute_commands({command: (command, confirm_query, expect_regex)}, results,
+                               retry_command, retry_confirm)
+    return success, results[command]
+
+
+# config.sites splits an estate across several Nagios instances.  The public functions
+# route their hosts or hostgroups to sites, see route_hosts, and run once per site, all
+# sites at once, with the site set in the context so that queries and commands go to
+# its endpoints; replies are merged as if one instance had answered
+def _fans_out() -> bool:
+    return bool(config.sites) and _site.get() is None
+
+
+def _site_call(site: str, function, items):
+    _site.set(site)
+    return function(items)
+
+
+def _on_sites(function, by_site: dict) -> list:
+    """
+    Calls function with the items of each site in by_site, in parallel, each in a copy of
+    the caller's context set to that site.  Returns the replies in the order of by_site
+    """
+    if len(by_site) <= 1:
+        return [contextvars.copy_context().run(_site_call, site, function, items)
+                for site, items in by_site.items()]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(by_site)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, _site_call, site, function, items)
+                   for site, items in by_site.items()]
+        return [future.result() for future in futures]
+
+
+def _merge_results(replies: list) -> [bool, dict]:
+    """Merges the (all_good, results) of each site, whose result keys never overlap"""
+    all_good = True
+    results = {}
+    for site_good, site_results in replies:
+        all_good = all_good and site_good
+        results.update(site_results)
+    return all_good, results
+
+
+def _member_sites() -> dict:
+    """Returns the site of each member of the hostgroups in config.site_hostgroups"""
+    hostgroups_of = {}
+    for hostgroup, site in config.site_hostgroups.items():
+        hostgroups_of.setdefault(site, []).append(hostgroup)
+    sites = {}
+    for site, members in zip(hostgroups_of, _on_sites(hosts_inhostgroups, hostgroups_of)):
+        for hostname in members:
+            sites.setdefault(hostname, site)
+    return sites
+
+
+def route_hosts(hostnames: list) -> dict:
+    """
+    Returns {site: hostnames} for config.sites.  A host goes to the site config.site_hosts
+    gives it, else that of its longest prefix in config.site_prefixes, else that of a
+    hostgroup in config.site_hostgroups it's in, else '' for the default endpoints.
+    Hostgroup members are fetched from their sites, one query each, only if needed
+    """
+    prefixes = sorted(config.site_prefixes, key=len, reverse=True)
+    routes = {}
+    unrouted = []
+    for hostname in hostnames:
+        hostname = str(hostname)
+        site = config.site_hosts.get(hostname)
+        if site is None:
+            site = next((config.site_prefixes[prefix] for prefix in prefixes if hostname.startswith(prefix)), None)
+        if site is None:
+            unrouted.append(hostname)
+            continue
+        routes.setdefault(site, []).append(hostname)
+    member_sites = _member_sites() if unrouted and config.site_hostgroups else {}
+    for hostname in unrouted:
+        routes.setdefault(member_sites.get(hostname, ""), []).append(hostname)
+    return routes
+
+
+def route_hostgroups(hostgroups: list) -> dict:
+    """
+    Returns {site: hostgroups} by config.site_hostgroups.  A hostgroup it doesn't map
+    may be on any site, so like a servicegroup it goes to every site, '' for the default
+    endpoints and each of config.sites, and the sites' replies are merged
+    """
+    routes = {}
+    everywhere = [""] + list(config.sites)
+    for hostgroup in hostgroups:
+        mapped = config.site_hostgroups.get(str(hostgroup))
+        for site in everywhere if mapped is None else [mapped]:
+            routes.setdefault(site, []).append(str(hostgroup))
+    return routes
+
+
+def hosts_inhostgroups(hostgroups: list) -> list:
+    """Returns a list of hosts in the given hostgroup"""
+    if _fans_out():
+        hosts = {}
+        for members in _on_sites(hosts_inhostgroups, route_hostgroups(hostgroups)):
+            hosts.update(dict.fromkeys(members, True))
+        return list(hosts)
+    if test_mode:
+        if debug_force_fail:
+            return []
+        return ['dc1web01', 'dc1web02', 'dc1web03']
+    if hostgroups == []:
+        return []
+    # one row per hostgroup.  Nagios adds the hosts of nested hostgroup_members to
+    # members when it loads its configuration, so they needn't be followed here
+    query = ["GET hostgroups"] + _or_filters("name", [str(hostgroup) for hostgroup in hostgroups])
+    query.append("Columns: members")
+    # a host in several of the hostgroups is listed by each
+    hosts = {}
+    for row in livestatus_rows(query):
+        hosts.update(dict.fromkeys(row.members, True))
+    return list(hosts)
+
+
+def services_inservicegroups(servicegroups: list) -> list:
+    """
+    Returns the (hostname, service) pairs in the given servicegroups, from one query to
+    each site as a servicegroup isn't routed to one
+    """
+    if _fans_out():
+        pairs = {}
+        everywhere = dict.fromkeys([""] + list(config.sites), servicegroups)
+        for members in _on_sites(services_inservicegroups, everywhere):
+            pairs.update(dict.fromkeys(members, True))
+        return list(pairs)
+    if test_mode:
+        if debug_force_fail:
+            return []
+        return [('dc1web01', 'uptime_status'), ('dc1web02', 'ntp_time')]
+    if servicegroups == []:
+        return []
+    # like hostgroups, nested servicegroup_members are already in members
+    query = ["GET servicegroups"] + _or_filters("name", [str(servicegroup) for servicegroup in servicegroups])
+    query.append("Columns: members")
+    pairs = {}
+    for row in livestatus_rows(query):
+        for hostname, service in row.members:
+            pairs[(hostname, service)] = True
+    return list(pairs)
+
+
+def host_groups() -> dict:
+    """Returns every host and the hostgroups it's in, from one query to each site"""
+    if _fans_out():
+        groups_of = {}
+        everywhere = dict.fromkeys([""] + list(config.sites))
+        for site_groups in _on_sites(lambda _items: host_groups(), everywhere):
+            groups_of.update(site_groups)
+        return groups_of
+    if test_mode:
+        if debug_force_fail:
+            return {}
+        return {'dc1web01': ['web'], 'dc1web02': ['web'], 'dc1web03': ['web']}
+    groups_of = {}
+    for row in livestatus_rows(["GET hosts", "Columns: name groups"]):
+        groups_of[row.name] = row.groups
+    return groups_of
+
+def host_exists(hostname: str) -> bool:
+    """Returns a bool indicating whether a hostname exists"""
+    query = []
+    query.append("GET hosts")
+    query.append("Filter: name = " + hostname)
+    query.append("Columns: name")
+    reply = [row[0] for row in livestatus_rows(query)]
+    if test_mode:
+        if debug_force_fail:
+            return False
+        return True
+    if hostname in reply:
+        return True
+    return False
+
+
+def hostservice_exists(hostname: str, service: str) -> bool:
+    """Returns a bool indicating whether a service on a hostname exists"""
+    query = []
+    query.append("GET services")
+    query.append("Filter: host_name = " + hostname)
+    query.append("Filter: description = " + service)
+    query.append("Columns: host_name")
+    reply = [row[0] for row in livestatus_rows(query)]
+    if test_mode:
+        if debug_force_fail:
+            return False
+        return True
+    if hostname in reply:
+        return True
+    return False
+
+
+def host_problem_exists(hostname: str) -> bool:
+    """Returns a bool indicating whether a hostname is in a problem state"""
+    query = []
+    query.append("GET hosts")
+    query.append("Filter: name = " + hostname)
+    query.append("Filter: state >= 1")
+    query.append("Columns: name")
+    reply = [row[0] for row in livestatus_rows(query)]
+    if test_mode:
+        if debug_force_fail:
+            return False
+        return True
+    if hostname in reply:
+        return True
+    return False
+
+
+def hostservice_problem_exists(hostname: str, service: str) -> bool:
+    """Returns a bool indicating whether a service on a hostname is in a problem state"""
+    query = []
+    query.append("GET services")
+    query.append("Filter: host_name = " + hostname)
+    query.append("Filter: description = " + service)
+    query.append("Filter: state >= 1")
+    query.append("Columns: host_name")
+    reply = [row[0] for row in livestatus_rows(query)]
+    if test_mode:
+        if debug_force_fail:
+            return False
+        return True
+    if hostname in reply:
+        return True
+    return False
+
+
+preflight_columns = ["state", "acknowledged", "checks_enabled", "notifications_enabled"]
+
+
+def _chunks(items: list, size: int) -> list:
+    """Splits a list into a list of lists of at most size items"""
+    size = max(1, int(size))
+    return [items[index:index + size] for index in range(0, len(items), size)]
+
+
+def _or_filters(column: str, values: list, operator: str = "=") -> list:
+    """Returns LQL statements matching any of the given values for a column"""
+    query = []
+    for value in values:
+        query.append("Filter: " + column + " " + operator + " " + str(value))
+    query.append("Or: " + str(len(values)))
+    return query
+
+
+def _state_of(row) -> dict:
+    """Returns the state columns of a preflight row"""
+    state = {}
+    for column in preflight_columns:
+        state[column] = int(getattr(row, column))
+    return state
+
+
+def _preflight_test(hostnames: list, services: list) -> dict:
+    found = {"hosts": {}, "services": {}}
+    if debug_force_fail:
+        return found
+    test_state = {"state": 1, "acknowledged": 0, "checks_enabled": 1, "notifications_enabled": 1}
+    for hostname in hostnames:
+        found["hosts"][hostname] = dict(test_state)
+        for service in services:
+            found["services"][(hostname, service)] = dict(test_state)
+    return found
+
+
+def _preflight_host_polls(hostnames: list, found: dict) -> list:
+    """Returns (query, handler) pairs filling found['hosts']"""
+    columns = ["name"] + preflight_columns
+
+    def handle(rows):
+        for row in rows:
+            found["hosts"][row.name] = _state_of(row)
+
+    polls = []
+    for chunk in _chunks(hostnames, config.preflight_chunk_size):
+        query = ["GET hosts"] + _or_filters("name", chunk)
+        query.append("Columns: " + " ".join(columns))
+        polls.append((query, handle))
+    return polls
+
+
+def _preflight_service_handler(found: dict):
+    def handle(rows):
+        for row in rows:
+            found["services"][(row.host_name, row.description)] = _state_of(row)
+    return handle
+
+
+def _preflight_service_polls(hostnames: list, services: list, found: dict) -> list:
+    """Returns (query, handler) pairs filling found['services'] for hosts already found"""
+    columns = ["host_name", "description"] + preflight_columns
+    handle = _preflight_service_handler(found)
+
+    # only existing hosts are worth asking about, and a host chunk is combined with
+    # each service chunk so no query carries more than two chunks of filters
+    polls = []
+    existing = [hostname for hostname in hostnames if hostname in found["hosts"]]
+    for host_chunk in _chunks(existing, config.preflight_chunk_size):
+        for service_chunk in _chunks(services, config.preflight_chunk_size):
+            query = ["GET services"]
+            query += _or_filters("host_name", host_chunk)
+            query += _or_filters("description", service_chunk)
+            query.append("Columns: " + " ".join(columns))
+            polls.append((query, handle))
+    return polls
+
+
+def _preflight_inventory(hostnames: list, services: list) -> dict:
+    """Answers existence from the inventory cache, state columns are left empty"""
+    found = {"hosts": {}, "services": {}}
+    with inventory.lock:
+        if not inventory.refresh():
+            return None
+        for hostname in inventory.existing_hosts(hostnames):
+            found["hosts"][hostname] = {}
+        if services != []:
+            for pair in inventory.existing_services(list(found["hosts"]), services):
+                found["services"][pair] = {}
+    return found
+
+
+def preflight(hostnames: list, services: list = [], live: bool = True) -> dict:
+    """
+    Fetches existence and state for all target hosts and services in bulk
+
+    Returns a dict with keys 'hosts', mapping hostname to its state columns, and
+    'services', mapping (hostname, service) likewise.  Targets which don't exist are
+    absent.  Filters are chunked to config.preflight_chunk_size per query, and the
+    chunks are queried concurrently, see _run_polls.  With live False, existence is
+    answered from djlivestatus.inventory when one is set, without state columns
+    """
+    hostnames = [str(hostname) for hostname in hostnames]
+    services = [str(service) for service in services]
+    if test_mode:
+        return _preflight_test(hostnames, services)
+    # the inventory caches the default endpoints only
+    if inventory is not None and not live and not _site.get():
+        found = _preflight_inventory(hostnames, services)
+        if found is not None:
+            return found
+    found = {"hosts": {}, "services": {}}
+    _run_polls(_preflight_host_polls(hostnames, found))
+    if services == []:
+        return found
+    _run_polls(_preflight_service_polls(hostnames, services, found))
+    return found
+
+
+def _pairs(pairs: list) -> list:
+    """Returns (hostname, service) pairs as strings, without repeats"""
+    return list(dict.fromkeys((str(hostname), str(service)) for hostname, service in pairs))
+
+
+def _pair_polls(pairs: list, statements: list, columns: list, handle) -> list:
+    """
+    Returns a (query, handler) pair per chunk of (hostname, service) pairs, filtering
+    services on exactly those pairs rather than every service on every host
+    """
+    polls = []
+    for chunk in _chunks(pairs, config.preflight_chunk_size):
+        query = ["GET services"] + _target_filters("services", chunk) + statements
+        polls.append((query + ["Columns: " + " ".join(columns)], handle))
+    return polls
+
+
+def _pairs_test(pairs: list) -> dict:
+    found = _preflight_test(list(dict.fromkeys(hostname for hostname, _service in pairs)), [])
+    for pair in pairs:
+        if pair[0] in found["hosts"]:
+            found["services"][pair] = dict(found["hosts"][pair[0]])
+    return found
+
+
+def _pairs_inventory(pairs: list) -> dict:
+    hostnames = list(dict.fromkeys(hostname for hostname, _service in pairs))
+    found = _preflight_inventory(hostnames, list(dict.fromkeys(service for _hostname, service in pairs)))
+    if found is not None:
+        wanted = set(pairs)
+        found["services"] = {pair: state for pair, state in found["services"].items() if pair in wanted}
+    return found
+
+
+def preflight_pairs(pairs: list, live: bool = True) -> dict:
+    """
+    Like preflight, for (hostname, service) pairs, eg the members of a servicegroup,
+    without checking the other services of their hosts
+    """
+    pairs = _pairs(pairs)
+    if test_mode:
+        return _pairs_test(pairs)
+    if inventory is not None and not live and not _site.get():
+        found = _pairs_inventory(pairs)
+        if found is not None:
+            return found
+    found = {"hosts": {}, "services": {}}
+    _run_polls(_preflight_host_polls(list(dict.fromkeys(hostname for hostname, _service in pairs)), found))
+    existing = [pair for pair in pairs if pair[0] in found["hosts"]]
+    columns = ["host_name", "description"] + preflight_columns
+    _run_polls(_pair_polls(existing, [], columns, _preflight_service_handler(found)))
+    return found
+
+
+def _selected(found: dict, host: str, service: str = None, mark: str = "selected"):
+    found["hosts"].setdefault(host, {})
+    if service is None:
+        found["hosts"][host] = {mark: True}
+    else:
+        found["services"][(host, service)] = {mark: True}
+
+
+def _marking_polls(operation: dict, filters: list, mark: str, hostnames: list, services: list,
+                   found: dict) -> list:
+    """Returns (query, handler) pairs marking the targets matching filters in found"""
+    if operation["targets"] == "hosts":
+        def handle(rows):
+            for row in rows:
+                _selected(found, row.name, mark=mark)
+        return [(["GET hosts"] + _or_filters("name", chunk) + filters + ["Columns: name"], handle)
+                for chunk in _chunks(hostnames, config.preflight_chunk_size)]
+
+    def handle(rows):
+        for row in rows:
+            _selected(found, row.host_name, row.description, mark)
+
+    polls = []
+    for host_chunk in _chunks(hostnames, config.preflight_chunk_size):
+        for service_chunk in _chunks(services, config.preflight_chunk_size):
+            query = ["GET services"] + _or_filters("host_name", host_chunk)
+            query += _or_filters("description", service_chunk) + filters
+            polls.append((query + ["Columns: host_name description"], handle))
+    return polls
+
+
+def _selection_polls(operation: dict, hostnames: list, services: list, found: dict) -> list:
+    """
+    Returns (query, handler) pairs adding the targets matching operation['select'] to
+    found, and those already in_state, eg acknowledged, marked so rather than selected
+    """
+    return (_marking_polls(operation, operation["select"], "selected", hostnames, services, found) +
+            _marking_polls(operation, operation["in_state"], "in_state", hostnames, services, found))
+
+
+def _unselected(operation: dict, hostnames: list, services: list, found: dict) -> [list, list, list]:
+    """
+    Returns the hosts and services to check for existence, and the (hostname, service)
+    pairs of targets which weren't selected
+    """
+    if operation["targets"] == "hosts":
+        return [hostname for hostname in hostnames if hostname not in found["hosts"]], [], []
+    rest = [(hostname, service) for hostname in hostnames for service in services
+            if (hostname, service) not in found["services"]]
+    rest_hosts = list(dict.fromkeys(hostname for hostname, _service in rest))
+    rest_services = list(dict.fromkeys(service for _hostname, service in rest))
+    return rest_hosts, rest_services, rest
+
+
+def _merge_existing(found: dict, existing: dict, rest: list):
+    """Adds the unselected targets which exist to found, without state"""
+    for hostname in existing["hosts"]:
+        found["hosts"].setdefault(hostname, {})
+    for pair in rest:
+        if pair in existing["services"]:
+            found["services"][pair] = {}
+
+
+def _select_test(operation: dict, hostnames: list, services: list) -> dict:
+    found = _preflight_test(hostnames, services if operation["targets"] == "services" else [])
+    for target_state in list(found["hosts"].values()) + list(found["services"].values()):
+        target_state["selected"] = True
+    return found
+
+
+def select_targets(operation: dict, hostnames: list, services: list = []) -> dict:
+    """
+    Finds the targets matching an operation's select filters with one query per chunk
+    of targets, eg unacknowledged problems for ack, and marks them 'selected'
+
+    Returns a dict like preflight.  The other targets only need to exist, to tell a
+    target which doesn't from one which isn't selected, so they're looked up like
+    preflight with live False, from the inventory when there is one
+    """
+    hostnames = [str(hostname) for hostname in hostnames]
+    services = [str(service) for service in services]
+    if test_mode:
+        return _select_test(operation, hostnames, services)
+    found = {"hosts": {}, "services": {}}
+    _run_polls(_selection_polls(operation, hostnames, services, found))
+    rest_hosts, rest_services, rest = _unselected(operation, hostnames, services, found)
+    if rest_hosts:
+        _merge_existing(found, preflight(rest_hosts, rest_services, live=False), rest)
+    return found
+
+
+def _group_selection_polls(operation: dict, hostgroups: list, services: list, found: dict) -> list:
+    """Returns (query, handler) pairs adding the targets in hostgroups matching operation['select']"""
+    if operation["targets"] == "hosts":
+        query = ["GET hosts"] + _or_filters("groups", hostgroups, ">=")
+        columns = ["Columns: name"]
+    else:
+        query = ["GET services"] + _or_filters("host_groups", hostgroups, ">=")
+        if services != []:
+            query += _or_filters("description", services)
+        columns = ["Columns: host_name description"]
+
+    def handle(rows):
+        for row in rows:
+            if operation["targets"] == "hosts":
+                _selected(found, row.name)
+            else:
+                _selected(found, row.host_name, row.description)
+
+    return [(query + operation["select"] + columns, handle)]
+
+
+def select_group_targets(operation: dict, hostgroups: list, services: list = []) -> dict:
+    """
+    Finds the targets in hostgroup(s) matching an operation's select filters with one
+    query, for services only those named in services unless it's empty.  Returns a
+    dict like preflight with every target marked 'selected'
+    """
+    hostgroups = [str(hostgroup) for hostgroup in hostgroups]
+    services = [str(service) for service in services]
+    if test_mode:
+        return _select_test(operation, hosts_inhostgroups(hostgroups), services)
+    found = {"hosts": {}, "services": {}}
+    _run_polls(_group_selection_polls(operation, hostgroups, services, found))
+    return found
+
+
+def _pair_selection_handler(found: dict, mark: str = "selected"):
+    def handle(rows):
+        for row in rows:
+            _selected(found, row.host_name, row.description, mark)
+    return handle
+
+
+def _pair_selection_polls(operation: dict, pairs: list, found: dict) -> list:
+    """Like _selection_polls for (hostname, service) pairs"""
+    columns = ["host_name", "description"]
+    return (_pair_polls(pairs, operation["select"], columns, _pair_selection_handler(found)) +
+            _pair_polls(pairs, operation["in_state"], columns, _pair_selection_handler(found, "in_state")))
+
+
+def _select_pairs_test(pairs: list) -> dict:
+    found = _pairs_test(pairs)
+    for target_state in list(found["hosts"].values()) + list(found["services"].values()):
+        target_state["selected"] = True
+    return found
+
+
+def select_pairs(operation: dict, pairs: list) -> dict:
+    """Like select_targets for a service operation on (hostname, service) pairs"""
+    pairs = _pairs(pairs)
+    if test_mode:
+        return _select_pairs_test(pairs)
+    found = {"hosts": {}, "services": {}}
+    _run_polls(_pair_selection_polls(operation, pairs, found))
+    rest = [pair for pair in pairs if pair not in found["services"]]
+    if rest:
+        _merge_existing(found, preflight_pairs(rest, live=False), rest)
+    return found
+
+
+class _Template:
+    """
+    A str.format style template, parsed once into literal text and field names
+
+    fill() substitutes the fields it's given and returns a template of the rest, so
+    values shared by every target are rendered once per call rather than per target
+    """
+
+    def __init__(self, parts: list):
+        self.parts = parts
+
+    @classmethod
+    def parse(cls, text: str):
+        return cls([(literal, field) for literal, field, _spec, _conversion in string.Formatter().parse(text)])
+
+    def fill(self, values: dict):
+        parts = []
+        literal = ""
+        for text, field in self.parts:
+            literal += text
+            if field is None:
+                continue
+            if field in values:
+                literal += str(values[field])
+            else:
+                parts.append((literal, field))
+                literal = ""
+        parts.append((literal, None))
+        return _Template(parts)
+
+    def render(self, values: dict = {}) -> str:
+        return "".join(text if field is None else text + str(values[field]) for text, field in self.parts)
+
+
+def _is_selected(target_state: dict) -> bool:
+    return target_state.get("selected", False)
+
+
+def _is_id(value: str) -> bool:
+    return value.isdigit()
+
+
+# the mode functions, one entry each.  targets is 'hosts' or 'services'; select filters
+# the target table, server side, for the targets worth acting on, see select_targets;
+# command, the confirmation filters and target are templates over {host}, {service}
+# and the call's arguments; requires is a predicate on a target's preflight state;
+# expect is a predicate on each value of the confirmation column; a confirmation value
+# is the result when targets are confirmed by count, see aggregate_confirm; in_state
+# filters the target table for objects the operation would leave unchanged, see
+# preview; wait is the Livestatus WaitTrigger and WaitConditions which show the last
+# command has been processed, see confirm_commands; errors are the result for a
+# missing host, a missing service, or a target failing requires
+_downtime_confirm = {"table": "downtimes", "column": "id", "filters": [
+    "Filter: author = {username}", "Filter: end_time = {endtime}", "Filter: start_time = {begintime}"]}
+_ack_arguments = ";{sticky};{notify};1;{username};{comment}"
+_downtime_arguments = ";{begintime};{endtime};1;0;0;{username};{comment}"
+
+operations = {
+    "downtime_hosts": {
+        "targets": "hosts",
+        "command": "SCHEDULE_HOST_DOWNTIME;{host}" + _downtime_arguments,
+        "confirm": dict(_downtime_confirm, target=["{host}", ""]),
+        "expect": _is_id,
+        "in_state": ["Filter: scheduled_downtime_depth >= 1"],
+        "wait": {"trigger": "downtime", "condition": ["WaitCondition: downtimes !="]},
+        "errors": {"host": "host_for_downtime_host_not_found"},
+    },
+    "downtime_hostsservices": {
+        "targets": "services",
+        "command": "SCHEDULE_SVC_DOWNTIME;{host};{service}" + _downtime_arguments,
+        "confirm": dict(_downtime_confirm, target=["{host}", "{service}"]),
+        "expect": _is_id,
+        "in_state": ["Filter: scheduled_downtime_depth >= 1"],
+        "wait": {"trigger": "downtime", "condition": ["WaitCondition: downtimes !="]},
+        "errors": {"host": "host_for_services_not_found",
+                   "service": "host_service_for_downtime_service_not_found"},
+    },
+    "ack_hostsproblem": {
+        "targets": "hosts",
+        "select": ["Filter: state >= 1", "Filter: acknowledged = 0"],
+        "command": "ACKNOWLEDGE_HOST_PROBLEM;{host}" + _ack_arguments,
+        "confirm": {"table": "hosts", "target": ["{host}"], "column": "name", "value": "{host}",
+                    "filters": ["Filter: state >= 1", "Filter: acknowledged = 1"]},
+        "requires": _is_selected,
+        "expect": bool,
+        "in_state": ["Filter: state >= 1", "Filter: acknowledged = 1"],
+        "wait": {"trigger": "comment", "condition": ["WaitCondition: acknowledged = 1"]},
+        "errors": {"host": "host_for_host_problem_not_found", "requires": "host_problem_not_found",
+                   "in_state": "host_problem_already_acknowledged"},
+    },
+    "ack_hostsservicesproblem": {
+        "targets": "services",
+        "select": ["Filter: state >= 1", "Filter: acknowledged = 0"],
+        "command": "ACKNOWLEDGE_SVC_PROBLEM;{host};{service}" + _ack_arguments,
+        "confirm": {"table": "services", "target": ["{host}", "{service}"], "column": "host_name",
+                    "value": "{host}", "filters": ["Filter: state >= 1", "Filter: acknowledged = 1"]},
+        "requires": _is_selected,
+        "expect": bool,
+        "in_state": ["Filter: state >= 1", "Filter: acknowledged = 1"],
+        "wait": {"trigger": "comment", "condition": ["WaitCondition: acknowledged = 1"]},
+        "errors": {"host": "host_for_host_service_problem_not_found",
+                   "service": "service_for_host_service_problem_not_found",
+                   "requires": "host_service_problem_not_found",
+                   "in_state": "host_service_problem_already_acknowledged"},
+    },
+    "dis_hostscheck": {
+        "targets": "hosts",
+        "command": "DISABLE_HOST_CHECK;{host}",
+        "confirm": {"table": "hosts", "target": ["{host}"], "column": "checks_enabled", "value": "0",
+                    "filters": ["Filter: checks_enabled = 0"]},
+        "expect": "0".__eq__,
+        "in_state": ["Filter: checks_enabled = 0"],
+        "wait": {"trigger": "command", "condition": ["WaitCondition: checks_enabled = 0"]},
+        "errors": {"host": "host_for_disable_hostcheck_not_found"},
+    },
+    "dis_hostsservicescheck": {
+        "targets": "services",
+        "command": "DISABLE_SVC_CHECK;{host};{service}",
+        "confirm": {"table": "services", "target": ["{host}", "{service}"], "column": "checks_enabled",
+                    "value": "0", "filters": ["Filter: checks_enabled = 0"]},
+        "expect": "0".__eq__,
+        "in_state": ["Filter: checks_enabled = 0"],
+        "wait": {"trigger": "command", "condition": ["WaitCondition: checks_enabled = 0"]},
+        "errors": {"host": "host_for_disable_service_check_not_found",
+                   "service": "service_for_disable_service_check_not_found"},
+    },
+    "en_hostscheck": {
+        "targets": "hosts",
+        "command": "ENABLE_HOST_CHECK;{host}",
+        "confirm": {"table": "hosts", "target": ["{host}"], "column": "checks_enabled", "value": "1",
+                    "filters": ["Filter: checks_enabled = 1"]},
+        "expect": "1".__eq__,
+        "in_state": ["Filter: checks_enabled = 1"],
+        "wait": {"trigger": "command", "condition": ["WaitCondition: checks_enabled = 1"]},
+        "errors": {"host": "host_for_enable_host_check_not_found"},
+    },
+    "en_hostsservicescheck": {
+        "targets": "services",
+        "command": "ENABLE_SVC_CHECK;{host};{service}",
+        "confirm": {"table": "services", "target": ["{host}", "{service}"], "column": "checks_enabled",
+                    "value": "1", "filters": ["Filter: checks_enabled = 1"]},
+        "expect": "1".__eq__,
+        "in_state": ["Filter: checks_enabled = 1"],
+        "wait": {"trigger": "command", "condition": ["WaitCondition: checks_enabled = 1"]},
+        "errors": {"host": "host_for_enable_service_check_not_found",
+                   "service": "service_for_enable_service_check_not_found"},
+    },
+    "dis_hostsnotifications": {
+        "targets": "hosts",
+        "command": "DISABLE_HOST_NOTIFICATIONS;{host}",
+        "confirm": {"table": "hosts", "target": ["{host}"], "column": "notifications_enabled", "value": "0",
+                    "filters": ["Filter: notifications_enabled = 0"]},
+        "expect": "0".__eq__,
+        "in_state": ["Filter: notifications_enabled = 0"],
+        "wait": {"trigger": "command", "condition": ["WaitCondition: notifications_enabled = 0"]},
+        "errors": {"host": "host_for_disable_host_notifications_not_found"},
+    },
+    "dis_hostsservicesnotifications": {
+        "targets": "services",
+        "command": "DISABLE_SVC_NOTIFICATIONS;{host};{service}",
+        "confirm": {"table": "services", "target": ["{host}", "{service}"], "column": "notifications_enabled",
+                    "value": "0", "filters": ["Filter: notifications_enabled = 0"]},
+        "expect": "0".__eq__,
+        "in_state": ["Filter: notifications_enabled = 0"],
+        "wait": {"trigger": "command", "condition": ["WaitCondition: notifications_enabled = 0"]},
+        "errors": {"host": "host_for_disable_service_notifications_not_found",
+                   "service": "service_for_disable_service_notifications_not_found"},
+    },
+    "en_hostsnotifications": {
+        "targets": "hosts",
+        "command": "ENABLE_HOST_NOTIFICATIONS;{host}",
+        "confirm": {"table": "hosts", "target": ["{host}"], "column": "notifications_enabled", "value": "1",
+                    "filters": ["Filter: notifications_enabled = 1"]},
+        "expect": "1".__eq__,
+        "in_state": ["Filter: notifications_enabled = 1"],
+        "wait": {"trigger": "command", "condition": ["WaitCondition: notifications_enabled = 1"]},
+        "errors": {"host": "host_for_enable_host_notifications_not_found"},
+    },
+    "en_hostsservicesnotifications": {
+        "targets": "services",
+        "command": "ENABLE_SVC_NOTIFICATIONS;{host};{service}",
+        "confirm": {"table": "services", "target": ["{host}", "{service}"], "column": "notifications_enabled",
+                    "value": "1", "filters": ["Filter: notifications_enabled = 1"]},
+        "expect": "1".__eq__,
+        "in_state": ["Filter: notifications_enabled = 1"],
+        "wait": {"trigger": "command", "condition": ["WaitCondition: notifications_enabled = 1"]},
+        "errors": {"host": "host_for_enable_service_notifications_not_found",
+                   "service": "service_for_enable_service_notifications_not_found"},
+    },
+}
+
+
+def _compile_operation(operation: dict):
+    """Parses an operation's templates, once, when the module is loaded"""
+    operation["command"] = _Template.parse(operation["command"])
+    confirm = operation["confirm"]
+    confirm["filters"] = [_Template.parse(statement) for statement in confirm["filters"]]
+    confirm["target"] = [_Template.parse(value) for value in confirm["target"]]
+    if "value" in confirm:
+        confirm["value"] = _Template.parse(confirm["value"])
+    operation.setdefault("requires", None)
+    operation.setdefault("select", [])
+    # in_state as Stats: lines counting the objects it filters, for preview
+    stats = ["Stats: " + statement[len("Filter: "):] for statement in operation["in_state"]]
+    if len(stats) > 1:
+        stats.append("StatsAnd: " + str(len(stats)))
+    operation["in_state_stats"] = stats
+    wait = operation["wait"]
+    operation["wait"] = operation["targets"], wait["trigger"], tuple(wait["condition"])
+
+
+for _operation in operations.values():
+    _compile_operation(_operation)
+
+
+def _plan(operation: dict, state: dict, hostnames: list, services: list, arguments: dict,
+          pairs: list = None) -> [bool, dict, dict]:
+    """
+    Returns whether all targets can be acted on, results for those which can't and the
+    pending commands for those which can, see execute_commands.  For service operations
+    pairs, a list of (hostname, service), replaces every service on every host
+    """
+    services_of = None
+    if pairs is not None:
+        services_of = {}
+        for hostname, service in pairs:
+            services_of.setdefault(hostname, []).append(service)
+        hostnames = list(services_of)
+    results = {}
+    pending = {}
+    all_good = True
+    arguments = dict(arguments)
+    for flag in ("sticky", "notify"):
+        if flag in arguments:
+            arguments[flag] = int(arguments[flag])
+    command = operation["command"].fill(arguments)
+    confirm = operation["confirm"]
+    filters = [statement.render(arguments) for statement in confirm["filters"]]
+    target = [value.fill(arguments) for value in confirm["target"]]
+    value = confirm["value"].fill(arguments) if "value" in confirm else None
+    requires = operation["requires"]
+    errors = operation["errors"]
+    expect = operation["expect"]
+    for hostname in hostnames:
+        hostname = str(hostname)
+        if hostname not in state["hosts"]:
+            all_good = False
+            if operation["targets"] == "hosts":
+                results[hostname] = errors["host"]
+            else:
+                results[hostname + ";failed_host_check_before_services"] = errors["host"]
+            continue
+        if operation["targets"] == "hosts":
+            items = [(hostname, {"host": hostname}, state["hosts"][hostname])]
+        else:
+            items = []
+            for service in services if services_of is None else services_of[hostname]:
+                service = str(service)
+                key = hostname + ";" + service
+                if (hostname, service) not in state["services"]:
+                    all_good = False
+                    results[key] = errors["service"]
+                    continue
+                items.append((key, {"host": hostname, "service": service}, state["services"][(hostname, service)]))
+        for key, values, target_state in items:
+            if requires is not None and not requires(target_state):
+                if target_state.get("in_state") and "in_state" in errors:
+                    results[key] = errors["in_state"]
+                    continue
+                all_good = False
+                results[key] = errors["requires"]
+                continue
+            confirm_spec = {"table": confirm["table"], "column": confirm["column"], "filters": filters,
+                            "target": tuple(part.render(values) for part in target)}
+            if value is not None:
+                confirm_spec["value"] = value.render(values)
+            confirm_spec["wait"] = operation["wait"]
+            pending[key] = command.render(values), confirm_spec, expect
+
+    return all_good, results, pending
+
+
+def _preview_polls(operation: dict, hostnames: list, services: list, counts: dict) -> list:
+    """Returns (query, handler) pairs adding the counts of each chunk of targets to counts"""
+    stats = ["Stats: state >= 0"] + operation["in_state_stats"] + ["Stats: state >= 1"]
+
+    def handle(rows):
+        for row in rows:
+            for name, count in zip(("matching", "in_state", "problems"), row):
+                counts[name] += int(count)
+
+    polls = []
+    for host_chunk in _chunks(hostnames, config.preflight_chunk_size):
+        if operation["targets"] == "hosts":
+            polls.append((["GET hosts"] + _or_filters("name", host_chunk) + stats, handle))
+            continue
+        for service_chunk in _chunks(services, config.preflight_chunk_size):
+            query = ["GET services"] + _or_filters("host_name", host_chunk)
+            query += _or_filters("description", service_chunk)
+            polls.append((query + stats, handle))
+    return polls
+
+
+def _preview_counts(operation: dict, hostnames: list, services: list) -> [dict, list]:
+    hostnames = [str(hostname) for hostname in hostnames]
+    services = [str(service) for service in services] if operation["targets"] == "services" else []
+    targets = len(hostnames) * (len(services) if operation["targets"] == "services" else 1)
+    counts = {"targets": targets, "matching": 0, "in_state": 0, "problems": 0}
+    if test_mode:
+        counts.update(matching=targets, problems=targets)
+        return counts, []
+    return counts, _preview_polls(operation, hostnames, services, counts)
+
+
+def preview(name: str, hostnames: list, services: list = []) -> dict:
+    """
+    Counts what an operation would touch without submitting anything, returns a dict of
+    'targets' (hosts or host;service pairs asked for), 'matching' (those which exist),
+    'in_state' (those the operation would leave unchanged) and 'problems' (those in a
+    non-OK state).  Counting is done by Livestatus with Stats: headers, one query per
+    chunk of targets
+    """
+    if _fans_out():
+        return _sum_counts(_on_sites(lambda site_hosts: preview(name, site_hosts, services), route_hosts(hostnames)))
+    counts, polls = _preview_counts(operations[name], hostnames, services)
+    _run_polls(polls)
+    return counts
+
+
+def _sum_counts(replies: list) -> dict:
+    counts = {"targets": 0, "matching": 0, "in_state": 0, "problems": 0}
+    for site_counts in replies:
+        for name in counts:
+            counts[name] += site_counts[name]
+    return counts
+
+
+def run_operation(name: str, hostnames: list, services: list = [], **arguments) -> [bool, dict]:
+    """
+    Runs one of the operations for host(s), or for service(s) on host(s), returns bool
+    indicating if all were successful and a dict of result key and reply or status
+    message.  arguments fill the operation's templates, eg comment, username.  With
+    config.sites the hosts are split by site and each site's share runs in parallel
+    """
+    if _fans_out():
+        return _merge_results(_on_sites(lambda site_hosts: run_operation(name, site_hosts, services, **arguments),
+                                        route_hosts(hostnames)))
+    operation = operations[name]
+    if operation["select"]:
+        state = select_targets(operation, hostnames, services)
+    else:
+        state = preflight(hostnames, services, live=False)
+    return _execute_plan(*_plan(operation, state, hostnames, services, arguments), name)
+
+
+def run_group_operation(name: str, hostgroups: list, services: list = [], **arguments) -> [bool, dict]:
+    """
+    Runs one of the operations with select filters, eg ack, for everything selected in
+    hostgroup(s): hosts, or services named in services, or any service if that's empty.
+    Returns like run_operation
+    """
+    if _fans_out():
+        return _merge_results(_on_sites(
+            lambda site_hostgroups: run_group_operation(name, site_hostgroups, services, **arguments),
+            route_hostgroups(hostgroups)))
+    operation = operations[name]
+    state = select_group_targets(operation, hostgroups, services)
+    pairs = list(state["services"]) if operation["targets"] == "services" else None
+    return _execute_plan(*_plan(operation, state, list(state["hosts"]), [], arguments, pairs), name)
+
+
+def _route_pairs(pairs: list) -> dict:
+    """Returns {site: pairs}, each pair going to the site of its host, see route_hosts"""
+    site_of = {}
+    for site, hostnames in route_hosts(list(dict.fromkeys(hostname for hostname, _service in pairs))).items():
+        site_of.update(dict.fromkeys(hostnames, site))
+    routes = {}
+    for pair in pairs:
+        routes.setdefault(site_of[pair[0]], []).append(pair)
+    return routes
+
+
+def run_pairs_operation(name: str, pairs: list, **arguments) -> [bool, dict]:
+    """
+    Runs one of the service operations for exact (hostname, service) pairs, eg from
+    services_inservicegroups, rather than every service on every host.  Returns like
+    run_operation
+    """
+    pairs = _pairs(pairs)
+    if _fans_out():
+        return _merge_results(_on_sites(lambda site_pairs: run_pairs_operation(name, site_pairs, **arguments),
+                                        _route_pairs(pairs)))
+    operation = operations[name]
+    if operation["select"]:
+        state = select_pairs(operation, pairs)
+    else:
+        state = preflight_pairs(pairs, live=False)
+    return _execute_plan(*_plan(operation, state, [], [], arguments, pairs), name)
+
+
+def downtime_hosts(hostnames: list, begintime: int, endtime: int, comment: str,
+                    username: str = config.current_user) -> [bool, dict]:
+    """Add downtime for host(s), returns bool indicating if all were
+    successful and dict of 'hostname' and their entry IDs or status message"""
+    return run_operation("downtime_hosts", hostnames, begintime=begintime, endtime=endtime,
+                         comment=comment, username=username)
+
+
+def downtime_hostsservices(hostnames: list, services: list, begintime: int, endtime: int,
+                            comment: str, username: str = config.current_user) -> [bool, dict]:
+    """Add downtime for service(s) on host(s), returns bool indicating if all were
+    successful and dict of 'hostname_service' and their entry IDs or status message"""
+    return run_operation("downtime_hostsservices", hostnames, services, begintime=begintime, endtime=endtime,
+                         comment=comment, username=username)
+
+
+def ack_hostsproblem(hostnames: list, comment: str, sticky: bool = False, notify: bool = False,
+                    username: str = config.current_user) -> [bool, dict]:
+    """Acknowledge a host problem, optionally set 'sticky' and whether to notify"""
+    return run_operation("ack_hostsproblem", hostnames, comment=comment, sticky=sticky, notify=notify,
+                         username=username)
+
+
+def ack_hostsservicesproblem(hostnames: list, services: list, comment: str, sticky: bool = False, 
+                            notify: bool = False, username: str = config.current_user) -> [bool, dict]:
+    """Acknowledge a service problem on a host, optionally set 'sticky' and whether to notify"""
+    return run_operation("ack_hostsservicesproblem", hostnames, services, comment=comment, sticky=sticky,
+                         notify=notify, username=username)
+
+
+def ack_hostgroupsproblem(hostgroups: list, comment: str, sticky: bool = False, notify: bool = False,
+                          username: str = config.current_user) -> [bool, dict]:
+    """Acknowledge every unacknowledged host problem in hostgroup(s), found with one query"""
+    return run_group_operation("ack_hostsproblem", hostgroups, comment=comment, sticky=sticky, notify=notify,
+                               username=username)
+
+
+def ack_hostgroupsservicesproblem(hostgroups: list, services: list, comment: str, sticky: bool = False,
+                                  notify: bool = False, username: str = config.current_user) -> [bool, dict]:
+    """Acknowledge every unacknowledged service problem on hosts in hostgroup(s), for the
+    given services or, if services is empty, any service"""
+    return run_group_operation("ack_hostsservicesproblem", hostgroups, services, comment=comment, sticky=sticky,
+                               notify=notify, username=username)
+
+
+def dis_hostscheck(hostnames: list) -> [bool, dict]:
+    """Disable checks for a host"""
+    return run_operation("dis_hostscheck", hostnames)
+
+
+def dis_hostsservicescheck(hostnames: list, services: list) -> [bool, dict]:
+    """Disable checks for a service on a host"""
+    return run_operation("dis_hostsservicescheck", hostnames, services)
+
+
+def dis_hostsnotifications(hostnames: list) -> [bool, dict]:
+    """Disable notifications for a host"""
+    return run_operation("dis_hostsnotifications", hostnames)
+
+
+def dis_hostsservicesnotifications(hostnames: list, services: list) -> [bool, dict]:
+    """Disable notifications for a service on a host"""
+    return run_operation("dis_hostsservicesnotifications", hostnames, services)
+
+
+def en_hostscheck(hostnames: list) -> [bool, dict]:
+    """Enable checks for a host"""
+    return run_operation("en_hostscheck", hostnames)
+
+
+def en_hostsservicescheck(hostnames: list, services: list) -> [bool, dict]:
+    """Enable checks for a service on a host"""
+    return run_operation("en_hostsservicescheck", hostnames, services)
+
+
+def en_hostsnotifications(hostnames: list) -> [bool, dict]:
+    """Enable notifications for a host"""
+    return run_operation("en_hostsnotifications", hostnames)
+
+
+def en_hostsservicesnotifications(hostnames: list, services: list) -> [bool, dict]:
+    """Enable notifications for a service on a host"""
+    return run_operation("en_hostsservicesnotifications", hostnames, services)
+
+
+# removing downtimes doesn't fit the operations table: a target can have any number
+# of downtimes, each deleted by its own command, and success is the downtime's absence
+def _removal_keys(hostnames: list, services: list) -> list:
+    if services == []:
+        return list(hostnames)
+    return [hostname + ";" + service for hostname in hostnames for service in services]
+
+
+def _ere_escape(text: str) -> str:
+    """
+    Escapes the POSIX ERE metacharacters of text, and nothing else: re.escape also
+    escapes spaces and -, which ERE leaves undefined and RE2 rejects
+    """
+    return "".join("\\" + char if char in ".[]()*+?{}|^$\\" else char for char in text)
+
+
+def _downtime_lookup(hostnames: list, services: list, author: str, comment: str, comment_regex: bool,
+                     found: dict) -> tuple:
+    """
+    Returns a (query, handler) pair adding the ids of the matching downtimes to found,
+    keyed like the results.  Hosts are filtered by Livestatus when they fit in one
+    chunk, otherwise the downtimes of every host are fetched and filtered here, so
+    it's one query either way.  comment is matched as text anywhere in the comment,
+    or as a regex if comment_regex
+    """
+    query = ["GET downtimes"]
+    if len(hostnames) <= config.preflight_chunk_size:
+        query += _or_filters("host_name", hostnames)
+    if services == []:
+        query.append("Filter: is_service = 0")
+    else:
+        query += _or_filters("service_description", services)
+        query.append("Filter: is_service = 1")
+    if author is not None:
+        query.append("Filter: author = " + author)
+    if comment is not None:
+        query.append("Filter: comment ~ " + (comment if comment_regex else _ere_escape(comment)))
+    query.append("Columns: id host_name service_description")
+    keys = set(_removal_keys(hostnames, services))
+
+    def handle(rows):
+        for row in rows:
+            key = row.host_name + (";" + row.service_description if services else "")
+            if key in keys:
+                found.setdefault(key, []).append(str(row.id))
+    return query, handle
+
+
+def _lookup_failed(keys: list, error: Exception) -> [bool, dict]:
+    """The results when the downtimes couldn't be looked up, rather than reporting none found"""
+    if debug:
+        print("DEBUG(remove_downtimes):", error)
+    return False, {key: "lookup_failed" for key in keys}
+
+
+def _removal_plan(keys: list, found: dict, is_service: bool) -> [bool, dict, dict]:
+    """Returns whether every target has downtimes, results for those which don't and a DEL command per id"""
+    results = {}
+    pending = {}
+    command = "DEL_SVC_DOWNTIME;" if is_service else "DEL_HOST_DOWNTIME;"
+    for key in keys:
+        if key not in found:
+            results[key] = "downtime_not_found"
+            continue
+        for downtime_id in found[key]:
+            pending[downtime_id] = command + downtime_id
+    return len(results) == 0, results, pending
+
+
+def _remaining_downtimes(pending: dict) -> tuple:
+    """
+    Returns a (query, handler) pair removing the ids which no longer exist from pending,
+    one query for the range of ids rather than a filter for each.  The handler must be
+    given livestatus_rows_checked, so a failed query leaves every id pending rather
+    than looking like none are left
+    """
+    ids = [int(downtime_id) for downtime_id in pending]
+    query = ["GET downtimes", "Filter: id >= " + str(min(ids)), "Filter: id <= " + str(max(ids)), "Columns: id"]
+
+    def handle(rows):
+        remaining = set(str(row.id) for row in rows)
+        for downtime_id in list(pending):
+            if downtime_id not in remaining:
+                del pending[downtime_id]
+    return query, handle
+
+
+def _removal_results(keys: list, found: dict, pending: dict, all_good: bool, results: dict) -> [bool, dict]:
+    for key in keys:
+        if key in found:
+            if any(downtime_id in pending for downtime_id in found[key]):
+                all_good = False
+                results[key] = "command_failed"
+            else:
+                results[key] = ",".join(found[key])
+    return all_good, results
+
+
+def remove_downtimes(hostnames: list, services: list = [], author: str = None, comment: str = None,
+                     retry_command: int = 3, retry_confirm: int = 3, comment_regex: bool = False) -> [bool, dict]:
+    """
+    Deletes the downtimes of host(s), or of service(s) on host(s), optionally only those
+    entered by author or whose comment contains comment, or matches it as a regex if
+    comment_regex.  Returns bool indicating if all were deleted and dict of 'hostname'
+    or 'hostname;service' and the deleted entry IDs or status message, lookup_failed for
+    all of them if the downtimes couldn't be queried.  The IDs are found with one query,
+    the DEL commands submitted together and their removal confirmed with one query per poll
+    """
+    if _fans_out():
+        return _merge_results(_on_sites(
+            lambda site_hosts: remove_downtimes(site_hosts, services, author, comment, retry_command, retry_confirm,
+                                                comment_regex),
+            route_hosts(hostnames)))
+    hostnames = [str(hostname) for hostname in hostnames]
+    services = [str(service) for service in services]
+    keys = _removal_keys(hostnames, services)
+    if test_mode:
+        return True, {key: "expected_result" for key in keys}
+    found = {}
+    query, handle = _downtime_lookup(hostnames, services, author, comment, comment_regex, found)
+    try:
+        handle(livestatus_rows_checked(query))
+    except (OSError, ValueError) as error:
+        return _lookup_failed(keys, error)
+    all_good, results, pending = _removal_plan(keys, found, services != [])
+    command_count = 0
+    while pending and command_count <= retry_command:
+        if not submit_commands(list(pending.values())):
+            break
+        confirm_count = 0
+        while pending and confirm_count <= retry_confirm:
+            time.sleep(_backoff(confirm_count))
+            query, handle = _remaining_downtimes(pending)
+            try:
+                handle(livestatus_rows_checked(query))
+            except (OSError, ValueError) as error:
+                if debug:
+                    print("DEBUG(remove_downtimes):", error)
+            confirm_count += 1
+        command_count += 1
+    return _removal_results(keys, found, pending, all_good, results)
+
+
+# asyncio counterparts of the above, for use inside an event loop.  They share the
+# query building and planning with the blocking functions and only differ in how
+# the I/O is awaited
+
+
+async def _open_connection_async(address: str):
+    """asyncio counterpart of _open_socket, returns a reader and writer"""
+    if address.startswith("tcp:"):
+        host, port = address[len("tcp:"):].rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(address)
+
+
+class AsyncLivestatusClient:
+    """
+    Livestatus client for asyncio, using KeepAlive connections to a UNIX socket path or
+    'tcp:host:port'
+
+    At most concurrency queries are in flight at once, the rest wait on a semaphore, so
+    one event loop can serve many callers without a thread per query
+    """
+
+    def __init__(self, path: str, concurrency: int = 8):
+        self.path = path
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._idle = []
+
+    async def _exchange(self, request: bytes):
+        """Sends a request and reads the fixed16 header, returns reader, writer, code and length"""
+        while True:
+            if self._idle:
+                reader, writer = self._idle.pop()
+                reused = True
+            else:
+                reader, writer = await _open_connection_async(self.path)
+                reused = False
+            try:
+                writer.write(request)
+                await writer.drain()
+                header = await reader.readexactly(16)
+                return reader, writer, int(header[0:3]), int(header[4:15])
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    if instrument:
+                        stats.count("reconnects")
+                    continue
+                raise
+
+    async def query(self, request: bytes) -> [int, bytes]:
+        """Sends a complete LQL request, returns the status code and reply body"""
+        async with self._semaphore:
+            started = time.perf_counter() if instrument else 0
+            reader, writer, code, length = await self._exchange(request)
+            try:
+                body = await reader.readexactly(length)
+            except (OSError, asyncio.IncompleteReadError):
+                writer.close()
+                raise
+            self._idle.append((reader, writer))
+            if instrument:
+                _record_query(started, length)
+            return code, body
+
+    async def stream(self, request: bytes, chunk_size: int = 65536):
+        """asyncio counterpart of LivestatusPool.stream"""
+        async with self._semaphore:
+            started = time.perf_counter() if instrument else 0
+            reader, writer, code, remaining = await self._exchange(request)
+            length = remaining
+            try:
+                yield code
+                while remaining > 0:
+                    chunk = await reader.read(min(remaining, chunk_size))
+                    if chunk == b"":
+                        raise ConnectionError("livestatus connection closed mid-reply")
+                    remaining -= len(chunk)
+                    yield chunk
+            finally:
+                if remaining > 0:
+                    writer.close()
+                else:
+                    self._idle.append((reader, writer))
+                if instrument:
+                    _record_query(started, length - remaining)
+
+    async def send(self, request: bytes):
+        """Sends requests which get no reply, such as COMMANDs, on a fresh connection"""
+        async with self._semaphore:
+            started = time.perf_counter() if instrument else 0
+            _reader, writer = await _open_connection_async(self.path)
+            try:
+                writer.write(request)
+                await writer.drain()
+                writer.write_eof()
+            finally:
+                writer.close()
+                await writer.wait_closed()
+            if instrument:
+                stats.observe("command_send", time.perf_counter() - started)
+
+    async def close(self):
+        """Closes all idle connections"""
+        idle, self._idle = self._idle, []
+        for _reader, writer in idle:
+            writer.close()
+            await writer.wait_closed()
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def async_livestatus_client(path: str = None) -> AsyncLivestatusClient:
+    """Returns the running event loop's client for a socket path, default the current site's"""
+    path = path or _livestatus_path()
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if path not in clients:
+        clients[path] = AsyncLivestatusClient(path, config.async_concurrency)
+    return clients[path]
+
+
+async def livestatus_query_async(query: list = ["GET status"]) -> str:
+    """asyncio counterpart of livestatus_query"""
+    request = _lql_request(query)
+    if test_mode:
+        return _test_reply()
+    try:
+        code, reply = await async_livestatus_client().query(request)
+    except (OSError, ValueError, asyncio.IncompleteReadError):
+        return 'socket_not_found'
+    return _reply_text(code, reply)
+
+
+async def livestatus_rows_async(query: list):
+    """asyncio counterpart of livestatus_rows, an async iterator of rows"""
+    try:
+        async for row in livestatus_rows_checked_async(query):
+            yield row
+    except (OSError, ValueError, asyncio.IncompleteReadError) as error:
+        if debug:
+            print("DEBUG(livestatus_rows_async):", error)
+
+
+async def livestatus_rows_checked_async(query: list):
+    """asyncio counterpart of livestatus_rows_checked"""
+    request = _lql_request(list(query) + ["OutputFormat: json", "ColumnHeaders: on"])
+    if test_mode:
+        return
+    decoder = _JSONRows()
+    row_type = None
+    reply = async_livestatus_client().stream(request)
+    try:
+        code = await reply.__anext__()
+        if code != 200:
+            body = b"".join([chunk async for chunk in reply])
+            _reply_text(code, body)
+            raise ValueError("livestatus query failed: " + str(code) + " " + str(body, "utf-8", "replace").strip())
+        async for chunk in reply:
+            for row in decoder.feed(chunk):
+                if row_type is None:
+                    row_type = _row_type(row)
+                    continue
+                yield row_type(*row)
+    finally:
+        await reply.aclose()
+    if not decoder.complete:
+        raise ValueError("livestatus json reply is incomplete")
+
+
+async def _feed_rows_async(query: list, batches: asyncio.Queue):
+    """asyncio counterpart of _feed_rows, stopped by cancelling it"""
+    try:
+        batch = []
+        async for row in livestatus_rows_async(query):
+            batch.append(row)
+            if len(batch) == _poll_batch:
+                await batches.put(batch)
+                batch = []
+        if batch:
+            await batches.put(batch)
+    except Exception as error:
+        await batches.put(error)
+        return
+    await batches.put(None)
+
+
+async def _run_polls_async(polls: list):
     """
-    # This was roughly lifted from mathias-kettner.com - live_example.py
-    # original version allowed tcp or unix socket, for the latter automatic
-    # detection by OMD config.  I assume a configured path for a unix socket.
-    ls_query = ""
-    for statement in query:
-        ls_query += statement + "\n"
-    if debug:
-        print("DEBUG(livestatus_query):", ls_query)
-    if test_mode:
-        if debug_force_fail:
-                return "not_expected"
-        return "expected_result"
+    asyncio counterpart of _run_polls.  Handlers are called in order in a worker thread,
+    so they can read their rows as they arrive while the event loop keeps the queries going
+    """
+    loop = asyncio.get_running_loop()
+    queues = [asyncio.Queue(maxsize=_poll_batches) for _poll in polls]
+    feeders = [asyncio.ensure_future(_feed_rows_async(query, batches))
+               for (query, _handle), batches in zip(polls, queues)]
     try:
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        sock.connect(config.env_livestatus)
-        sock.sendall(ls_query)
-        sock.shutdown(socket.SHUT_WR)
-        chunks = []
-        while len(chunks) == 0 or chunks[-1] != "":
-            chunks.append(sock.recv(4096))
-        sock.close()
-        reply = "".join(chunks)
-        sock.close()
-        return reply
-    except:
-        return 'socket_not_found'
+        for (_query, handle), batches, feeder in zip(polls, queues, feeders):
+            if feeder.done():
+                # the whole reply is queued already, no need for a thread
+                _handle_batches(handle, batches.get_nowait)
+                continue
 
-def nagios_command(command: str, confirm_query: list = [], expect_regex: str = ".*",
-                    retry_command: int = 3, retry_confirm: int = 3) -> [bool, str]:
-    """Wraps and executes a raw Nagios external command, optionally confirming the result"""
-    # provide command as "NAGIOS_EXTERNAL_COMMAND;param1;param2;etc"
-    utimestamp = str(int(time.time()))
-    ls_command="COMMAND [" + str(utimestamp) + "] "
-    ls_command += command
-    ls_command += "\n "
-    #print(ls_command)
+            def get(batches=batches):
+                return asyncio.run_coroutine_threadsafe(batches.get(), loop).result()
+            await asyncio.to_thread(_handle_batches, handle, get)
+    finally:
+        for feeder in feeders:
+            feeder.cancel()
+        await asyncio.gather(*feeders, return_exceptions=True)
+        # a handler left waiting by a cancelled call gets an end of rows
+        for batches in queues:
+            while not batches.empty():
+                batches.get_nowait()
+            batches.put_nowait(None)
+
+
+async def submit_commands_async(commands: list, transport: str = None) -> bool:
+    """asyncio counterpart of submit_commands, pipe writes are done in the default executor"""
+    transport = transport or _site_setting("transport", config.command_transport)
+    buffers = _command_payload(commands, transport)
+    if test_mode or commands == []:
+        return True
+    if instrument:
+        stats.count("commands", len(commands))
+    try:
+        if transport == "livestatus":
+            await async_livestatus_client().send(buffers[0])
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, _write_pipe, buffers, _cmdpipe_path())
+    except OSError:
+        return False
+    return True
+
+
+async def _confirm_poll_async(pending: dict, results: dict):
+    fallback = []
+    await _run_polls_async(_confirm_polls(pending, results, fallback))
+    await _run_polls_async(fallback)
+
+
+async def confirm_commands_async(pending: dict, results: dict, retry_confirm: int = 3):
+    """asyncio counterpart of confirm_commands, the queries of a poll run concurrently"""
+    confirm_count = 0
+    wait = _wait_query(pending)
+    if wait is not None:
+        started = time.perf_counter() if instrument else 0
+        async for _row in livestatus_rows_async(wait):
+            pass
+        if instrument:
+            stats.observe("confirm_wait", time.perf_counter() - started)
+    while pending and confirm_count <= retry_confirm:
+        # the first poll after a wait query doesn't sleep
+        slept = 0
+        if wait is None or confirm_count > 0:
+            slept = _backoff(confirm_count)
+            await asyncio.sleep(slept)
+        started = time.perf_counter() if instrument else 0
+        await _confirm_poll_async(pending, results)
+        if instrument:
+            _record_poll(started, slept)
+        confirm_count += 1
+
+
+async def execute_commands_async(pending: dict, results: dict, retry_command: int = 3,
+                                 retry_confirm: int = 3) -> bool:
+    """asyncio counterpart of execute_commands"""
+    if test_mode:
+        return _test_results(pending, results)
+    pending = dict(pending)
     command_count = 0
-    pattern = re.compile(expect_regex)
-    while command_count <= retry_command and test_mode == False:
-        confirm_count = 0
-        cmd_file = open(config.env_cmdpipe, "a")
-        cmd_file.write(ls_command)
-        cmd_file.close()
-        if confirm_query == []:
-            return True, "command_unconfirmed" 
-        while confirm_count <= retry_confirm:
-            reply = livestatus_query(confirm_query)
-            pattern_match = pattern.match(reply)
-            try:
-                if pattern_match.group():
-                    return True, reply
-            except:
-                pass
-            confirm_count += 1
+    while pending and command_count <= retry_command:
+        if instrument and command_count > 0:
+            stats.count("command_retries", len(pending))
+        commands = [command for command, _confirm, _expect in pending.values()]
+        if not await submit_commands_async(commands):
+            break
+        _unconfirmable(pending, results)
+        await confirm_commands_async(pending, results, retry_confirm)
         command_count += 1
-    if debug or test_mode:
-        if debug_force_fail:
-            debug_query = "not_expected"
-        debug_query = "expected_result"
-    if debug:
-        print("DEBUG(nagios_command):", command)
-        print("DEBUG(nagios_command):", confirm_query)
-    if test_mode:
-        if debug_query == "not_expected":
-            return False, debug_query
-        return True, debug_query
+    return _failed(pending, results)
 
-    return False, "command_failed"
 
+async def nagios_command_async(command: str, confirm_query: list = [], expect_regex: str = ".*",
+                               retry_command: int = 3, retry_confirm: int = 3) -> [bool, str]:
+    """asyncio counterpart of nagios_command"""
+    results = {}
+    success = await execute_commands_async({command: (command, confirm_query, expect_regex)},
+                                           results, retry_command, retry_confirm)
+    return success, results[command]
 
-def hosts_inhostgroups(hostgroups: list) -> list:
-    """Returns a list of hosts in the given hostgroup"""
-    query = []
-    query.append("GET hostsbygroup")
-    for count, hostgroup in enumerate(hostgroups):
-        hostgroup = str(hostgroup)
-        query.append("Filter: hostgroup_name = " + hostgroup)
-    query.append("Or: " + str(count + 1))
-    query.append("Columns: name")
-    reply = livestatus_query(query)
-    if ";" in reply:
-        return reply.split(";")
-    if test_mode:
-        if debug_force_fail:
-            return []
-        return ['dc1web01', 'dc1web02', 'dc1web03']
 
-    return reply
+async def preflight_async(hostnames: list, services: list = [], live: bool = True) -> dict:
+    """asyncio counterpart of preflight, the chunked queries run concurrently"""
+    hostnames = [str(hostname) for hostname in hostnames]
+    services = [str(service) for service in services]
+    if test_mode:
+        return _preflight_test(hostnames, services)
+    if inventory is not None and not live and not _site.get():
+        loop = asyncio.get_running_loop()
+        found = await loop.run_in_executor(None, _preflight_inventory, hostnames, services)
+        if found is not None:
+            return found
+    found = {"hosts": {}, "services": {}}
+    await _run_polls_async(_preflight_host_polls(hostnames, found))
+    if services == []:
+        return found
+    await _run_polls_async(_preflight_service_polls(hostnames, services, found))
+    return found
 
 
-def host_exists(hostname: str) -> bool:
-    """Returns a bool indicating whether a hostname exists"""
-    query = []
-    query.append("GET hosts")
-    query.append("Filter: name = " + hostname)
-    query.append("Columns: name")
-    reply = livestatus_query(query)
+async def preflight_pairs_async(pairs: list, live: bool = True) -> dict:
+    """asyncio counterpart of preflight_pairs"""
+    pairs = _pairs(pairs)
     if test_mode:
-        if debug_force_fail:
-            return False
-        return True
-    if reply == hostname:
-        return True
-    return False
+        return _pairs_test(pairs)
+    if inventory is not None and not live and not _site.get():
+        found = await asyncio.get_running_loop().run_in_executor(None, _pairs_inventory, pairs)
+        if found is not None:
+            return found
+    found = {"hosts": {}, "services": {}}
+    await _run_polls_async(_preflight_host_polls(list(dict.fromkeys(hostname for hostname, _service in pairs)),
+                                                 found))
+    existing = [pair for pair in pairs if pair[0] in found["hosts"]]
+    columns = ["host_name", "description"] + preflight_columns
+    await _run_polls_async(_pair_polls(existing, [], columns, _preflight_service_handler(found)))
+    return found
 
 
-def hostservice_exists(hostname: str, service: str) -> bool:
-    """Returns a bool indicating whether a service on a hostname exists"""
-    query = []
-    query.append("GET services")
-    query.append("Filter: host_name = " + hostname)
-    query.append("Filter: description = " + service)
-    query.append("Columns: host_name")
-    reply = livestatus_query(query)
+async def select_targets_async(operation: dict, hostnames: list, services: list = []) -> dict:
+    """asyncio counterpart of select_targets"""
+    hostnames = [str(hostname) for hostname in hostnames]
+    services = [str(service) for service in services]
     if test_mode:
-        if debug_force_fail:
-            return False
-        return True
-    if reply == hostname:
-        return True
-    return False
+        return _select_test(operation, hostnames, services)
+    found = {"hosts": {}, "services": {}}
+    await _run_polls_async(_selection_polls(operation, hostnames, services, found))
+    rest_hosts, rest_services, rest = _unselected(operation, hostnames, services, found)
+    if rest_hosts:
+        _merge_existing(found, await preflight_async(rest_hosts, rest_services, live=False), rest)
+    return found
 
 
-def host_problem_exists(hostname: str) -> bool:
-    """Returns a bool indicating whether a hostname is in a problem state"""
-    query = []
-    query.append("GET hosts")
-    query.append("Filter: name = " + hostname)
-    query.append("Filter: state >= 1")
-    query.append("Columns: name")
-    reply = livestatus_query(query)
+async def select_group_targets_async(operation: dict, hostgroups: list, services: list = []) -> dict:
+    """asyncio counterpart of select_group_targets"""
+    hostgroups = [str(hostgroup) for hostgroup in hostgroups]
+    services = [str(service) for service in services]
     if test_mode:
-        if debug_force_fail:
-            return False
-        return True
-    if reply == hostname:
-        return True
-    return False
+        return _select_test(operation, hosts_inhostgroups(hostgroups), services)
+    found = {"hosts": {}, "services": {}}
+    await _run_polls_async(_group_selection_polls(operation, hostgroups, services, found))
+    return found
 
 
-def hostservice_problem_exists(hostname: str, service: str) -> bool:
-    """Returns a bool indicating whether a service on a hostname is in a problem state"""
-    query = []
-    query.append("GET services")
-    query.append("Filter: host_name = " + hostname)
-    query.append("Filter: description = " + service)
-    query.append("Filter: state >= 1")
-    query.append("Columns: host_name")
-    reply = livestatus_query(query)
+async def submit_deferred_async(name: str, pending: dict, results: dict) -> bool:
+    """asyncio counterpart of submit_deferred, the journal is written in the default executor"""
     if test_mode:
-        if debug_force_fail:
-            return False
-        return True
-    if reply == hostname:
+        return _test_results(pending, results)
+    if pending == {}:
         return True
-    return False
+    if not await submit_commands_async([command for command, _confirm, _expect in pending.values()]):
+        return _failed(pending, results)
+    await asyncio.get_running_loop().run_in_executor(None, _journal_append, _journal_line(name, pending))
+    for key in pending:
+        results[key] = "command_submitted"
+    return True
 
 
-def downtime_hosts(hostnames: list, begintime: int, endtime: int, comment: str,
-                    username: str = config.current_user) -> [bool, dict]:
-    """Add downtime for host(s), returns bool indicating if all were
-    successful and dict of 'hostname' and their entry IDs or status message"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        if host_exists(hostname):
-            hostname = str(hostname)
-            command = "SCHEDULE_HOST_DOWNTIME;" + hostname + ";" 
-            command += str(begintime) + ";" + str(endtime) + ";1;0;0;" + username + ";" + comment
-            confirm = []
-            confirm.append("GET downtimes")
-            confirm.append("Filter: author = " + username)
-            confirm.append("Filter: host_name = " + hostname)
-            confirm.append("Filter: end_time = " + str(endtime))
-            confirm.append("Filter: start_time = " + str(begintime))
-            confirm.append("Columns: id")
-            expect = "\d{1,}"
-            result = nagios_command(command, confirm, expect)
-            if not result[0]:
-                all_good = False
-            results[hostname] = result[1]
-        else:
-            all_good = False
-            results[hostname] = "host_for_downtime_host_not_found"
-    
+async def _poll_confirmed_async(pending: dict) -> dict:
+    confirmed = {}
+    await _confirm_poll_async(pending, confirmed)
+    return confirmed
+
+
+async def verify_journal_async(path: str = None) -> [bool, dict]:
+    """asyncio counterpart of verify_journal, the queries run concurrently"""
+    path = path or config.journal_path
+    if not os.path.exists(path):
+        return True, {}
+    loop = asyncio.get_running_loop()
+    with open(path, "r+") as journal:
+        await loop.run_in_executor(None, fcntl.flock, journal, fcntl.LOCK_EX)
+        records = _read_journal(journal)
+        pending = _journal_pending(records)
+        if test_mode:
+            return True, {records[index]["operation"] + ";" + key: "expected_result" for index, key in pending}
+        confirmed = {}
+        for site_confirmed in await _on_sites_async(_poll_confirmed_async, _journal_by_site(records, pending)):
+            confirmed.update(site_confirmed)
+        for key in confirmed:
+            del pending[key]
+        all_good, results, remaining = _journal_results(records, confirmed, pending)
+        _rewrite_journal(journal, remaining)
     return all_good, results
 
 
-def downtime_hostsservices(hostnames: list, services: list, begintime: int, endtime: int,
-                            comment: str, username: str = config.current_user) -> [bool, dict]:
-    """Add downtime for service(s) on host(s), returns bool indicating if all were
-    successful and dict of 'hostname_service' and their entry IDs or status message"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            for service in services:
-                service = str(service)
-                if hostservice_exists(hostname, service):
-                    command = "SCHEDULE_SVC_DOWNTIME;" + hostname + ";" + service + ";"
-                    command += str(begintime) + ";" + str(endtime) + ";1;0;0;" + username + ";" + comment
-                    confirm = []
-                    confirm.append("GET downtimes")
-                    confirm.append("Filter: author = " + username)
-                    confirm.append("Filter: host_name = " + hostname)
-                    confirm.append("Filter: service_description = " + service)
-                    confirm.append("Filter: end_time = " + str(endtime))
-                    confirm.append("Filter: start_time = " + str(begintime))
-                    confirm.append("Columns: id")
-                    expect = "\d{1,}"
-                    result = nagios_command(command, confirm, expect)
-                    if not result[0]:
-                        all_good = False
-                    results[hostname + ";" + service] = result[1]
-                else:
-                    all_good = False
-                    results[hostname + ";" + service] = "host_service_for_downtime_service_not_found"
-        else:
-            all_good = False
-            results[hostname + ";failed_host_check_before_services"] = "host_for_services_not_found"
+async def select_pairs_async(operation: dict, pairs: list) -> dict:
+    """asyncio counterpart of select_pairs"""
+    pairs = _pairs(pairs)
+    if test_mode:
+        return _select_pairs_test(pairs)
+    found = {"hosts": {}, "services": {}}
+    await _run_polls_async(_pair_selection_polls(operation, pairs, found))
+    rest = [pair for pair in pairs if pair not in found["services"]]
+    if rest:
+        _merge_existing(found, await preflight_pairs_async(rest, live=False), rest)
+    return found
 
 
+async def _execute_plan_async(all_good: bool, results: dict, pending: dict, name: str) -> [bool, dict]:
+    if defer:
+        succeeded = await submit_deferred_async(name, pending, results)
+    else:
+        succeeded = await execute_commands_async(pending, results)
+    if not succeeded:
+        all_good = False
     return all_good, results
 
 
-def ack_hostsproblem(hostnames: list, comment: str, sticky: bool = False, notify: bool = False,
-                    username: str = config.current_user) -> [bool, dict]:
-    """Acknowledge a host problem, optionally set 'sticky' and whether to notify"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            if host_problem_exists(hostname):
-                command = "ACKNOWLEDGE_HOST_PROBLEM;" + hostname + ";" + str(int(sticky)) + ";" + str(int(notify))
-                command += ";1;" + username + ";" + comment
-                confirm = []
-                confirm.append("GET hosts")
-                confirm.append("Filter: name = " + hostname)
-                confirm.append("Filter: state >= 1")
-                confirm.append("Filter: acknowledged = 1")
-                confirm.append("Columns: name")
-                expect = hostname
-                result = nagios_command(command, confirm, expect)
-                if not result[0]:
-                    all_good = False
-                results[hostname] = result[1]
-            else:
-                all_good = False
-                results[hostname] = "host_problem_not_found"
-        else:
-            all_good = False
-            results[hostname] = "host_for_host_problem_not_found"
+async def _site_call_async(site: str, function, items):
+    # a task gets a copy of the context it was created in, so this stays in the task
+    _site.set(site)
+    return await function(items)
 
-    return all_good, results
 
+async def _on_sites_async(function, by_site: dict) -> list:
+    """asyncio counterpart of _on_sites, each site runs in a task of its own"""
+    return await asyncio.gather(*[_site_call_async(site, function, items) for site, items in by_site.items()])
 
-def ack_hostsservicesproblem(hostnames: list, services: list, comment: str, sticky: bool = False, 
-                            notify: bool = False, username: str = config.current_user) -> [bool, dict]:
-    """Acknowledge a service problem on a host, optionally set 'sticky' and whether to notify"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            for service in services:
-                service = str(service)
-                if hostservice_exists(hostname, service):
-                    if hostservice_problem_exists(hostname, service):
-                        service = str(service)
-                        command = "ACKNOWLEDGE_SVC_PROBLEM;" + hostname + ";" + service + ";" + str(int(sticky)) + ";"
-                        command += str(int(notify)) + ";1;" + username + ";" + comment
-                        confirm = []
-                        confirm.append("GET services")
-                        confirm.append("Filter: host_name = " + hostname)
-                        confirm.append("Filter: description = " + service)
-                        confirm.append("Filter: state >= 1")
-                        confirm.append("Filter: acknowledged = 1")
-                        confirm.append("Columns: name")
-                        expect = hostname
-                        result = nagios_command(command, confirm, expect)
-                        if not result[0]:
-                            all_good = False
-                        results[hostname + ";" + service] = result[1]
-                    else:
-                        all_good = False
-                        results[hostname + ";" + service] = "host_service_problem_not_found"
-                else:
-                    all_good = False
-                    results[hostname + ";" + service] = "service_for_host_service_problem_not_found"
-        else:
-            all_good = False
-            results[hostname + ";failed_host_check_before_services"] = "host_for_host_service_problem_not_found"
 
-    return all_good, results
+async def _route_hosts_async(hostnames: list) -> dict:
+    return await asyncio.get_running_loop().run_in_executor(None, route_hosts, hostnames)
 
 
-def dis_hostscheck(hostnames: list) -> [bool, dict]:
-    """Disable checks for a host"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            command = "DISABLE_HOST_CHECK;" + hostname
-            confirm = []
-            confirm.append("GET hosts")
-            confirm.append("Filter: name = " + hostname)
-            confirm.append("Filter: checks_enabled = 0")
-            confirm.append("Columns: checks_enabled")
-            expect = "0"
-            result = nagios_command(command, confirm, expect)
-            if not result[0]:
-                all_good = False
-            results[hostname] = result[1]
-        else:
-            all_good = False
-            results[hostname] = "host_for_disable_hostcheck_not_found"
+async def preview_async(name: str, hostnames: list, services: list = []) -> dict:
+    """asyncio counterpart of preview"""
+    if _fans_out():
+        return _sum_counts(await _on_sites_async(lambda site_hosts: preview_async(name, site_hosts, services),
+                                                 await _route_hosts_async(hostnames)))
+    counts, polls = _preview_counts(operations[name], hostnames, services)
+    await _run_polls_async(polls)
+    return counts
 
-    return all_good, results
 
+async def run_operation_async(name: str, hostnames: list, services: list = [], **arguments) -> [bool, dict]:
+    """asyncio counterpart of run_operation"""
+    if _fans_out():
+        return _merge_results(await _on_sites_async(
+            lambda site_hosts: run_operation_async(name, site_hosts, services, **arguments),
+            await _route_hosts_async(hostnames)))
+    operation = operations[name]
+    if operation["select"]:
+        state = await select_targets_async(operation, hostnames, services)
+    else:
+        state = await preflight_async(hostnames, services, live=False)
+    return await _execute_plan_async(*_plan(operation, state, hostnames, services, arguments), name)
 
-def dis_hostsservicescheck(hostnames: list, services: list) -> [bool, dict]:
-    """Disable checks for a service on a host"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            for service in services:
-                service = str(service)
-                if hostservice_exists(hostname, service):
-                    command = "DISABLE_SVC_CHECK;" + hostname + ";" + service
-                    confirm = []
-                    confirm.append("GET services")
-                    confirm.append("Filter: host_name = " + hostname)
-                    confirm.append("Filter: description = " + service)
-                    confirm.append("Filter: checks_enabled = 0")
-                    confirm.append("Columns: checks_enabled")
-                    expect = "0"
-                    result = nagios_command(command, confirm, expect)
-                    if not result[0]:
-                        all_good = False
-                    results[hostname + ";" + service] = result[1]
-                else:
-                    all_good = False
-                    results[hostname + ";" + service] = "service_for_disable_service_check_not_found"
-        else:
-            all_good = False
-            results[hostname + ";failed_host_check_before_services"] = "host_for_disable_service_check_not_found"
 
-    return all_good, results
+async def run_group_operation_async(name: str, hostgroups: list, services: list = [], **arguments) -> [bool, dict]:
+    """asyncio counterpart of run_group_operation"""
+    if _fans_out():
+        return _merge_results(await _on_sites_async(
+            lambda site_hostgroups: run_group_operation_async(name, site_hostgroups, services, **arguments),
+            route_hostgroups(hostgroups)))
+    operation = operations[name]
+    state = await select_group_targets_async(operation, hostgroups, services)
+    pairs = list(state["services"]) if operation["targets"] == "services" else None
+    return await _execute_plan_async(*_plan(operation, state, list(state["hosts"]), [], arguments, pairs), name)
 
 
-def dis_hostsnotifications(hostnames: list) -> [bool, dict]:
-    """Disable notifications for a host"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            command = "DISABLE_HOST_NOTIFICATIONS;" + hostname
-            confirm = []
-            confirm.append("GET hosts")
-            confirm.append("Filter: name = " + hostname)
-            confirm.append("Filter: notifications_enabled = 0")
-            confirm.append("Columns: notifications_enabled")
-            expect = "0"
-            result = nagios_command(command, confirm, expect)
-            if not result[0]:
-                all_good = False
-            results[hostname] = result[1]
-        else:
-            all_good = False
-            results[hostname] = "host_for_disable_host_notifications_not_found"
+async def run_pairs_operation_async(name: str, pairs: list, **arguments) -> [bool, dict]:
+    """asyncio counterpart of run_pairs_operation"""
+    pairs = _pairs(pairs)
+    if _fans_out():
+        routes = await asyncio.get_running_loop().run_in_executor(None, _route_pairs, pairs)
+        return _merge_results(await _on_sites_async(
+            lambda site_pairs: run_pairs_operation_async(name, site_pairs, **arguments), routes))
+    operation = operations[name]
+    if operation["select"]:
+        state = await select_pairs_async(operation, pairs)
+    else:
+        state = await preflight_pairs_async(pairs, live=False)
+    return await _execute_plan_async(*_plan(operation, state, [], [], arguments, pairs), name)
 
-    return all_good, results
 
+async def downtime_hosts_async(hostnames: list, begintime: int, endtime: int, comment: str,
+                          username: str = config.current_user) -> [bool, dict]:
+    """asyncio counterpart of downtime_hosts"""
+    return await run_operation_async("downtime_hosts", hostnames, begintime=begintime, endtime=endtime,
+                                     comment=comment, username=username)
 
-def dis_hostsservicesnotifications(hostnames: list, services: list) -> [bool, dict]:
-    """Disable notifications for a service on a host"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            for service in services:
-                service = str(service)
-                if hostservice_exists(hostname, service):
-                    command = "DISABLE_SVC_NOTIFICATIONS;" + hostname + ";" + service
-                    confirm = []
-                    confirm.append("GET services")
-                    confirm.append("Filter: host_name = " + hostname)
-                    confirm.append("Filter: description = " + service)
-                    confirm.append("Filter: notifications_enabled = 0")
-                    confirm.append("Columns: notifications_enabled")
-                    expect = "0"
-                    result = nagios_command(command, confirm, expect)
-                    if not result[0]:
-                        all_good = False
-                    results[hostname + ";" + service] = result[1]
-                else:
-                    all_good = False
-                    results[hostname + ";" + service] = "service_for_disable_service_notifications_not_found"
-        else:
-            all_good = False
-            results[hostname + ";failed_host_check_before_services"] = "host_for_disable_service_notifications_not_found"
 
-    return all_good, results
+async def downtime_hostsservices_async(hostnames: list, services: list, begintime: int, endtime: int,
+                                        comment: str, username: str = config.current_user) -> [bool, dict]:
+    """asyncio counterpart of downtime_hostsservices"""
+    return await run_operation_async("downtime_hostsservices", hostnames, services, begintime=begintime, endtime=endtime,
+                                     comment=comment, username=username)
 
 
-def en_hostscheck(hostnames: list) -> [bool, dict]:
-    """Enable checks for a host"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            command = "ENABLE_HOST_CHECK;" + hostname
-            confirm = []
-            confirm.append("GET hosts")
-            confirm.append("Filter: name = " + hostname)
-            confirm.append("Filter: checks_enabled = 1")
-            confirm.append("Columns: checks_enabled")
-            expect = "1"
-            result = nagios_command(command, confirm, expect)
-            if not result[0]:
-                all_good = False
-            results[hostname] = result[1]
-        else:
-            all_good = False
-            results[hostname] = "host_for_enable_host_check_not_found"
+async def ack_hostsproblem_async(hostnames: list, comment: str, sticky: bool = False, notify: bool = False,
+                          username: str = config.current_user) -> [bool, dict]:
+    """asyncio counterpart of ack_hostsproblem"""
+    return await run_operation_async("ack_hostsproblem", hostnames, comment=comment, sticky=sticky, notify=notify,
+                                     username=username)
 
-    return all_good, results
 
+async def ack_hostsservicesproblem_async(hostnames: list, services: list, comment: str, sticky: bool = False, 
+                                        notify: bool = False, username: str = config.current_user) -> [bool, dict]:
+    """asyncio counterpart of ack_hostsservicesproblem"""
+    return await run_operation_async("ack_hostsservicesproblem", hostnames, services, comment=comment, sticky=sticky,
+                                     notify=notify, username=username)
 
-def en_hostsservicescheck(hostnames: list, services: list) -> [bool, dict]:
-    """Enable checks for a service on a host"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            for service in services:
-                service = str(service)
-                if hostservice_exists(hostname, service):
-                    command = "ENABLE_SVC_CHECK;" + hostname + ";" + service
-                    confirm = []
-                    confirm.append("GET services")
-                    confirm.append("Filter: host_name = " + hostname)
-                    confirm.append("Filter: description = " + service)
-                    confirm.append("Filter: checks_enabled = 1")
-                    confirm.append("Columns: checks_enabled")
-                    expect = "1"
-                    result = nagios_command(command, confirm, expect)
-                    if not result[0]:
-                        all_good = False
-                    results[hostname + ";" + service] = result[1]
-                else:
-                    all_good = False
-                    results[hostname + ";" + service] = "service_for_enable_service_check_not_found"
-        else:
-            all_good = False
-            results[hostname + ";failed_host_check_before_services"] = "host_for_enable_service_check_not_found"
 
-    return all_good, results
+async def ack_hostgroupsproblem_async(hostgroups: list, comment: str, sticky: bool = False, notify: bool = False,
+                                      username: str = config.current_user) -> [bool, dict]:
+    """asyncio counterpart of ack_hostgroupsproblem"""
+    return await run_group_operation_async("ack_hostsproblem", hostgroups, comment=comment, sticky=sticky,
+                                           notify=notify, username=username)
 
 
-def en_hostsnotifications(hostnames: list) -> [bool, dict]:
-    """Enable notifications for a host"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            command = "ENABLE_HOST_NOTIFICATIONS;" + hostname
-            confirm = []
-            confirm.append("GET hosts")
-            confirm.append("Filter: name = " + hostname)
-            confirm.append("Filter: notifications_enabled = 1")
-            confirm.append("Columns: notifications_enabled")
-            expect = "1"
-            result = nagios_command(command, confirm, expect)
-            if not result[0]:
-                all_good = False
-            results[hostname] = result[1]
-        else:
-            all_good = False
-            results[hostname] = "host_for_enable_host_notifications_not_found"
+async def ack_hostgroupsservicesproblem_async(hostgroups: list, services: list, comment: str, sticky: bool = False,
+                                              notify: bool = False, username: str = config.current_user) -> [bool, dict]:
+    """asyncio counterpart of ack_hostgroupsservicesproblem"""
+    return await run_group_operation_async("ack_hostsservicesproblem", hostgroups, services, comment=comment,
+                                           sticky=sticky, notify=notify, username=username)
 
-    return all_good, results
 
+async def dis_hostscheck_async(hostnames: list) -> [bool, dict]:
+    """asyncio counterpart of dis_hostscheck"""
+    return await run_operation_async("dis_hostscheck", hostnames)
 
-def en_hostsservicesnotifications(hostnames: list, services: list) -> [bool, dict]:
-    """Enable notifications for a service on a host"""
-    results = {}
-    all_good = True
-    for hostname in hostnames:
-        hostname = str(hostname)
-        if host_exists(hostname):
-            for service in services:
-                service = str(service)
-                if hostservice_exists(hostname, service):
-                    command = "ENABLE_SVC_NOTIFICATIONS;" + hostname + ";" + service
-                    confirm = []
-                    confirm.append("GET services")
-                    confirm.append("Filter: host_name = " + hostname)
-                    confirm.append("Filter: description = " + service)
-                    confirm.append("Filter: notifications_enabled = 1")
-                    confirm.append("Columns: notifications_enabled")
-                    expect = "1"
-                    result = nagios_command(command, confirm, expect)
-                    if not result[0]:
-                        all_good = False
-                    results[hostname + ";" + service] = result[1]
-                else:
-                    all_good = False
-                    results[hostname + ";" + service] = "service_for_enable_service_notifications_not_found"
-        else:
-            all_good = False
-            results[hostname + ";failed_host_check_before_services"] = "host_for_enable_service_notifications_not_found"
 
-    return all_good, results
+async def dis_hostsservicescheck_async(hostnames: list, services: list) -> [bool, dict]:
+    """asyncio counterpart of dis_hostsservicescheck"""
+    return await run_operation_async("dis_hostsservicescheck", hostnames, services)
+
+
+async def dis_hostsnotifications_async(hostnames: list) -> [bool, dict]:
+    """asyncio counterpart of dis_hostsnotifications"""
+    return await run_operation_async("dis_hostsnotifications", hostnames)
+
+
+async def dis_hostsservicesnotifications_async(hostnames: list, services: list) -> [bool, dict]:
+    """asyncio counterpart of dis_hostsservicesnotifications"""
+    return await run_operation_async("dis_hostsservicesnotifications", hostnames, services)
+
+
+async def en_hostscheck_async(hostnames: list) -> [bool, dict]:
+    """asyncio counterpart of en_hostscheck"""
+    return await run_operation_async("en_hostscheck", hostnames)
+
+
+async def en_hostsservicescheck_async(hostnames: list, services: list) -> [bool, dict]:
+    """asyncio counterpart of en_hostsservicescheck"""
+    return await run_operation_async("en_hostsservicescheck", hostnames, services)
+
+
+async def en_hostsnotifications_async(hostnames: list) -> [bool, dict]:
+    """asyncio counterpart of en_hostsnotifications"""
+    return await run_operation_async("en_hostsnotifications", hostnames)
+
+
+async def en_hostsservicesnotifications_async(hostnames: list, services: list) -> [bool, dict]:
+    """asyncio counterpart of en_hostsservicesnotifications"""
+    return await run_operation_async("en_hostsservicesnotifications", hostnames, services)
+
+
+async def remove_downtimes_async(hostnames: list, services: list = [], author: str = None, comment: str = None,
+                                 retry_command: int = 3, retry_confirm: int = 3,
+                                 comment_regex: bool = False) -> [bool, dict]:
+    """asyncio counterpart of remove_downtimes"""
+    if _fans_out():
+        return _merge_results(await _on_sites_async(
+            lambda site_hosts: remove_downtimes_async(site_hosts, services, author, comment, retry_command,
+                                                      retry_confirm, comment_regex),
+            await _route_hosts_async(hostnames)))
+    hostnames = [str(hostname) for hostname in hostnames]
+    services = [str(service) for service in services]
+    keys = _removal_keys(hostnames, services)
+    if test_mode:
+        return True, {key: "expected_result" for key in keys}
+    found = {}
+    query, handle = _downtime_lookup(hostnames, services, author, comment, comment_regex, found)
+    try:
+        handle([row async for row in livestatus_rows_checked_async(query)])
+    except (OSError, ValueError, asyncio.IncompleteReadError) as error:
+        return _lookup_failed(keys, error)
+    all_good, results, pending = _removal_plan(keys, found, services != [])
+    command_count = 0
+    while pending and command_count <= retry_command:
+        if not await submit_commands_async(list(pending.values())):
+            break
+        confirm_count = 0
+        while pending and confirm_count <= retry_confirm:
+            await asyncio.sleep(_backoff(confirm_count))
+            query, handle = _remaining_downtimes(pending)
+            try:
+                handle([row async for row in livestatus_rows_checked_async(query)])
+            except (OSError, ValueError, asyncio.IncompleteReadError) as error:
+                if debug:
+                    print("DEBUG(remove_downtimes_async):", error)
+            confirm_count += 1
+        command_count += 1
+    return _removal_results(keys, found, pending, all_good, results)
@@ -0,0 +1,309 @@
+"""host selection expressions, evaluated with set operations against an index of hosts and their hostgroups"""
+
+import bisect, re
+
+# an expression combines selectors with, loosest first
+#
+#   a | b, a , b    union
+#   a - b           exclusion, the - must not follow a name directly as names can contain -
+#   a & b           intersection
+#   a:odd, a:even   hosts whose name ends in an odd or even number
+#   ( a )           grouping
+#
+# and the selectors are
+#
+#   @web            members of hostgroup web
+#   /^dc[12]db/     host names the regex matches
+#   dc1web[1-8,12]  a glob, * and ? as usual, a [range] matches a whole number of any zero
+#                   padding within its comma separated ranges
+#   dc1web01        a host name, selected whether or not it's known so it's reported as not found
+#
+# eg "@web - dc2*:odd", all of web except the odd numbered dc2 hosts
+
+_tokens = re.compile(r"""\s*(?:
+    (?P<open>\() | (?P<close>\)) | (?P<union>[|,]) | (?P<intersect>&) | (?P<exclude>-) |
+    (?P<parity>:(?:odd|even)\b) | (?P<regex>/(?:[^/\\]|\\.)*/) | (?P<group>@[\w.\-]+) |
+    (?P<name>(?:[\w.*?]|\[[\d,\-]*\])(?:[\w.*?\-]|\[[\d,\-]*\])*)
+)""", re.VERBOSE)
+
+_glob = re.compile(r"(\*|\?|\[[\d,\-]*\])")
+
+_trailing_number = re.compile(r"(\d+)$")
+
+
+class HostIndex:
+    """
+    Host names and hostgroup members, fetched once by loader on first use
+
+    loader returns a dict of host name and the hostgroups it's in, eg
+    djlivestatus.host_groups or djinventory.Inventory.host_groups
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._names = None
+        self._members = None
+
+    def _load(self):
+        groups_of = self._loader()
+        self._names = sorted(groups_of)
+        self._members = {}
+        for name, groups in groups_of.items():
+            for group in groups:
+                self._members.setdefault(group, set()).add(name)
+
+    @property
+    def names(self) -> list:
+        """Every host name, sorted"""
+        if self._names is None:
+            self._load()
+        return self._names
+
+    def with_prefix(self, prefix: str) -> list:
+        names = self.names
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + "\U0010ffff")
+        return names[start:end]
+
+    def members(self, group: str) -> set:
+        if self._members is None:
+            self._load()
+        return self._members.get(group, set())
+
+
+# each node selects from candidates, a set of names, or every host in the index when
+# candidates is None, so an intersection or exclusion only looks at what its left side
+# selected rather than expanding both sides
+class _Name:
+    def __init__(self, name: str):
+        self.name = name
+
+    def select(self, index: HostIndex, candidates: set) -> set:
+        if candidates is None or self.name in candidates:
+            return {self.name}
+        return set()
+
+
+class _Group:
+    def __init__(self, group: str):
+        self.group = group
+
+    def select(self, index: HostIndex, candidates: set) -> set:
+        members = index.members(self.group)
+        return set(members) if candidates is None else candidates & members
+
+
+class _Pattern:
+    """
+    A regex searched for in host names, or a glob as a regex matching the whole name
+    with the ranges of each [range] in the order they appear
+    """
+
+    def __init__(self, search, ranges: list = [], prefix: str = ""):
+        self.search = search
+        self.ranges = ranges
+        self.prefix = prefix
+
+    @classmethod
+    def glob(cls, text: str):
+        parts = [part for part in _glob.split(text) if part != ""]
+        regex = ""
+        ranges = []
+        for position, part in enumerate(parts):
+            if part == "*":
+                # lazily, so a [range] after it gets the whole number rather than its last digit
+                regex += ".*?"
+            elif part == "?":
+                regex += "."
+            elif part.startswith("["):
+                # the range covers a whole run of digits unless the glob puts a digit next to it
+                before = parts[position - 1] if position > 0 else ""
+                after = parts[position + 1] if position + 1 < len(parts) else ""
+                regex += "" if before[-1:].isdigit() else r"(?<!\d)"
+                regex += r"(\d+)"
+                regex += "" if after[:1].isdigit() else r"(?!\d)"
+                ranges.append(_ranges(part[1:-1]))
+            else:
+                regex += re.escape(part)
+        return cls(re.compile(regex + r"\Z").match, ranges, _glob.split(text)[0])
+
+    def matches(self, name: str) -> bool:
+        match = self.search(name)
+        if match is None:
+            return False
+        for number, ranges in zip(match.groups(), self.ranges):
+            if not any(low <= int(number) <= high for low, high in ranges):
+                return False
+        return True
+
+    def select(self, index: HostIndex, candidates: set) -> set:
+        names = index.with_prefix(self.prefix) if candidates is None else candidates
+        return set(name for name in names if self.matches(name))
+
+
+class _Parity:
+    def __init__(self, node, remainder: int):
+        self.node = node
+        self.remainder = remainder
+
+    def select(self, index: HostIndex, candidates: set) -> set:
+        selected = set()
+        for name in self.node.select(index, candidates):
+            number = _trailing_number.search(name)
+            if number is not None and int(number.group()) % 2 == self.remainder:
+                selected.add(name)
+        return selected
+
+
+class _Union:
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def select(self, index: HostIndex, candidates: set) -> set:
+        return self.left.select(index, candidates) | self.right.select(index, candidates)
+
+
+class _Intersection(_Union):
+    def select(self, index: HostIndex, candidates: set) -> set:
+        return self.right.select(index, self.left.select(index, candidates))
+
+
+class _Exclusion(_Union):
+    def select(self, index: HostIndex, candidates: set) -> set:
+        selected = self.left.select(index, candidates)
+        return selected - self.right.select(index, selected)
+
+
+def _ranges(text: str) -> list:
+    """Parses '1-8,12' into [(1, 8), (12, 12)]"""
+    ranges = []
+    for part in text.split(","):
+        low, dash, high = part.partition("-")
+        if not low.isdigit() or (dash and not high.isdigit()):
+            raise ValueError("invalid range [" + text + "]")
+        ranges.append((int(low), int(high or low)))
+    return ranges
+
+
+def _tokenize(expression: str) -> list:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _tokens.match(expression, position)
+        if match is None or match.end() == position:
+            raise ValueError("unexpected '" + expression[position:].strip() + "' in selection")
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over the tokens, one method per precedence level"""
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek(self) -> str:
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def _take(self) -> [str, str]:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        node = self._union()
+        if self._peek() is not None:
+            raise ValueError("unexpected '" + self.tokens[self.position][1] + "' in selection")
+        return node
+
+    def _union(self):
+        node = self._intersection()
+        while self._peek() in ("union", "exclude"):
+            kind, _text = self._take()
+            right = self._intersection()
+            node = _Union(node, right) if kind == "union" else _Exclusion(node, right)
+        return node
+
+    def _intersection(self):
+        node = self._parity()
+        while self._peek() == "intersect":
+            self._take()
+            node = _Intersection(node, self._parity())
+        return node
+
+    def _parity(self):
+        node = self._selector()
+        while self._peek() == "parity":
+            _kind, text = self._take()
+            node = _Parity(node, 1 if text == ":odd" else 0)
+        return node
+
+    def _selector(self):
+        if self._peek() is None:
+            raise ValueError("selection ends early")
+        kind, text = self._take()
+        if kind == "open":
+            node = self._union()
+            if self._peek() != "close":
+                raise ValueError("missing ) in selection")
+            self._take()
+            return node
+        if kind == "group":
+            return _Group(text[1:])
+        if kind == "regex":
+            try:
+                return _Pattern(re.compile(text[1:-1]).search)
+            except re.error as error:
+                raise ValueError("invalid regex " + text + ": " + str(error))
+        if kind == "name":
+            if _glob.search(text) is None:
+                return _Name(text)
+            return _Pattern.glob(text)
+        raise ValueError("unexpected '" + text + "' in selection")
+
+
+class Selection:
+    """
+    A parsed selection expression, see the top of this module
+
+    Parsing is done once; select() evaluates it against an index, which is only loaded
+    if some part of the expression needs more than host names given literally
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self._root = _Parser(_tokenize(expression)).parse()
+
+    def select(self, index: HostIndex) -> list:
+        """Returns the selected host names, sorted"""
+        return sorted(self._root.select(index, None))
+
+
+def select(expression: str, index: HostIndex) -> list:
+    """Parses and evaluates a selection expression, raises ValueError if it's invalid"""
+    return Selection(expression).select(index)
+
+
+if __name__ == "__main__":
+    # regression checks, run as python djselect.py
+    groups_of = {name: ["web"] for name in ["dc1web01", "dc1web02", "dc1web11", "dc1web12", "dc1web22",
+                                            "dc2web3", "dc2web10", "dc12db1"]}
+    index = HostIndex(lambda: groups_of)
+    checks = {
+        "dc*[10-12]": ["dc1web11", "dc1web12", "dc2web10"],
+        "dc1*[2]": ["dc1web02"],
+        "dc1web[1-2]": ["dc1web01", "dc1web02"],
+        "dc?web[3-10]": ["dc2web10", "dc2web3"],
+        "dc[1-2]*": ["dc1web01", "dc1web02", "dc1web11", "dc1web12", "dc1web22", "dc2web10", "dc2web3"],
+        "dc[12]db*": ["dc12db1"],
+        "dc1web1[1-2]": ["dc1web11", "dc1web12"],
+        "@web - dc1*:odd": ["dc1web02", "dc1web12", "dc1web22", "dc2web10", "dc2web3"],
+    }
+    for expression, expected in checks.items():
+        selected = select(expression, index)
+        assert selected == sorted(expected), expression + " selected " + str(selected)
+    print(len(checks), "selections checked")
@@ -1,15 +1,17 @@
 #!/usr/bin/python
 
-import djargs as args, djlivestatus as ls, subprocess
+import djargs, djlivestatus as ls, djinventory, djselect, djdate, sys
 ls.test_mode = True
 
+args = djargs.Parser().parse(sys.argv)
+
 if not args.valid:
     print("\nInvalid parameters specified:")
     for error in sorted(args.errors):
         print("\t",error)
     exit(1)
 
-if not args.rules_passed and args.djargs_config.enable_rules == True:
+if not args.rules_passed:
     print("\nParameter rules not met:")
     for errors in args.rule_errors:
         for error in errors:
@@ -23,17 +25,34 @@ if args.rules_partial:
             print("\t" + error)
 
 
+# answer existence and hostgroup membership from the local inventory cache
+inventory = None
+if djinventory.config.inventory_path and not ls.test_mode:
+    try:
+        inventory = djinventory.Inventory()
+        ls.inventory = inventory
+    except Exception:
+        inventory = None
+
+
 def dedupe_list(input_list: list) -> list:
-    output_list = []
-    for item in sorted(input_list):
-        if item not in output_list:
-            output_list.append(item)
-    return output_list
+    return sorted(set(input_list))
+
+
+# the djlivestatus operations run by each mode, for hosts and for services
+mode_operations = {
+    "down": ["downtime_hosts", "downtime_hostsservices"],
+    "ack": ["ack_hostsproblem", "ack_hostsservicesproblem"],
+    "dn": ["dis_hostsnotifications", "dis_hostsservicesnotifications"],
+    "en": ["en_hostsnotifications", "en_hostsservicesnotifications"],
+    "dc": ["dis_hostscheck", "dis_hostsservicescheck"],
+    "ec": ["en_hostscheck", "en_hostsservicescheck"],
+}
 
 
 def find_mode() -> str:
     """Figure out which mode has been specified"""
-    modes = ["down", "ack", "dn", "en", "dc", "ec"]
+    modes = ["down", "undown", "ack", "dn", "en", "dc", "ec", "verify"]
     for arg in args.validargs:
         if str(arg) in modes:
             return arg
@@ -42,27 +61,45 @@ def find_mode() -> str:
 
 def parameter_exists(param: str) -> bool:
     """Check if a parameter (key) exists in args.validargs[], returns bool"""
-    try:
-        _test = args.validargs[param]
-        return True
-    except:
-        return False
+    return param in args.validargs
+
+
+def parameter_values(param: str) -> list:
+    """The values of a parameter as a list, to pass on to djlivestatus"""
+    return list(args.validargs[param])
+
+
+def host_index() -> djselect.HostIndex:
+    """Hosts and their hostgroups for --select, from the inventory cache if there is one"""
+    # the inventory caches a single site
+    if inventory is not None and not ls.config.sites and inventory.refresh():
+        return djselect.HostIndex(inventory.host_groups)
+    return djselect.HostIndex(ls.host_groups)
 
 
 def combine_hosts():
-    """Combines all hosts specified by -h and hosts in all hostgroups specified by -H"""
+    """Combines all hosts specified by -h, hosts in all hostgroups specified by -H and hosts selected by --select"""
     all_hosts = []
+    if parameter_exists('--select'):
+        try:
+            all_hosts = all_hosts + djselect.select(args.validargs['--select'][0], host_index())
+        except ValueError as error:
+            print("\nInvalid selection:", error)
+            exit(1)
     if parameter_exists('-H'):
-        all_hosts = all_hosts + ls.hosts_inhostgroups(args.validargs['-H'])
+        # the inventory caches a single site
+        if inventory is not None and not ls.config.sites and inventory.refresh():
+            all_hosts = all_hosts + inventory.hostgroup_members(parameter_values('-H'))
+        else:
+            all_hosts = all_hosts + ls.hosts_inhostgroups(parameter_values('-H'))
     if parameter_exists('-h'):
-        all_hosts = all_hosts + args.validargs['-h']
+        all_hosts = all_hosts + ng_hostnames
     all_hosts = dedupe_list(all_hosts)
     return all_hosts
 
 
 def str_to_timestamp(datestring: str) -> int:
-    timestamp = subprocess.check_output(['date', '-d ' + datestring, '+%s'], stderr=subprocess.STDOUT)[0:-1]
-    return timestamp
+    return djdate.timestamp(datestring)
 
 
 def start_time() -> int:
@@ -90,6 +127,17 @@ def end_time(start: int) -> int:
 
 mode = find_mode()
 
+if parameter_exists('-w'):
+    ls.concurrency = int(args.validargs['-w'][0])
+
+if parameter_exists('--stats'):
+    ls.instrument = True
+
+if parameter_exists('--defer'):
+    ls.defer = True
+
+
+ng_hostnames = parameter_values('-h') if parameter_exists('-h') else []
 
 if parameter_exists('-h') and not parameter_exists('-H'):
     if len(args.validargs['-h']) == 1:
@@ -116,70 +164,124 @@ if parameter_exists('-h') and not parameter_exists('-H'):
                         range_hosts.append(host_for_range + str(number).zfill(2))
 
                 print(range_hosts)
-                args.validargs['-h'] = range_hosts
+                ng_hostnames = range_hosts
 
-if parameter_exists('-h') or parameter_exists('-H'):
+if (parameter_exists('-h') or parameter_exists('-H') or parameter_exists('--select')) and not parameter_exists('--failing'):
     ng_hosts = combine_hosts()
 
 
+if parameter_exists('-G'):
+    # servicegroup members are exact host;service pairs, the service operations run on
+    # just those rather than on every -s service of every host
+    ng_pairs = ls.services_inservicegroups(parameter_values('-G'))
+
+
+if parameter_exists('--dry-run'):
+    ng_services = parameter_values('-s') if parameter_exists('-s') else []
+    counts = ls.preview(mode_operations[mode][ng_services != []], ng_hosts, ng_services)
+    print("Targets requested:", counts["targets"])
+    print("Matching objects:", counts["matching"])
+    print("Already in state:", counts["in_state"])
+    print("In a problem state:", counts["problems"])
+    exit(0)
+
+
+if mode == "verify":
+    result = ls.verify_journal()
+
+
 if mode == "down":
     ng_start = start_time()
     ng_end = end_time(ng_start)
     ng_comment = args.validargs['-c'][0]
     
-    if parameter_exists('-s'):
-        ng_services = args.validargs['-s']
+    if parameter_exists('-G'):
+        result = ls.run_pairs_operation("downtime_hostsservices", ng_pairs, begintime=ng_start, endtime=ng_end,
+                                        comment=ng_comment, username=ls.config.current_user)
+    elif parameter_exists('-s'):
+        ng_services = parameter_values('-s')
         result = ls.downtime_hostsservices(ng_hosts, ng_services, ng_start, ng_end, ng_comment)
     else:
         result = ls.downtime_hosts(ng_hosts, ng_start, ng_end, ng_comment)
 
 
+if mode == "undown":
+    ng_author = args.validargs['-a'][0] if parameter_exists('-a') else None
+    ng_comment = args.validargs['-c'][0] if parameter_exists('-c') else None
+    ng_services = parameter_values('-s') if parameter_exists('-s') else []
+    result = ls.remove_downtimes(ng_hosts, ng_services, ng_author, ng_comment,
+                                 comment_regex=parameter_exists('--comment-regex'))
+
+
 if mode == "ack":
     sticky = True if parameter_exists('-k') else False
     notify = True if parameter_exists('-n') else False
     ng_comment = args.validargs['-c'][0]
-    if parameter_exists('-s'):
-        ng_services = args.validargs['-s']
+    if parameter_exists('--failing'):
+        # problems are selected server side, hostgroups aren't expanded to hosts
+        ng_hostgroups = parameter_values('-H')
+        if parameter_exists('-s'):
+            ng_services = parameter_values('-s')
+            result = ls.ack_hostgroupsservicesproblem(ng_hostgroups, ng_services, ng_comment, sticky, notify)
+        else:
+            result = ls.ack_hostgroupsproblem(ng_hostgroups, ng_comment, sticky, notify)
+    elif parameter_exists('-G'):
+        result = ls.run_pairs_operation("ack_hostsservicesproblem", ng_pairs, comment=ng_comment, sticky=sticky,
+                                        notify=notify, username=ls.config.current_user)
+    elif parameter_exists('-s'):
+        ng_services = parameter_values('-s')
         result = ls.ack_hostsservicesproblem(ng_hosts, ng_services, ng_comment, sticky, notify)
     else:
         result = ls.ack_hostsproblem(ng_hosts, ng_comment, sticky, notify)
 
 
 if mode == "dn":
-    if parameter_exists('-s'):
-        ng_services = args.validargs['-s']
+    if parameter_exists('-G'):
+        result = ls.run_pairs_operation(mode_operations[mode][1], ng_pairs)
+    elif parameter_exists('-s'):
+        ng_services = parameter_values('-s')
         result = ls.dis_hostsservicesnotifications(ng_hosts, ng_services)
     else:
         result = ls.dis_hostsnotifications(ng_hosts)
 
 
 if mode == "en":
-    if parameter_exists('-s'):
-        ng_services = args.validargs['-s']
+    if parameter_exists('-G'):
+        result = ls.run_pairs_operation(mode_operations[mode][1], ng_pairs)
+    elif parameter_exists('-s'):
+        ng_services = parameter_values('-s')
         result = ls.en_hostsservicesnotifications(ng_hosts, ng_services)
     else:
         result = ls.en_hostsnotifications(ng_hosts)
 
 
 if mode == "dc":
-    if parameter_exists('-s'):
-        ng_services = args.validargs['-s']
+    if parameter_exists('-G'):
+        result = ls.run_pairs_operation(mode_operations[mode][1], ng_pairs)
+    elif parameter_exists('-s'):
+        ng_services = parameter_values('-s')
         result = ls.dis_hostsservicescheck(ng_hosts, ng_services)
     else:
         result = ls.dis_hostscheck(ng_hosts)
 
 
 if mode == "ec":
-    if parameter_exists('-s'):
-        ng_services = args.validargs['-s']
+    if parameter_exists('-G'):
+        result = ls.run_pairs_operation(mode_operations[mode][1], ng_pairs)
+    elif parameter_exists('-s'):
+        ng_services = parameter_values('-s')
         result = ls.en_hostsservicescheck(ng_hosts, ng_services)
     else:
         result = ls.en_hostscheck(ng_hosts)
 
 
+if parameter_exists('--stats'):
+    print(ls.stats.report())
 
 if result[0]:
-    if not parameter_exists('-q'):
+    if parameter_exists('--defer') and not parameter_exists('-q'):
+        print("All commands submitted, run verify to check they have taken effect")
+    elif not parameter_exists('-q'):
         print("All commands completed successfully")
     for hostname in sorted(result[1]):
         if parameter_exists('-q'):